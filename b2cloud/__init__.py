@@ -1,28 +1,44 @@
-import json
+import datetime
+import os
 import re
 import time
-import zlib
 
+import lxml.etree
 import lxml.html
 import requests
 
-# データキャッシュ用
-CACHE = {}
+from b2cloud.decoder import decode_response, iter_entries
+from b2cloud.encoder import b2_encode, create_field_list, iter_b2_encode, iter_deflate
+from b2cloud.polling import PollingPolicy, wait_issue
+from b2cloud.template import TemplateCache
 
+# 配送状況更新用templateのキャッシュ。b2cloud.template.FileTemplateCacheに置き換えるとディスクに保存される
+TEMPLATE_CACHE = TemplateCache()
 
-def login(customer_code:str, customer_password:str, customer_cls_cocde='', login_user_id='')->requests.Session:
+
+def login(customer_code:str, customer_password:str, customer_cls_cocde='', login_user_id='', session:requests.Session=None, store=None)->requests.Session:
     '''
     ヤマトビジネスメンバーにログインして、B2クラウドに遷移したsessionを返す
 
     Args:
-        _id:ログインID
-        _pw:ログインパスワード
+        customer_code:お客様コード
+        customer_password:パスワード
+        customer_cls_cocde:お客様コード枝番
+        login_user_id:ログインユーザーID
+        session:ログインに使うセッション。Noneの場合は新しく作る(再ログイン時に指定する)
+        store(b2cloud.store.SessionStore):cookieの保存先。保存したcookieが有効ならログインを省略する
 
     Returns:
         requests.Session
     '''
 
-    session = requests.Session()
+    if session is None:
+        session = requests.Session()
+    account = f'{customer_code}:{customer_cls_cocde}:{login_user_id}'
+    # アカウント毎にtemplateのキャッシュを分けるため、セッションに記録する
+    session.b2_account = account
+    if store is not None and store.restore(session, account):
+        return session
     data = {
         'quickLoginCheckH': '',
         'BTN_NM': 'LOGIN',
@@ -44,40 +60,44 @@ def login(customer_code:str, customer_password:str, customer_cls_cocde='', login
             if response.status_code == 200 and len(uels) > 0:
                 # B2Cloudに遷移
                 session.get('https://newb2web.kuronekoyamato.co.jp/b2/d/_html/index.html?oauth&call_service_code=A')
+                if store is not None:
+                    store.save(session, account)
                 return session
-        except:
+        except (requests.RequestException, lxml.etree.ParserError):
             pass
     raise Exception('ログインに失敗しました。')
 
 
-def get_history(session:requests.Session, params:dict):
+def get_history(session:requests.Session, params:dict, lazy:bool=False):
     """
     発行済み伝票履歴を取得する（汎用）
 
     Args:
         session(requests.Session): ログイン済みのセッション
         params(dict):クエリパラメータ、件数を取得する場合は{'count':''}をパラメータに含める
+        lazy(bool):Trueの場合は、entryを参照したときにデコードするb2cloud.decoder.LazyFeedを返す
 
     Returns:
         dict:{'feed':{'entry':['shipment':{}]}}
     """
     url = 'https://newb2web.kuronekoyamato.co.jp/b2/p/history'
     response = session.get(url, params=params)
-    return json.loads(response.text)
+    return decode_response(response, lazy=lazy)
 
 
-def get_history_all(session:requests.Session):
+def get_history_all(session:requests.Session, lazy:bool=False):
     '''
     全ての発行済み伝票履歴を取得する。削除済みは除外される。過去90日間
 
     Args:
         session(requests.Session): ログイン済みのセッション
+        lazy(bool):Trueの場合は、entryを参照したときにデコードするb2cloud.decoder.LazyFeedを返す
 
     Returns:
         dict:{'feed':{'entry':['shipment':{}]}}
     '''
     params = {'all':''}
-    return get_history(session, params=params )
+    return get_history(session, params=params, lazy=lazy)
 
 
 def get_history_deleted(session:requests.Session):
@@ -94,19 +114,54 @@ def get_history_deleted(session:requests.Session):
     return get_history(session, params=params)
 
 
-def put_tracking(session:requests.Session, feed:dict):
+def stream_history(session:requests.Session, params:dict, chunk_size:int=65536):
+    """
+    発行済み伝票履歴を受信しながら、entryを1件ずつ返す（汎用）
+    feed全体の受信を待たずに処理を始められ、保持するのは受信中の1件分だけになる
+
+    Args:
+        session(requests.Session): ログイン済みのセッション
+        params(dict):クエリパラメータ
+        chunk_size(int):1回に読み込むバイト数
+
+    Yields:
+        dict:entry {'shipment':{}}
+    """
+    url = 'https://newb2web.kuronekoyamato.co.jp/b2/p/history'
+    with session.get(url, params=params, stream=True) as response:
+        yield from iter_entries(response, chunk_size)
+
+
+def stream_history_all(session:requests.Session, chunk_size:int=65536):
+    '''
+    全ての発行済み伝票履歴を受信しながら、entryを1件ずつ返す。削除済みは除外される。過去90日間
+
+    Args:
+        session(requests.Session): ログイン済みのセッション
+        chunk_size(int):1回に読み込むバイト数
+
+    Yields:
+        dict:entry {'shipment':{}}
+    '''
+    params = {'all':''}
+    return stream_history(session, params=params, chunk_size=chunk_size)
+
+
+def put_tracking(session:requests.Session, feed:dict, stream=False, template_key:str=None):
     """
     配送情報を更新する
 
     Args:
         session(requests.Session): ログイン済みのセッション
-        feed(dict):配送状況を更新取得するshipmentを含むfeed
+        feed(dict):配送状況を更新取得するshipmentを含むfeed、またはShipmentBatch
+        stream(bool):Trueの場合は、圧縮しながらchunked転送で送信する。大量のshipmentを送る場合に使う
+        template_key(str):templateのキャッシュのkey。Noneの場合はloginしたアカウント
 
     Returns:
         dict:{'feed':{'entry':['shipment':{}]}}
 
     """
-    data = __compress_feed(session, feed)
+    data = __compress_feed(session, feed, stream=stream, key=template_key)
     # requestヘッダー
     headers = {
         'Content-Encoding': 'deflate',
@@ -119,7 +174,7 @@ def put_tracking(session:requests.Session, feed:dict):
         headers=headers,
         data=data,
     )
-    res = json.loads(response.text)
+    res = decode_response(response)
     return res
 
 
@@ -130,22 +185,29 @@ def post_new_checkonly(session:requests.Session, shipments:list):
 
     Args:
         session(requests.Session): ログイン済みのセッション
-        shipments(list):伝票情報リスト
+        shipments(list | b2cloud.shipment.ShipmentBatch):伝票情報リスト
 
     Returns:
         チェック結果:
             post_newの引数に使用できるよう追加変更修正がされている
             エラーがある場合は'feed'に'title':'Error'が格納され、該当entryにerror[詳細]が格納される
     """
-    # POST用の入れ物
-    json_data = {'feed': {'entry': shipments}}
-
     # postに必須
     headers = {'Origin': 'https://newb2web.kuronekoyamato.co.jp'}
 
+    url = 'https://newb2web.kuronekoyamato.co.jp/b2/p/new?checkonly'
+    if hasattr(shipments, 'to_json'):
+        # ShipmentBatchは伝票毎のdictを作らずにjsonにする
+        headers['Content-Type'] = 'application/json'
+        res = session.post(url, headers=headers, data=shipments.to_json())
+        return decode_response(res)
+
+    # POST用の入れ物
+    json_data = {'feed': {'entry': shipments}}
+
     # 内容の事前チェック
-    res = session.post('https://newb2web.kuronekoyamato.co.jp/b2/p/new?checkonly', headers=headers, json=json_data)
-    return json.loads(res.text)
+    res = session.post(url, headers=headers, json=json_data)
+    return decode_response(res)
 
 
 def check_shipment(session:requests.Session, shipment):
@@ -206,16 +268,17 @@ def post_new(session:requests.Session, checked_feed:dict):
     headers = {'Origin': 'https://newb2web.kuronekoyamato.co.jp'}
     # 登録
     res = session.post('https://newb2web.kuronekoyamato.co.jp/b2/p/new', headers=headers, json=checked_feed)
-    return json.loads(res.text)
+    return decode_response(res)
 
 
-def get_new(session:requests.Session, params=None):
+def get_new(session:requests.Session, params=None, lazy:bool=False):
     """
     登録されている発行前伝票情報を取得する
 
     Args:
         session(requests.Session): ログイン済みのセッション
         params(dict): 検索パラメータ。get_historyと同じパラメータが使える。countを指定すると件数
+        lazy(bool):Trueの場合は、entryを参照したときにデコードするb2cloud.decoder.LazyFeedを返す
 
     Return:
         dict'{'feed':{'entry':[shipment]}}
@@ -225,22 +288,43 @@ def get_new(session:requests.Session, params=None):
     url = 'https://newb2web.kuronekoyamato.co.jp/b2/p/new'
 
     res = session.get(url, headers=headers, params=params)
-    return json.loads(res.text)
+    return decode_response(res, lazy=lazy)
+
+
+def stream_new(session:requests.Session, params=None, chunk_size:int=65536):
+    """
+    登録されている発行前伝票情報を受信しながら、entryを1件ずつ返す
+
+    Args:
+        session(requests.Session): ログイン済みのセッション
+        params(dict): 検索パラメータ。get_historyと同じパラメータが使える
+        chunk_size(int):1回に読み込むバイト数
+
+    Yields:
+        dict:entry('id'が付加されている)
+    """
+    headers =  {'Origin': 'https://newb2web.kuronekoyamato.co.jp'}
+    url = 'https://newb2web.kuronekoyamato.co.jp/b2/p/new'
+
+    with session.get(url, headers=headers, params=params, stream=True) as response:
+        yield from iter_entries(response, chunk_size)
 
 
-def delete_new(session:requests.Session, feed:dict):
+def delete_new(session:requests.Session, feed:dict, stream=False, template_key:str=None):
     """
     保存済みデータを削除する
 
     Args:
         session:ログイン済みのセッション
-        feed:shipmentを含むfeed
+        feed:shipmentを含むfeed、またはShipmentBatch
+        stream:Trueの場合は、圧縮しながらchunked転送で送信する。大量のshipmentを送る場合に使う
+        template_key:templateのキャッシュのkey。Noneの場合はloginしたアカウント
 
     Returns:
         feed(dict)
     """
     # tracking更新処理5 圧縮データを前2バイト、後ろ4バイトをトリムする
-    data = __compress_feed(session, feed)
+    data = __compress_feed(session, feed, stream=stream, key=template_key)
     # requestヘッダー
     headers = {
         'Content-Encoding': 'deflate',
@@ -253,11 +337,11 @@ def delete_new(session:requests.Session, feed:dict):
         headers=headers,
         data=data,
     )
-    res = json.loads(response.text)
+    res = decode_response(response)
     return res
 
 
-def print_issue(session:requests.Session, print_type:str, entry_feed:dict):
+def print_issue(session:requests.Session, print_type:str, entry_feed:dict, polling_policy:PollingPolicy=None, dest=None):
     """
     伝票情報のPDFを取得する。新規、再印刷共通
     新規の伝票はこの処理によってtracking_numberが振られて印刷済みになる（IDは更新される）
@@ -265,9 +349,31 @@ def print_issue(session:requests.Session, print_type:str, entry_feed:dict):
     Args:
         session(requests.Session): ログイン済みのセッション
         print_type: 'm':A4マルチ, 'm5':A5マルチ, '3':dm , '7':ネコポス
+        polling_policy: PDFデータ生成完了までのポーリング間隔
+        dest: PDFデータの書き込み先のパスまたはファイルオブジェクト。指定した場合は、メモリに溜めずに書き込む
 
     Returns:
         bytearry: 伝票のPDFデータ
+        destを指定した場合は、dict: ダウンロードの統計(iter_download_issueのstats)
+    """
+    issue_no = issue_print(session, print_type, entry_feed)
+    # PDFデータの生成が完了するまでポーリングする
+    wait_issue(session, issue_no, polling_policy)
+    return download_issue(session, issue_no, dest=dest)
+
+
+def issue_print(session:requests.Session, print_type:str, entry_feed:dict)->str:
+    """
+    伝票情報のPDFデータの生成を開始する。新規、再印刷共通
+    生成の完了はb2cloud.polling.wait_issueで待ち、download_issueでダウンロードする
+
+    Args:
+        session(requests.Session): ログイン済みのセッション
+        print_type: 'm':A4マルチ, 'm5':A5マルチ, '3':dm , '7':ネコポス
+        entry_feed: 印刷するshipmentを含むfeed
+
+    Returns:
+        str: 発行番号(issue_no)
     """
     # tracking_numberの有無で新規か、再印刷か判断する。
     if 'tracking_number' in entry_feed['feed']['entry'][0]['shipment']:
@@ -317,23 +423,108 @@ def print_issue(session:requests.Session, print_type:str, entry_feed:dict):
         # 再印刷
         response = session.put(f'https://newb2web.kuronekoyamato.co.jp/b2/p/history?reissue&print_type={print_type}&sort1=service_type&sort2=created&sort3=created',headers=headers, json=json_data)
 
-    issue_no = json.loads(response.text)['feed']['title']
-    # _res['feed']['title'] == "Success"になるまでループする
-    for i in range(100):
-        res = session.get(f'https://newb2web.kuronekoyamato.co.jp/b2/p/polling?issue_no={issue_no}&service_no=interman')
-        _res = json.loads(res.text)
-        if _res['feed']['title'] == "Success":
-            break
-        time.sleep(0.1)
+    return decode_response(response)['feed']['title']
+
+
+def download_issue(session:requests.Session, issue_no:str, dest=None, chunk_size:int=65536, retries:int=3):
+    """
+    生成が完了したPDFデータをダウンロードする
+
+    Args:
+        session(requests.Session): ログイン済みのセッション
+        issue_no(str): 発行番号
+        dest: 書き込み先のパスまたはファイルオブジェクト。指定した場合は、メモリに溜めずに書き込む
+        chunk_size(int): 1回に読み込むバイト数
+        retries(int): 通信が切れた場合に途中から再開する回数
+
+    Returns:
+        bytes: PDFデータ
+        destを指定した場合は、dict: iter_download_issueのstats
+    """
+    if dest is None:
+        return b''.join(iter_download_issue(session, issue_no, chunk_size=chunk_size, retries=retries))
+
+    stats = {}
+    chunks = iter_download_issue(session, issue_no, chunk_size=chunk_size, retries=retries, stats=stats)
+    if isinstance(dest, (str, os.PathLike)):
+        with open(dest, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
     else:
-        raise Exception("PDFデータ生成に失敗")
+        for chunk in chunks:
+            dest.write(chunk)
+    return stats
+
+
+def __content_range_start(response:requests.Response):
+    # Content-Range: bytes {start}-{end}/{size} の開始位置。ない場合はNone
+    value = response.headers.get('Content-Range', '')
+    match = re.match(r'bytes\s+(\d+)-', value)
+    return int(match.group(1)) if match else None
+
+
+def iter_download_issue(session:requests.Session, issue_no:str, chunk_size:int=65536, retries:int=3, stats:dict=None):
+    """
+    生成が完了したPDFデータを少しずつダウンロードする。
+    通信が切れた場合は、Rangeヘッダーで受信済みの位置から再開する(Rangeに未対応の場合は受信済みの分を読み飛ばす)
+
+    Args:
+        session(requests.Session): ログイン済みのセッション
+        issue_no(str): 発行番号
+        chunk_size(int): 1回に読み込むバイト数
+        retries(int): 通信が切れた場合に途中から再開する回数
+        stats(dict): 指定した場合は、完了時に
+            {'bytes': 受信バイト数, 'elapsed': 秒数, 'bytes_per_sec': 1秒あたりのバイト数, 'resumed': 再開した回数}
+            を格納する
+
+    Yields:
+        bytes: PDFデータ
+    """
     # 完了後にcheckを読み込むレスポンスは空
     _ = session.get(f'https://newb2web.kuronekoyamato.co.jp/b2/p/B2_OKURIJYO?checkonly=1&issue_no={issue_no}')
 
     # 生成されたPDFデータをダウンロードする
-    res = session.get(f'https://newb2web.kuronekoyamato.co.jp/b2/p/B2_OKURIJYO?issue_no={issue_no}&fileonly=1')
+    url = f'https://newb2web.kuronekoyamato.co.jp/b2/p/B2_OKURIJYO?issue_no={issue_no}&fileonly=1'
+    started = time.monotonic()
+    received = 0
+    resumed = 0
+    use_range = True
+    while True:
+        headers = {'Range': f'bytes={received}-'} if received and use_range else None
+        try:
+            with session.get(url, headers=headers, stream=True) as res:
+                res.raise_for_status()
+                if 'text/html' in res.headers.get('Content-Type', ''):
+                    raise Exception(f'PDFデータの代わりにHTMLが返されました。セッションが切れている可能性があります。issue_no:{issue_no}')
+                if res.status_code == 206 and __content_range_start(res) != received:
+                    # 要求と異なる位置から送られてきた場合は、先頭から受信し直して受信済みの分を読み飛ばす
+                    use_range = False
+                    continue
+                # 206以外は先頭から送られてくるので受信済みの分を読み飛ばす
+                skip = received if res.status_code != 206 else 0
+                for chunk in res.iter_content(chunk_size):
+                    if skip:
+                        if len(chunk) <= skip:
+                            skip -= len(chunk)
+                            continue
+                        chunk = chunk[skip:]
+                        skip = 0
+                    received += len(chunk)
+                    yield chunk
+            break
+        except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError):
+            if resumed >= retries:
+                raise
+            resumed += 1
 
-    return res.content
+    if stats is not None:
+        elapsed = time.monotonic() - started
+        stats.update({
+            'bytes': received,
+            'elapsed': elapsed,
+            'bytes_per_sec': received / elapsed if elapsed > 0 else 0,
+            'resumed': resumed,
+        })
 
 
 def put_history_delete(session:requests.Session, feed:dict)->dict:
@@ -361,7 +552,7 @@ def put_history_delete(session:requests.Session, feed:dict)->dict:
     'Origin': 'https://newb2web.kuronekoyamato.co.jp',
     }
     response = session.put(url, headers=headers, json=_feed)
-    return json.loads(response.text)
+    return decode_response(response)
 
 
 def put_history_display(session:requests.Session, feed:dict):
@@ -382,12 +573,13 @@ def put_history_display(session:requests.Session, feed:dict):
     'Origin': 'https://newb2web.kuronekoyamato.co.jp',
     }
     response = session.put(url, headers=headers, json=_feed)
-    return json.loads(response.text)
+    return decode_response(response)
 
 
-def get_dm_number_print(session:requests.Session, params:dict):
+def get_dm_number_print(session:requests.Session, params:dict, polling_policy:PollingPolicy=None, dest=None):
     """
     DM便番号一覧のPDFを取得する
+    destを指定した場合は、PDFデータをメモリに溜めずに書き込み、ダウンロードの統計を返す
     """
     _params = {}
     _params['dmnumberlist'] = ''
@@ -395,23 +587,10 @@ def get_dm_number_print(session:requests.Session, params:dict):
     _params.update(params)
     response = session.get('https://newb2web.kuronekoyamato.co.jp/b2/p/history', params=_params)
 
-    issue_no = json.loads(response.text)['feed']['title']
-    # _res['feed']['title'] == "Success"になるまでループする
-    for i in range(100):
-        res = session.get(f'https://newb2web.kuronekoyamato.co.jp/b2/p/polling?issue_no={issue_no}&service_no=interman')
-        _res = json.loads(res.text)
-        if _res['feed']['title'] == "Success":
-            break
-        time.sleep(0.1)
-    else:
-        raise Exception("PDFデータ生成に失敗")
-    # 完了後にcheckを読み込むレスポンスは空
-    res = session.get(f'https://newb2web.kuronekoyamato.co.jp/b2/p/B2_OKURIJYO?checkonly=1&issue_no={issue_no}')
-
-    # 生成されたPDFデータをダウンロードする
-    res = session.get(f'https://newb2web.kuronekoyamato.co.jp/b2/p/B2_OKURIJYO?issue_no={issue_no}&fileonly=1')
-
-    return res.content
+    issue_no = decode_response(response)['feed']['title']
+    # PDFデータの生成が完了するまでポーリングする
+    wait_issue(session, issue_no, polling_policy)
+    return download_issue(session, issue_no, dest=dest)
 
 
 def search_history(session:requests.Session,
@@ -457,12 +636,24 @@ def search_history(session:requests.Session,
     発行済み伝票情報の検索
     """
     args = locals().copy()
+    del args['session']
+    return get_history(session, params=history_params(args))
+
+
+def history_params(conditions:dict)->dict:
+    """
+    search_historyの検索条件をget_historyのクエリパラメータにする
+
+    Args:
+        conditions(dict): search_historyの引数名 -> 値。Noneの条件は無視する
+
+    Returns:
+        dict: クエリパラメータ
+    """
     params = {}
     params['all']=''
-    for k, v in args.items():
-        if k == 'session':
-            continue
-        elif k == "shipment_plan_from" and v is not None:
+    for k, v in conditions.items():
+        if k == "shipment_plan_from" and v is not None:
             params[f'shipment_date-ge-{v.strftime("%Y%m%d")}'] = ''
         elif k == "shipment_plan_to" and v is not None:
             params[f'shipment_date-le-{v.strftime("%Y%m%d")}'] = ''
@@ -476,136 +667,114 @@ def search_history(session:requests.Session,
             params[f'tracking_number-le-{v}'] = ''
         elif v is not None:
             params[k] = v
-    return get_history(session, params=params)
+    return params
 
 
-def __compress_feed(session, feed):
+def _as_date(value):
+    # datetimeはdateにそろえる(dateとは大小比較できないため)
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    return value
+
+
+def history_windows(shipment_plan_from=None, shipment_plan_to=None, window_days:int=1, separate_open_ends:bool=False)->list:
+    """
+    出荷予定日の範囲をwindow_days日ずつの期間に分ける
+
+    出荷予定日の指定がない場合は、過去90日から今日までを分割する。
+    開始日の指定がない場合は最初の期間の開始日を、終了日の指定がない場合は最後の期間の終了日をNoneにして、範囲外の伝票も漏れないようにする。
+
+    Args:
+        shipment_plan_from(datetime.date): 出荷予定日の開始日。datetimeも可
+        shipment_plan_to(datetime.date): 出荷予定日の終了日。datetimeも可
+        window_days(int): 1期間の日数
+        separate_open_ends(bool): Trueの場合は、範囲外を(None, 開始日の前日)、(終了日の翌日, None)の別の期間にする
+
+    Returns:
+        list[tuple]: (開始日, 終了日)のリスト(古い順)。Noneは指定なし
+    """
+    if window_days < 1:
+        raise ValueError('window_daysは1以上を指定してください。')
+    first = _as_date(shipment_plan_from)
+    last = _as_date(shipment_plan_to)
+    today = datetime.date.today()
+    start = first or min(today - datetime.timedelta(days=90), last or today)
+    end = last or max(today, start)
+    if start > end:
+        return [(first, last)]
+    day = datetime.timedelta(days=1)
+
+    windows = []
+    while start <= end:
+        windows.append((start, min(start + day * (window_days - 1), end)))
+        start += day * window_days
+    if separate_open_ends:
+        if first is None:
+            windows.insert(0, (None, windows[0][0] - day))
+        if last is None:
+            windows.append((end + day, None))
+    else:
+        if first is None:
+            windows[0] = (None, windows[0][1])
+        if last is None:
+            windows[-1] = (windows[-1][0], None)
+    return windows
+
+
+def iter_history(session:requests.Session, window_days:int=1, **conditions):
+    """
+    発行済み伝票情報を出荷予定日window_days日ずつに分けて検索し、entryを1件ずつ返す
+    一度に取得するのは1期間分だけなので、履歴の件数によらずメモリ使用量が抑えられる
+
+    出荷予定日の指定がない場合は、過去90日から今日までを分割する。
+    最初の期間は開始日なし、最後の期間は終了日なしで検索するので、範囲外の伝票も漏れない
+
+    Args:
+        session(requests.Session): ログイン済みのセッション
+        window_days(int): 1回の検索で取得する出荷予定日の日数
+        conditions: search_historyと同じ検索条件
+
+    Yields:
+        dict: entry(出荷予定日の古い順)
+    """
+    windows = history_windows(conditions.pop('shipment_plan_from', None), conditions.pop('shipment_plan_to', None), window_days)
+    for window_from, window_to in windows:
+        feed = get_history(session, params=history_params({
+            'display_flg': '1',
+            **conditions,
+            'shipment_plan_from': window_from,
+            'shipment_plan_to': window_to,
+        }))
+        yield from feed['feed'].get('entry', [])
+
+
+def __compress_feed(session, feed, stream=False, key=None):
     """
     feedを圧縮する
+
+    Args:
+        session:ログイン済みのセッション
+        feed:shipmentを含むfeed、またはShipmentBatch
+        stream:Trueの場合は、エンコードと圧縮をチャンク毎に行うgeneratorを返す
+        key:templateのキャッシュのkey。Noneの場合はloginしたアカウント(session.b2_account)
+
+    Returns:
+        bytes | Iterator[bytes]: raw deflateで圧縮したデータ
     """
-    def __create_template():
-        """
-        配送状況更新用のtemplateを生成する(javascriptの解析して実装)
-        """
-        # キャッシュがある場合は、キャッシュを返す
-        if 'template' in CACHE:
-            return CACHE['template']
-
-        def list2dict(fields):
-            for x in fields:
-                if x[0] == " ":
-                    break
-            else:
-                return fields
-
-            ret = {}
-            fname = None
-            for _field in fields:
-                field = re.match(r'\s*[0-9a-zA-Z_]+', _field).group()
-                if field[0] != " ":
-                    if fname is not None:
-                        ret[fname] = list2dict(_fields)
-                    _fields = {}
-                    fname =field
-                else:
-                    _fields[field[1:].replace('{}','')] = ""
-            ret[fname] = list2dict(_fields)
-            return ret
-
-        response = session.get('https://newb2web.kuronekoyamato.co.jp/b2/d/_settings/template')
-        fields = ["author{}", " name", " uri", " email", "category{}", " ___term",
-                " ___scheme", " ___label", "content", " ___src", " ___type", " ______text",
-                "contributor{}", " name", " uri", " email", "id", "link{}", " ___href",
-                " ___rel", " ___type", " ___title", " ___length", "published", "rights",
-                "rights____type", "summary", "summary____type", "title", "title____type",
-                "subtitle", "subtitle____type", "updated"
-            ]
-        fields.extend(response.text.split('\n'))
-        ret = list2dict(fields)
-        CACHE['template'] = ret
-        return ret
-
-
-    def __create_fieled_list(template, feed):
-        """
-        dict -> listする(javascriptの解析して実装)
-        """
-        def extend(_temp, item):
-            if type(item) is str:
-                return item
-
-            if type(item) is dict:
-                ret = []
-                for temp in _temp:
-                    if temp in item:
-                        ret.append(extend(_temp[temp], item[temp]))
-                    else:
-                        ret.append(None)
-                return ret
-            if type(item) is list:
-                ret = []
-                islink=True
-                for _item in item:
-                    res = extend(_temp, _item)
-                    ret.append(res)
-                return ret
-            raise
-        ret = [None]*15
-        ret[14] = extend(template, feed['feed']['entry'])
-        return ret
-
-
-    def __b2_encode(field_list):
-        """
-        配列にしたデータをバイト列にする(javascriptを解析して実装）
-        """
-        if field_list is None:
-            return [192]
-        if type(field_list) == dict:
-            raise Exception("未実装1")
-        if type(field_list) is list:
-            ret = []
-            t = len(field_list)
-            n = 144 + t if t < 16 else 220
-            ret.append(n)
-            if n == 220:
-                for x in t.to_bytes(2, 'big'):
-                    ret.append(x)
-            for _item in field_list:
-                ret.extend(__b2_encode(_item))
-            return ret
-        if type(field_list) is str:
-            bitem = field_list.encode('utf-8')
-            t = len(bitem)
-            o = 1 if t < 32 else 2 if t < 255 else 3 if t<65535 else 5
-            u = 160 + t if o==1 else 215 + o if o<=3 else 219
-            ret = []
-            if o == 1:
-                ret.append(u)
-            elif o > 1:
-                ret.append(u)
-                flg = False
-                for x in t.to_bytes(6,'big'):
-                    if x > 0:
-                        flg = True
-                    if flg:
-                        ret.append(t)
-            elif o == 3:
-                ret.append(u)
-                ret.append(t>>8)
-                ret.append(t)
-            for c in bitem:
-                ret.append(c)
-            return ret
-        raise Exception("未実装2")
-
-    template = __create_template()
+    # tracking更新処理1 templateをコンパイルしたplanを取得する
+    if key is None:
+        key = getattr(session, 'b2_account', '')
+    plan = TEMPLATE_CACHE.get(session, key)
     # tracking更新処理2 feedをfield_listに変換する
-    field_list = __create_fieled_list(template, feed)
+    if hasattr(feed, 'to_field_list'):
+        # ShipmentBatchは伝票毎のdictを作らずに変換する
+        field_list = feed.to_field_list(plan)
+    else:
+        field_list = create_field_list(plan, feed)
+    if stream:
+        # エンコードしながら圧縮する。データ全体をメモリに展開しない
+        return iter_deflate(iter_b2_encode(field_list))
     # tracking更新処理3 field_listを独自encodeする
-    encoded = __b2_encode(field_list)
-    # tracking更新処理4 zip圧縮する
-    compressed = zlib.compress(bytes(encoded))
-    # tracking更新処理5 圧縮データを前2バイト、後ろ4バイトをトリムする
-    ret = compressed[2:-4]
-    return ret
+    encoded = b2_encode(field_list)
+    # tracking更新処理4 raw deflate(zlibのヘッダー2バイト、チェックサム4バイトなし)で圧縮する
+    return b''.join(iter_deflate((encoded,)))
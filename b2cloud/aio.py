@@ -0,0 +1,131 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import b2cloud
+import b2cloud.utilities
+
+
+class AsyncB2Client:
+    """
+    B2クラウドの各処理をコルーチンとして実行するクライアント
+
+    ログイン済みのsessionの接続プールを共有し、ワーカースレッド上で
+    同期版の各関数を実行する。1プロセスで複数のリクエストを同時に処理できる。
+
+    e.g.
+        async with await AsyncB2Client.login(customer_code, customer_password) as client:
+            results = await asyncio.gather(*[client.check_shipment(s) for s in shipments])
+    """
+
+    def __init__(self, session:requests.Session, max_concurrency:int=32, resize_pool:bool=True):
+        """
+        resize_poolがTrueで、sessionの'https://'がHTTPAdapterの場合は、同時実行数に合わせた接続プールのHTTPAdapterに差し替える。
+        HTTPAdapterの設定(max_retries等)を残したい場合はresize_pool=Falseを指定する。HTTPAdapter以外のadapterはそのまま使う。
+
+        Args:
+            session(requests.Session): ログイン済みのセッション
+            max_concurrency(int): 同時に実行するリクエスト数の上限(接続プールのサイズ)
+            resize_pool(bool): sessionの接続プールを差し替えるか
+        """
+        self.session = session
+        self.max_concurrency = max_concurrency
+        if resize_pool and type(session.adapters.get('https://')) is requests.adapters.HTTPAdapter:
+            # 同時実行数に合わせて接続プールを拡張する
+            adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=max_concurrency)
+            self.session.mount('https://', adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='b2cloud')
+
+    @classmethod
+    async def login(cls, customer_code:str, customer_password:str, customer_cls_cocde='', login_user_id='', max_concurrency:int=32):
+        """
+        ログインして、AsyncB2Clientを返す
+
+        Args:
+            customer_code:お客様コード
+            customer_password:パスワード
+            customer_cls_cocde:お客様コード枝番
+            login_user_id:ログインユーザーID
+            max_concurrency:同時に実行するリクエスト数の上限
+
+        Returns:
+            AsyncB2Client
+        """
+        loop = asyncio.get_running_loop()
+        session = await loop.run_in_executor(
+            None,
+            functools.partial(b2cloud.login, customer_code, customer_password, customer_cls_cocde, login_user_id)
+        )
+        return cls(session, max_concurrency=max_concurrency)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        """
+        ワーカーを停止して、セッションを閉じる
+        """
+        # 実行中のリクエストの完了を待つ間もイベントループを止めない
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._executor.shutdown)
+        self.session.close()
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, self.session, *args, **kwargs))
+
+    async def get_history(self, params:dict):
+        return await self._run(b2cloud.get_history, params)
+
+    async def get_history_all(self):
+        return await self._run(b2cloud.get_history_all)
+
+    async def get_history_deleted(self):
+        return await self._run(b2cloud.get_history_deleted)
+
+    async def search_history(self, **kwargs):
+        return await self._run(b2cloud.search_history, **kwargs)
+
+    async def put_tracking(self, feed:dict, stream=False):
+        return await self._run(b2cloud.put_tracking, feed, stream)
+
+    async def post_new_checkonly(self, shipments:list):
+        return await self._run(b2cloud.post_new_checkonly, shipments)
+
+    async def check_shipment(self, shipment:dict):
+        return await self._run(b2cloud.check_shipment, shipment)
+
+    async def check_shipments(self, shipments:list):
+        return await self._run(b2cloud.check_shipments, shipments)
+
+    async def post_new(self, checked_feed:dict):
+        return await self._run(b2cloud.post_new, checked_feed)
+
+    async def get_new(self, params=None):
+        return await self._run(b2cloud.get_new, params)
+
+    async def delete_new(self, feed:dict, stream=False):
+        return await self._run(b2cloud.delete_new, feed, stream)
+
+    async def print_issue(self, print_type:str, entry_feed:dict, polling_policy=None, dest=None):
+        return await self._run(b2cloud.print_issue, print_type, entry_feed, polling_policy, dest)
+
+    async def put_history_delete(self, feed:dict):
+        return await self._run(b2cloud.put_history_delete, feed)
+
+    async def put_history_display(self, feed:dict):
+        return await self._run(b2cloud.put_history_display, feed)
+
+    async def get_dm_number_print(self, params:dict, polling_policy=None, dest=None):
+        return await self._run(b2cloud.get_dm_number_print, params, polling_policy, dest)
+
+    async def get_postal(self, code:str):
+        return await self._run(b2cloud.utilities.get_postal, code)
+
+    async def get_address_info(self, addressian_api_key:str, address:str, zip_code=None, prefix='consignee'):
+        return await self._run(b2cloud.utilities.get_address_info, addressian_api_key, address, zip_code, prefix)
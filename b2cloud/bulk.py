@@ -0,0 +1,258 @@
+import datetime
+import math
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+
+import fitz
+import requests
+
+import b2cloud
+import b2cloud.utilities
+from b2cloud.polling import PollingPolicy, iter_wait_issues
+
+
+def chunked(items:list, chunk_size:int):
+    """
+    リストをchunk_size件ずつに分割する
+
+    Returns:
+        list[tuple[int, list]]: (先頭のindex, 分割したリスト)
+    """
+    if chunk_size < 1:
+        raise ValueError('chunk_sizeは1以上を指定してください。')
+    return [(i, items[i:i + chunk_size]) for i in range(0, len(items), chunk_size)]
+
+
+def register_chunk(session:requests.Session, shipments:list):
+    """
+    伝票情報をpost_new_checkonlyでチェックし、不備のないものだけpost_newで登録する
+    post_newが失敗した場合や、登録結果のentryが足りない場合は、登録されたか分からないため例外にせず'failed'を返す
+
+    Args:
+        session(requests.Session): ログイン済みのセッション
+        shipments(list):伝票情報リスト
+
+    Returns:
+        list[dict]: shipments毎の結果
+            {'status': 'ok' | 'error' | 'failed', 'errors': [不備内容], 'entry': 登録結果のentry}
+    """
+    checked = b2cloud.post_new_checkonly(session, shipments)
+    results = []
+    valid = []
+    for entry in checked['feed']['entry']:
+        errors = entry.get('error', [])
+        if errors:
+            results.append({'status': 'error', 'errors': errors, 'entry': entry})
+        else:
+            result = {'status': 'ok', 'errors': [], 'entry': None}
+            results.append(result)
+            valid.append((result, entry))
+
+    if valid:
+        try:
+            registered = b2cloud.post_new(session, {'feed': {'entry': [entry for _, entry in valid]}})
+            entries = registered['feed'].get('entry') or []
+            if len(entries) < len(valid):
+                error = f'登録結果のentryが不足しています。{registered["feed"].get("title", "")}'
+        except Exception as e:
+            # 送信後のエラーは再実行すると二重登録になる可能性がある
+            entries, error = [], str(e)
+        for i, (result, _) in enumerate(valid):
+            if i < len(entries):
+                result['entry'] = entries[i]
+            else:
+                # 対応する登録結果のないものは登録されたとみなさない
+                result.update({'status': 'failed', 'errors': [error]})
+    return results
+
+
+def bulk_register(session:requests.Session, shipments:list, chunk_size:int=100, max_workers:int=4, retries:int=2):
+    """
+    大量の伝票情報をchunk_size件ずつ分割し、並列にチェック→登録する。
+    チャンクの処理が終わる度に伝票毎の結果を返す(完了順)。
+    post_new_checkonlyが通信エラーになったチャンクだけをretries回まで再実行する。
+    post_newは二重登録を避けるため再実行せず、エラーの場合は'failed'を返す。
+
+    Args:
+        session(requests.Session): ログイン済みのセッション
+        shipments(list):伝票情報リスト
+        chunk_size(int): 1リクエストで送る伝票数
+        max_workers(int): 同時に処理するチャンク数
+        retries(int): post_new_checkonlyが通信エラーの場合の再実行回数
+
+    Yields:
+        dict: 伝票毎の結果
+            {
+                'index': shipmentsでの位置,
+                'status': 'ok':登録済み, 'error':データに不備あり, 'failed':通信エラー(post_newの場合は未登録とは限らない),
+                'errors': 不備内容またはエラーメッセージのリスト,
+                'entry': 登録結果のentry
+            }
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {}
+        for start, chunk in chunked(shipments, chunk_size):
+            pending[executor.submit(register_chunk, session, chunk)] = (start, chunk, 0)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                start, chunk, attempt = pending.pop(future)
+                try:
+                    results = future.result()
+                except requests.RequestException as e:
+                    if attempt < retries:
+                        pending[executor.submit(register_chunk, session, chunk)] = (start, chunk, attempt + 1)
+                        continue
+                    results = [{'status': 'failed', 'errors': [str(e)], 'entry': None}] * len(chunk)
+                for i, result in enumerate(results):
+                    yield {'index': start + i, **result}
+
+
+def iter_print_issue(session:requests.Session, print_type:str, entry_feed:dict, chunk_size:int=100, max_workers:int=4, polling_policy:PollingPolicy=None):
+    """
+    伝票をchunk_size件ずつの発行ジョブに分割して並列に印刷し、PDFデータができたものから返す(完了順)
+
+    Args:
+        session(requests.Session): ログイン済みのセッション
+        print_type: 'm':A4マルチ, 'm5':A5マルチ, '3':dm , '7':ネコポス
+        entry_feed: 印刷するshipmentを含むfeed
+        chunk_size(int): 1つの発行ジョブで印刷する伝票数
+        max_workers(int): 同時に発行開始、ダウンロードするジョブ数
+        polling_policy: PDFデータ生成完了までのポーリング間隔
+
+    Yields:
+        dict: {'index': チャンクの番号, 'start': 先頭の伝票のentry_feedでの位置, 'count': 伝票数, 'pdf': PDFデータ}
+    """
+    if print_type in b2cloud.utilities.LAYOUTS:
+        # 複数面の用紙は、途中のシートに空きができないように面数の倍数にする
+        labels = len(b2cloud.utilities.layout_rects(print_type))
+        chunk_size = math.ceil(chunk_size / labels) * labels
+    chunks = chunked(entry_feed['feed']['entry'], chunk_size)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # 発行ジョブを並列に開始する
+        issue_nos = list(executor.map(
+            lambda chunk: b2cloud.issue_print(session, print_type, {'feed': {'entry': chunk[1]}}),
+            chunks
+        ))
+        index = {issue_no: i for i, issue_no in enumerate(issue_nos)}
+
+        def printed(future):
+            i = downloads.pop(future)
+            start, chunk = chunks[i]
+            return {'index': i, 'start': start, 'count': len(chunk), 'pdf': future.result()}
+
+        # 1スレッドでまとめてポーリングし、完了したものから並列にダウンロードする
+        downloads = {}
+        for res in iter_wait_issues(session, issue_nos, polling_policy):
+            if not res['success']:
+                raise Exception(f"PDFデータ生成に失敗 issue_no:{res['issue_no']} {res['elapsed']:.1f}秒")
+            downloads[executor.submit(b2cloud.download_issue, session, res['issue_no'])] = index[res['issue_no']]
+            # ダウンロードが終わったものを返す
+            for future in [f for f in downloads if f.done()]:
+                yield printed(future)
+        for future in as_completed(list(downloads)):
+            yield printed(future)
+
+
+def print_issue(session:requests.Session, print_type:str, entry_feed:dict, chunk_size:int=100, max_workers:int=4, polling_policy:PollingPolicy=None)->bytes:
+    """
+    伝票を複数の発行ジョブに分割して並列に印刷し、1つのPDFデータに結合する
+    DM(1シート8枚)等の複数面の用紙では、途中のシートに空きができないようにchunk_sizeを面数の倍数に切り上げる
+
+    Args:
+        session(requests.Session): ログイン済みのセッション
+        print_type: 'm':A4マルチ, 'm5':A5マルチ, '3':dm , '7':ネコポス
+        entry_feed: 印刷するshipmentを含むfeed
+        chunk_size(int): 1つの発行ジョブで印刷する伝票数
+        max_workers(int): 同時に発行開始、ダウンロードするジョブ数
+        polling_policy: PDFデータ生成完了までのポーリング間隔
+
+    Returns:
+        bytes: entry_feedの順に結合したPDFデータ
+    """
+    printed = sorted(iter_print_issue(session, print_type, entry_feed, chunk_size, max_workers, polling_policy),
+                     key=lambda x: x['index'])
+    doc = fitz.open()
+    for res in printed:
+        with fitz.open(stream=res['pdf'], filetype='pdf') as _doc:
+            doc.insert_pdf(_doc)
+    return doc.tobytes(garbage=1, deflate=True)
+
+
+def count_history(session:requests.Session, params:dict)->int:
+    """
+    get_historyのパラメータに該当する伝票数を取得する
+
+    Returns:
+        int: 伝票数
+    """
+    feed = b2cloud.get_history(session, params={**params, 'count': ''})
+    return int(feed['feed']['title'])
+
+
+def _split_window(window:tuple)->list:
+    # 出荷予定日の範囲を2つに分ける。1日以下または開始日・終了日がない場合は分けない
+    start, end = window
+    if start is None or end is None or start >= end:
+        return [window]
+    middle = start + (end - start) // 2
+    return [(start, middle), (middle + datetime.timedelta(days=1), end)]
+
+
+def search_history(session:requests.Session, window_days:int=7, max_count:int=500, max_workers:int=4, **conditions)->dict:
+    """
+    発行済み伝票情報を出荷予定日の期間毎に分割して並列に検索し、1つのfeedにまとめる
+
+    期間毎の件数をcountで確認し、max_countを超える期間は半分に分割し直してから取得する。
+    出荷予定日の指定がない場合は、過去90日から今日までを分割し、その前後の伝票も取得する。
+
+    Args:
+        session(requests.Session): ログイン済みのセッション
+        window_days(int): 最初に分割する期間の日数
+        max_count(int): 1回の検索で取得する伝票数の目安
+        max_workers(int): 同時に検索する数
+        conditions: b2cloud.search_historyと同じ検索条件
+
+    Returns:
+        dict: {'feed':{'entry':[...]}} 出荷予定日の古い順。同じ送り状番号は1件にまとめる
+    """
+    conditions.setdefault('display_flg', '1')
+    # 範囲外の期間は件数が多くても分割できないので、分割できる期間と分けておく
+    windows = b2cloud.history_windows(conditions.pop('shipment_plan_from', None), conditions.pop('shipment_plan_to', None),
+                                      window_days, separate_open_ends=True)
+
+    def params(window):
+        return b2cloud.history_params({**conditions, 'shipment_plan_from': window[0], 'shipment_plan_to': window[1]})
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # 件数を数え、多すぎる期間は分割して数え直す
+        planned = []
+        pending = {executor.submit(count_history, session, params(w)): w for w in windows}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                window = pending.pop(future)
+                count = future.result()
+                if count == 0:
+                    continue
+                halves = _split_window(window) if count > max_count else [window]
+                if len(halves) == 1:
+                    planned.append(window)
+                    continue
+                for half in halves:
+                    pending[executor.submit(count_history, session, params(half))] = half
+
+        planned.sort(key=lambda w: w[0] or datetime.date.min)
+        feeds = executor.map(lambda w: b2cloud.get_history(session, params=params(w)), planned)
+
+        entries = []
+        seen = set()
+        for feed in feeds:
+            for entry in feed['feed'].get('entry', []):
+                tracking_number = entry['shipment'].get('tracking_number')
+                if tracking_number is not None:
+                    if tracking_number in seen:
+                        continue
+                    seen.add(tracking_number)
+                entries.append(entry)
+    return {'feed': {'entry': entries}}
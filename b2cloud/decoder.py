@@ -0,0 +1,405 @@
+import codecs
+import collections.abc
+import json
+import re
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+# バックエンド名 -> bytes(またはstr)を受け取るloads。json.loadsはbytesの文字コードを判定して変換する
+BACKENDS = {'json': json.loads}
+if ujson is not None:
+    BACKENDS['ujson'] = ujson.loads
+if orjson is not None:
+    BACKENDS['orjson'] = orjson.loads
+
+# インストールされていればorjson > ujson > jsonの順に使う
+BACKEND = 'orjson' if orjson is not None else 'ujson' if ujson is not None else 'json'
+_loads = BACKENDS[BACKEND]
+
+
+def set_backend(name:str):
+    """
+    jsonのデコードに使うバックエンドを切り替える
+
+    Args:
+        name(str): 'orjson', 'ujson', 'json'
+    """
+    global BACKEND, _loads
+    if name not in BACKENDS:
+        raise Exception(f'jsonのバックエンド{name}は使用できません。インストールされているか確認してください。')
+    BACKEND = name
+    _loads = BACKENDS[name]
+
+
+def loads(data):
+    """
+    バックエンドでjson(bytesまたはstr)をデコードする
+    """
+    return _loads(data)
+
+
+def decode_response(response, lazy:bool=False):
+    """
+    レスポンスのjsonを、文字列に変換せずにresponse.contentからデコードする
+
+    Args:
+        response(requests.Response): B2クラウドのレスポンス
+        lazy(bool): Trueの場合はentryを参照したときにデコードするLazyFeedを返す
+
+    Returns:
+        dict | LazyFeed: {'feed':{'entry':[...]}}
+    """
+    if lazy:
+        return LazyFeed(response.content)
+    return _loads(response.content)
+
+
+def iter_entries(response, chunk_size:int=65536):
+    """
+    レスポンスを受信しながら、feed.entryを届いた順に1件ずつ返す
+
+    session.get(..., stream=True)のレスポンスに使う。保持するのは受信中の1件分だけなので、
+    feed全体を受信・デコードするより先に処理を始められ、メモリ使用量も抑えられる。
+
+    Args:
+        response(requests.Response): stream=Trueで取得したレスポンス
+        chunk_size(int): 1回に読み込むバイト数
+
+    Yields:
+        dict: entry
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    scanner = FeedScanner(loads=loads)
+    for chunk in response.iter_content(chunk_size):
+        scanner.append(decoder.decode(chunk))
+        yield from scanner.entries()
+    scanner.append(decoder.decode(b'', final=True))
+    scanner.close()
+    yield from scanner.entries()
+
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_DECODER = json.JSONDecoder()
+_DELIMITERS = frozenset(',]} \t\n\r')
+
+
+class _Incomplete(Exception):
+    # 続きのデータがないと判断できない
+    pass
+
+
+class FeedScanner:
+    """
+    {'feed':{'entry':[...], ...}}のjsonからentryを先頭から1件ずつ取り出す
+
+    append()で文字列を追加しながら使えるため、受信しながら処理できる。
+    entry以外のfeedの項目はfeedに、feed以外の項目はrootに保持する。
+    loadsを指定した場合は、entryの範囲を括弧の対応で切り出してloadsでデコードする。
+    """
+
+    def __init__(self, text:str='', loads=None):
+        """
+        Args:
+            text(str): jsonの先頭の文字列
+            loads: entryのデコードに使う関数。Noneの場合はjson.JSONDecoder.raw_decode
+        """
+        self.buffer = text
+        self.loads = loads
+        self.pos = 0
+        self.final = False
+        self.feed = {}
+        self.root = {}
+        self.has_feed = False
+        # start -> root -> feed -> entry -> feed -> root -> end
+        self.state = 'start'
+
+    def append(self, text:str):
+        """
+        続きの文字列を追加する(処理済みの部分は捨てる)
+        """
+        self.buffer = self.buffer[self.pos:] + text
+        self.pos = 0
+
+    def close(self):
+        """
+        以降の文字列がないことを通知する
+        """
+        self.final = True
+
+    @property
+    def done(self)->bool:
+        return self.state == 'end'
+
+    def entries(self):
+        """
+        現在の文字列から取り出せるentryを順に返す
+        """
+        while True:
+            try:
+                found, entry = self.step()
+            except _Incomplete:
+                return
+            if found:
+                yield entry
+            elif self.state == 'end':
+                return
+
+    def step(self):
+        """
+        1つの要素を読み進める。続きの文字列が必要な場合は_Incompleteを送出する
+
+        Returns:
+            tuple: (entryを取り出したか, entry)
+        """
+        s = self.buffer
+        i = self._skip(s, self.pos)
+        state = self.state
+        found, entry = False, None
+        if state == 'start':
+            i = self._expect(s, i, '{')
+            self.state = 'root'
+        elif state in ('root', 'feed'):
+            i = self._char(s, i)
+            if s[i] == '}':
+                i += 1
+                self.state = 'end' if state == 'root' else 'root'
+            else:
+                if s[i] == ',':
+                    i = self._skip(s, i + 1)
+                key, i = self._value(s, i)
+                i = self._expect(s, self._skip(s, i), ':')
+                i = self._skip(s, i)
+                if state == 'root' and key == 'feed':
+                    i = self._expect(s, i, '{')
+                    self.state = 'feed'
+                    self.has_feed = True
+                elif state == 'feed' and key == 'entry':
+                    i = self._expect(s, i, '[')
+                    self.state = 'entry'
+                else:
+                    value, i = self._value(s, i)
+                    (self.root if state == 'root' else self.feed)[key] = value
+        elif state == 'entry':
+            i = self._char(s, i)
+            if s[i] == ']':
+                i += 1
+                self.state = 'feed'
+            else:
+                if s[i] == ',':
+                    i = self._skip(s, i + 1)
+                entry, i = self._entry(s, i)
+                found = True
+        else:
+            if i < len(s):
+                self._error(i)
+            raise _Incomplete()
+        self.pos = i
+        return found, entry
+
+    def _error(self, i:int):
+        raise Exception(f'feedのjsonの形式が正しくありません。位置:{i}')
+
+    def _skip(self, s:str, i:int)->int:
+        return _WHITESPACE.match(s, i).end()
+
+    def _char(self, s:str, i:int)->int:
+        if i >= len(s):
+            if self.final:
+                self._error(i)
+            raise _Incomplete()
+        return i
+
+    def _expect(self, s:str, i:int, c:str)->int:
+        i = self._char(s, i)
+        if s[i] != c:
+            self._error(i)
+        return i + 1
+
+    def _entry(self, s:str, i:int):
+        i = self._char(s, i)
+        if self.loads is None or s[i] != '{':
+            return self._value(s, i)
+        # '{'と'}'の数が釣り合う位置をentryの終わりの候補とし、切り出した範囲だけをloadsでデコードする。
+        # 文字列の中の括弧で候補がずれた場合は、切り出した範囲がjsonとして正しくならないので通常の方法で読む
+        depth = 0
+        pos = i
+        end = s.find('}', pos)
+        while end != -1:
+            depth += s.count('{', pos, end) - 1
+            pos = end + 1
+            if depth == 0:
+                try:
+                    return self.loads(s[i:pos]), pos
+                except ValueError:
+                    break
+            end = s.find('}', pos)
+        return self._value(s, i)
+
+    def _value(self, s:str, i:int):
+        try:
+            value, end = _DECODER.raw_decode(s, self._char(s, i))
+        except json.JSONDecodeError:
+            if self.final:
+                self._error(i)
+            raise _Incomplete()
+        # 数値は区切りの文字が届くまで続きがあるかもしれない
+        if not self.final and isinstance(value, (int, float)) and (end == len(s) or s[end] not in _DELIMITERS):
+            raise _Incomplete()
+        return value, end
+
+
+class LazyEntries(collections.abc.Sequence):
+    """
+    LazyFeedのentry。参照した位置までデコードする
+    """
+
+    def __init__(self, feed):
+        self._feed = feed
+        self._decoded = []
+
+    def _load(self, n=None)->bool:
+        # n件目までデコードする。Noneの場合は全て
+        while n is None or len(self._decoded) < n:
+            entry = self._feed._next_entry()
+            if entry is _END:
+                return False
+            self._decoded.append(entry)
+        return True
+
+    def __getitem__(self, i):
+        if isinstance(i, slice) or i < 0:
+            self._load()
+        else:
+            self._load(i + 1)
+        return self._decoded[i]
+
+    def __len__(self):
+        self._load()
+        return len(self._decoded)
+
+    def __iter__(self):
+        i = 0
+        while self._load(i + 1):
+            yield self._decoded[i]
+            i += 1
+
+    def __eq__(self, other):
+        if not isinstance(other, collections.abc.Sequence):
+            return NotImplemented
+        return list(self) == list(other)
+
+
+_END = object()
+
+
+class _LazyBody(collections.abc.Mapping):
+    # LazyFeedの'feed'
+
+    def __init__(self, feed):
+        self._feed = feed
+
+    def __getitem__(self, key):
+        scanner = self._feed._scanner
+        if key == 'entry':
+            self._feed._advance_to_entry()
+            if self._feed._entries is None:
+                raise KeyError(key)
+            return self._feed._entries
+        if key not in scanner.feed:
+            self._feed._finish()
+        return scanner.feed[key]
+
+    def __iter__(self):
+        self._feed._finish()
+        if self._feed._entries is not None:
+            yield 'entry'
+        yield from self._feed._scanner.feed
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+
+class LazyFeed(collections.abc.Mapping):
+    """
+    decode_response(lazy=True)の戻り値
+
+    {'feed':{'entry':[...]}}のdictと同じように参照でき、entryは参照した位置までデコードする。
+    先頭の数件だけを使う場合や、entryを順に処理する場合にまとめてデコードしなくてよい。
+    json.dumps等にdictが必要な場合はto_dict()を使う。
+    """
+
+    def __init__(self, content):
+        """
+        Args:
+            content(bytes | str): レスポンスのjson
+        """
+        if isinstance(content, bytes):
+            content = content.decode('utf-8')
+        # entryはset_backendで選んだバックエンドでデコードする
+        self._scanner = FeedScanner(content, loads=loads)
+        self._scanner.close()
+        self._entries = None
+        self._body = _LazyBody(self)
+
+    def _advance_to_entry(self):
+        # entryの開始かfeedの終わりまで読み進める
+        scanner = self._scanner
+        while self._entries is None and scanner.state in ('start', 'root', 'feed'):
+            self._scanner.step()
+            if scanner.state == 'entry':
+                self._entries = LazyEntries(self)
+
+    def _next_entry(self):
+        scanner = self._scanner
+        while scanner.state == 'entry':
+            found, entry = scanner.step()
+            if found:
+                return entry
+        return _END
+
+    def _finish(self):
+        self._advance_to_entry()
+        if self._entries is not None:
+            self._entries._load()
+        while not self._scanner.done:
+            self._scanner.step()
+
+    def __getitem__(self, key):
+        if key == 'feed':
+            self._advance_to_entry()
+            if not self._scanner.has_feed:
+                raise KeyError(key)
+            return self._body
+        if key not in self._scanner.root:
+            self._finish()
+        return self._scanner.root[key]
+
+    def __iter__(self):
+        self._finish()
+        if self._scanner.has_feed:
+            yield 'feed'
+        yield from self._scanner.root
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+    def to_dict(self)->dict:
+        """
+        Returns:
+            dict: 全てデコードしたfeed
+        """
+        self._finish()
+        if not self._scanner.has_feed:
+            return dict(self._scanner.root)
+        feed = dict(self._scanner.feed)
+        if self._entries is not None:
+            feed['entry'] = list(self._entries)
+        return {'feed': feed, **self._scanner.root}
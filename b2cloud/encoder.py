@@ -0,0 +1,170 @@
+import struct
+import zlib
+
+# msgpackのヘッダー(型 + 長さ)
+_HEADER8 = struct.Struct('>BB').pack
+_HEADER16 = struct.Struct('>BH').pack
+_HEADER32 = struct.Struct('>BI').pack
+
+
+def compile_template(template):
+    """
+    templateをfeed -> field_list変換用のplanにコンパイルする
+
+    Args:
+        template(dict): __create_templateで生成したtemplate
+
+    Returns:
+        tuple: (keys, index, subplans)
+            keys: templateのkeyの順序
+            index: key -> field_listでの位置
+            subplans: keyに対応する子要素のplan
+    """
+    if not isinstance(template, dict):
+        return ((), {}, ())
+    keys = tuple(template)
+    index = {key: i for i, key in enumerate(keys)}
+    subplans = tuple(compile_template(template[key]) for key in keys)
+    return (keys, index, subplans)
+
+
+def create_field_list(plan, feed):
+    """
+    feed(dict)をplanに従ってfield_list(list)に変換する。
+    dictはtemplateのkey順のlistに、templateにないkeyは無視、entryにないkeyはNoneになる
+
+    Args:
+        plan: compile_templateの戻り値
+        feed(dict): shipmentを含むfeed
+
+    Returns:
+        list: b2_encodeに渡すfield_list
+    """
+    ret = [None] * 15
+    ret[14] = flatten_value(plan, feed['feed']['entry'])
+    return ret
+
+
+def flatten_value(plan, item):
+    """
+    feedの値をplanに従って変換する。dictはtemplateのkey順のlistに、listは要素毎に変換する
+
+    Args:
+        plan: compile_templateの戻り値(またはそのsubplan)
+        item: str, dict, listのいずれか
+
+    Returns:
+        変換した値
+    """
+    _type = type(item)
+    if _type is str:
+        return item
+    if _type is dict:
+        _, index, subplans = plan
+        ret = [None] * len(index)
+        get = index.get
+        # entryに存在するkeyのみ処理する
+        for key, value in item.items():
+            i = get(key)
+            if i is not None:
+                ret[i] = value if type(value) is str else flatten_value(subplans[i], value)
+        return ret
+    if _type is list:
+        return [flatten_value(plan, _item) for _item in item]
+    raise Exception(f"未対応の型です。{_type}")
+
+
+def b2_encode(field_list)->bytes:
+    """
+    配列にしたデータをB2クラウドの独自msgpack形式のバイト列にする
+
+    None, str, listのみ対応。ネストしたlistは再帰せずにスタックで処理する。
+    長さのヘッダーはmsgpackの仕様通り
+        str: 31byteまでfixstr, 255byteまでstr8, 65535byteまでstr16, それ以上str32
+        list: 15件までfixarray, 65535件までarray16, それ以上array32
+
+    Args:
+        field_list: __create_fieled_listで変換したデータ
+
+    Returns:
+        bytes: エンコードしたデータ
+    """
+    return b''.join(iter_b2_encode(field_list, chunk_size=None))
+
+
+def iter_b2_encode(field_list, chunk_size=65536):
+    """
+    b2_encodeの結果をchunk_sizeバイト程度ずつ返す
+
+    Args:
+        field_list: __create_fieled_listで変換したデータ
+        chunk_size(int): 1チャンクのバイト数の目安。Noneの場合は分割しない
+
+    Yields:
+        bytes: エンコードしたデータ
+    """
+    buf = bytearray()
+    append = buf.append
+    stack = [iter((field_list,))]
+    while stack:
+        for item in stack[-1]:
+            if item is None:
+                append(0xc0)
+            elif type(item) is str:
+                if not item:
+                    append(0xa0)
+                    continue
+                bitem = item.encode('utf-8')
+                t = len(bitem)
+                if t < 32:
+                    append(0xa0 | t)
+                elif t < 0x100:
+                    buf += _HEADER8(0xd9, t)
+                elif t < 0x10000:
+                    buf += _HEADER16(0xda, t)
+                else:
+                    buf += _HEADER32(0xdb, t)
+                buf += bitem
+                if chunk_size is not None and len(buf) >= chunk_size:
+                    yield bytes(buf)
+                    del buf[:]
+            elif type(item) is list:
+                t = len(item)
+                if t < 16:
+                    append(0x90 | t)
+                elif t < 0x10000:
+                    buf += _HEADER16(0xdc, t)
+                else:
+                    buf += _HEADER32(0xdd, t)
+                if t:
+                    # 子要素を先に処理する
+                    stack.append(iter(item))
+                    break
+            elif type(item) is dict:
+                raise Exception("未実装1")
+            else:
+                raise Exception("未実装2")
+        else:
+            stack.pop()
+    if buf:
+        yield bytes(buf)
+
+
+def iter_deflate(chunks, level=-1):
+    """
+    チャンク毎にraw deflate(zlibのヘッダーとチェックサムなし)で圧縮する。
+    zlib.compress(data)[2:-4]と同じ結果になる
+
+    Args:
+        chunks(Iterable[bytes]): 圧縮するデータ
+        level(int): 圧縮レベル
+
+    Yields:
+        bytes: 圧縮したデータ
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
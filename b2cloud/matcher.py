@@ -0,0 +1,138 @@
+import collections
+import threading
+import unicodedata
+
+
+def normalize_address(text:str)->str:
+    """
+    住所を比較用に正規化する(NFKCで全角英数字を半角にし、空白を除く)
+    """
+    return ''.join(unicodedata.normalize('NFKC', text).split())
+
+
+def char_masks(text:str)->dict:
+    """
+    文字 -> textでその文字が出現する位置のビットマスク
+    """
+    masks = {}
+    for i, c in enumerate(text):
+        masks[c] = masks.get(c, 0) | (1 << i)
+    return masks
+
+
+def lcs_length(masks:dict, length:int, text:str)->int:
+    """
+    ビット並列アルゴリズムで最長共通部分列の長さを求める(O(len(text))回の整数演算)
+
+    Args:
+        masks(dict): 比較先の文字列のchar_masks
+        length(int): 比較先の文字列の長さ
+        text(str): 比較する文字列
+
+    Returns:
+        int: 最長共通部分列の長さ
+    """
+    full = (1 << length) - 1
+    v = full
+    for c in text:
+        m = masks.get(c)
+        if m:
+            u = v & m
+            v = ((v + u) | (v - u)) & full
+    return length - bin(v).count('1')
+
+
+class PostalMatcher:
+    """
+    1つの郵便番号の住所候補から、住所に最も近いものを選ぶ
+
+    候補の正規化とビットマスクは作成時に1回だけ計算する。
+    都道府県・市区が住所の先頭と一致する場合は、残りの町域だけを最長共通部分列で比較する。
+    スコアはSequenceMatcher.ratioと同じく 2 * 一致文字数 / (住所の長さ + 候補の長さ)
+    """
+
+    def __init__(self, postal_feed:dict):
+        """
+        Args:
+            postal_feed(dict): get_postalで取得した郵便番号情報
+        """
+        self.entries = postal_feed['feed'].get('entry', [])
+        # (都道府県, 市区) -> [(候補の番号, 町域の長さ, 町域のマスク, 全体の長さ, 全体のマスク)]
+        self.groups = collections.OrderedDict()
+        for i, postal in enumerate(self.entries):
+            address = postal['address']
+            prefecture = normalize_address(address['address1'])
+            city = normalize_address(address['address2'])
+            town = normalize_address(address['address3'])
+            whole = prefecture + city + town
+            self.groups.setdefault((prefecture, city), []).append(
+                (i, len(town), char_masks(town), len(whole), char_masks(whole)))
+
+    def scores(self, address:str)->list:
+        """
+        候補毎のスコア(0〜1)を返す
+        """
+        address = normalize_address(address)
+        scores = [0.0] * len(self.entries)
+        for (prefecture, city), candidates in self.groups.items():
+            rest = address
+            prefix = 0
+            if prefecture and rest.startswith(prefecture):
+                rest = rest[len(prefecture):]
+                prefix += len(prefecture)
+            if city and rest.startswith(city):
+                rest = rest[len(city):]
+                prefix += len(city)
+            for i, town_length, town_masks, whole_length, whole_masks in candidates:
+                if prefix:
+                    matched = prefix + lcs_length(town_masks, town_length, rest)
+                else:
+                    matched = lcs_length(whole_masks, whole_length, address)
+                total = len(address) + whole_length
+                scores[i] = 2 * matched / total if total else 0.0
+        return scores
+
+    def choose(self, address:str):
+        """
+        住所に最も近い候補を返す。同点の場合は先の候補
+
+        Returns:
+            dict | None: postal_feedのentry。一致する文字がない場合はNone
+        """
+        ret = None
+        max_score = 0
+        for postal, score in zip(self.entries, self.scores(address)):
+            if score > max_score:
+                max_score = score
+                ret = postal
+        return ret
+
+    def choose_many(self, addresses)->list:
+        """
+        複数の住所について、それぞれ最も近い候補を返す
+        """
+        return [self.choose(address) for address in addresses]
+
+
+_MATCHERS = collections.OrderedDict()
+_MATCHERS_LOCK = threading.Lock()
+
+
+def get_matcher(postal_feed:dict, maxsize:int=1024)->PostalMatcher:
+    """
+    postal_feedのPostalMatcherを返す。同じpostal_feed(POSTAL_CACHEから取得したもの等)は作り直さない
+    """
+    key = id(postal_feed)
+    with _MATCHERS_LOCK:
+        cached = _MATCHERS.get(key)
+        # idが再利用されていないか、postal_feed自体を比べる
+        if cached is not None and cached[0] is postal_feed:
+            _MATCHERS.move_to_end(key)
+            return cached[1]
+    matcher = PostalMatcher(postal_feed)
+    with _MATCHERS_LOCK:
+        # postal_feedを保持してidが再利用されないようにする
+        _MATCHERS[key] = (postal_feed, matcher)
+        while len(_MATCHERS) > maxsize:
+            _MATCHERS.popitem(last=False)
+    return matcher
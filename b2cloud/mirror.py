@@ -0,0 +1,299 @@
+import datetime
+import json
+import sqlite3
+import threading
+import time
+
+import requests
+
+import b2cloud
+
+# history表の列になるshipmentの項目(送り状番号以外)
+COLUMNS = ('service_type', 'shipment_date', 'shipment_result_date', 'consignee_name', 'shipment_number',
+           'consignee_telephone', 'search_key1', 'search_key2', 'search_key3', 'search_key4', 'search_key5')
+
+# 日付の列。B2クラウドは'yyyy/mm/dd'で返すが、範囲検索のため'yyyymmdd'で保存する
+DATE_COLUMNS = ('shipment_date', 'shipment_result_date')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS history (
+    tracking_number TEXT PRIMARY KEY,
+    service_type TEXT,
+    shipment_date TEXT,
+    shipment_result_date TEXT,
+    consignee_name TEXT,
+    shipment_number TEXT,
+    consignee_telephone TEXT,
+    search_key1 TEXT,
+    search_key2 TEXT,
+    search_key3 TEXT,
+    search_key4 TEXT,
+    search_key5 TEXT,
+    deleted INTEGER NOT NULL DEFAULT 0,
+    synced_at REAL NOT NULL,
+    entry TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS history_shipment_date ON history (shipment_date);
+CREATE INDEX IF NOT EXISTS history_shipment_number ON history (shipment_number);
+CREATE INDEX IF NOT EXISTS history_consignee_telephone ON history (consignee_telephone);
+CREATE INDEX IF NOT EXISTS history_search_key1 ON history (search_key1);
+CREATE INDEX IF NOT EXISTS history_search_key2 ON history (search_key2);
+CREATE INDEX IF NOT EXISTS history_search_key3 ON history (search_key3);
+CREATE INDEX IF NOT EXISTS history_search_key4 ON history (search_key4);
+CREATE INDEX IF NOT EXISTS history_search_key5 ON history (search_key5);
+CREATE TABLE IF NOT EXISTS history_ngram (
+    gram TEXT NOT NULL,
+    tracking_number TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS history_ngram_gram ON history_ngram (gram, tracking_number);
+CREATE INDEX IF NOT EXISTS history_ngram_tracking_number ON history_ngram (tracking_number);
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+'''
+
+UPSERT = f'''
+INSERT INTO history (tracking_number, {', '.join(COLUMNS)}, deleted, synced_at, entry)
+VALUES (?, {', '.join('?' for _ in COLUMNS)}, ?, ?, ?)
+ON CONFLICT (tracking_number) DO UPDATE SET
+    {', '.join(f'{c} = excluded.{c}' for c in COLUMNS)},
+    deleted = excluded.deleted,
+    synced_at = excluded.synced_at,
+    entry = excluded.entry
+'''
+
+# 日付・送り状番号の範囲条件 -> (列, 演算子)
+RANGES = {
+    'shipment_plan_from': ('shipment_date', '>='),
+    'shipment_plan_to': ('shipment_date', '<='),
+    'shipment_result_date_from': ('shipment_result_date', '>='),
+    'shipment_result_date_to': ('shipment_result_date', '<='),
+    'tracking_number_from': ('tracking_number', '>='),
+    'tracking_number_to': ('tracking_number', '<='),
+}
+
+# search_historyの条件名 -> shipmentの項目名(条件名と項目名が違うもの)
+FIELDS = {f'search_title{i}': f'search_key_title{i}' for i in range(1, 6)}
+
+# shipmentに対応する項目がなく、取り込んだ履歴では検索できない条件
+UNSUPPORTED = ('creator_loginid', 'issuer_loginid', 'updater_loginid', 'dangerous_flg', 'issued_date')
+
+
+def _date_key(value):
+    # 'yyyy/mm/dd' -> 'yyyymmdd'
+    return value.replace('/', '') if isinstance(value, str) else value
+
+
+def ngrams(text:str, n:int=2)->set:
+    """
+    部分一致検索用に、空白を除いた文字列をn文字ずつに分割する
+    """
+    text = ''.join(text.split())
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class HistoryMirror:
+    """
+    発行済み伝票履歴をSQLiteに複製する
+
+    syncで前回の同期以降に出荷・発行された伝票だけを取得して送り状番号で更新し、
+    削除済みの伝票には削除フラグを付ける。参照はB2クラウドに問い合わせずにローカルで行う。
+
+    e.g.
+        mirror = HistoryMirror('/tmp/b2cloud/history.sqlite3')
+        mirror.sync(session)
+        entry = mirror.get('123456789012')
+    """
+
+    def __init__(self, path:str=':memory:'):
+        """
+        Args:
+            path(str): SQLiteのファイル。':memory:'の場合はメモリ上に作る
+        """
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def _index_names(self, rows:list):
+        # rows: [(送り状番号, お届け先名)]
+        self._conn.executemany('DELETE FROM history_ngram WHERE tracking_number = ?', ((t,) for t, _ in rows))
+        self._conn.executemany('INSERT INTO history_ngram (gram, tracking_number) VALUES (?, ?)',
+                               ((gram, t) for t, name in rows for gram in ngrams(name or '')))
+
+    def sync(self, session:requests.Session, overlap_days:int=1)->dict:
+        """
+        B2クラウドの履歴を取り込む。初回は過去90日分を全て取得する
+
+        2回目以降は、前回の同期日のoverlap_days日前以降に出荷された伝票と、
+        取り込み済みの最大の送り状番号以降の伝票だけを取得する。
+
+        Args:
+            session(requests.Session): ログイン済みのセッション
+            overlap_days(int): 前回の同期日から遡って取得する日数
+
+        Returns:
+            dict: {'full': 全件取得したか, 'upserted': 更新した件数, 'deleted': 削除済みの件数, 'elapsed': 秒数}
+        """
+        started = time.monotonic()
+        today = datetime.date.today()
+        with self._lock:
+            last_sync = self._get_state('last_sync')
+            max_tracking_number = self._conn.execute('SELECT MAX(tracking_number) FROM history').fetchone()[0]
+        if last_sync is None:
+            full = True
+            entries = list(b2cloud.iter_history(session))
+        else:
+            full = False
+            since = datetime.date.fromisoformat(last_sync) - datetime.timedelta(days=overlap_days)
+            entries = b2cloud.search_history(session, shipment_result_date_from=since)['feed'].get('entry', [])
+            if max_tracking_number is not None:
+                entries += b2cloud.search_history(session, tracking_number_from=max_tracking_number)['feed'].get('entry', [])
+            # 両方の条件に該当した伝票は1回だけ更新する
+            entries = list({entry['shipment']['tracking_number']: entry for entry in entries}.values())
+        deleted = b2cloud.get_history_deleted(session)['feed'].get('entry', [])
+
+        with self._lock, self._conn:
+            now = time.time()
+            self._conn.executemany(UPSERT, (self._row(entry, 0, now) for entry in entries))
+            self._conn.executemany(UPSERT, (self._row(entry, 1, now) for entry in deleted))
+            self._index_names([(e['shipment']['tracking_number'], e['shipment'].get('consignee_name')) for e in entries + deleted])
+            self._conn.execute('INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)',
+                               ('last_sync', today.isoformat()))
+        return {'full': full, 'upserted': len(entries), 'deleted': len(deleted), 'elapsed': time.monotonic() - started}
+
+    @staticmethod
+    def _row(entry:dict, deleted:int, synced_at:float)->tuple:
+        shipment = entry['shipment']
+        return (
+            shipment['tracking_number'],
+            *(_date_key(shipment.get(column)) if column in DATE_COLUMNS else shipment.get(column) for column in COLUMNS),
+            deleted,
+            synced_at,
+            json.dumps(entry, ensure_ascii=False),
+        )
+
+    def _get_state(self, key:str):
+        row = self._conn.execute('SELECT value FROM sync_state WHERE key = ?', (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def get(self, tracking_number:str, include_deleted:bool=False):
+        """
+        送り状番号でentryを取得する
+
+        Returns:
+            dict | None: entry。見つからない場合はNone
+        """
+        sql = 'SELECT entry FROM history WHERE tracking_number = ?'
+        if not include_deleted:
+            sql += ' AND deleted = 0'
+        with self._lock:
+            row = self._conn.execute(sql, (tracking_number,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def count(self, include_deleted:bool=False)->int:
+        """
+        取り込み済みの伝票数
+        """
+        sql = 'SELECT COUNT(*) FROM history'
+        if not include_deleted:
+            sql += ' WHERE deleted = 0'
+        with self._lock:
+            return self._conn.execute(sql).fetchone()[0]
+
+    def search_history(self,
+            service_type=None,
+            consignee_name= None,
+            shipment_plan_from= None,
+            shipment_plan_to= None,
+            tracking_number= None,
+            display_flg= "1",
+            shipment_number= None,
+            invoice_name= None,
+            invoice_code= None,
+            consignee_telephone= None,
+            consignee_name_kana= None,
+            consignee_department1= None,
+            consignee_department2= None,
+            shipper_name= None,
+            shipper_name_kana= None,
+            item_name1= None,
+            item_name2= None,
+            shipment_result_date_from= None,
+            shipment_result_date_to= None,
+            creator_loginid= None,
+            issuer_loginid= None,
+            updater_loginid= None,
+            dangerous_flg= None,
+            issued_date= None,
+            closure_key= None,
+            search_title1= None,
+            search_key1= None,
+            search_title2= None,
+            search_key2= None,
+            search_title3= None,
+            search_key3= None,
+            search_title4= None,
+            search_key4= None,
+            search_title5= None,
+            search_key5 = None,
+            tracking_number_from=None,
+            tracking_number_to=None
+        ):
+        """
+        取り込み済みの履歴をb2cloud.search_historyと同じ条件で検索する
+
+        consignee_nameは部分一致(2文字ずつのインデックスで候補を絞る)、日付と送り状番号の範囲は
+        from以上to以下、それ以外は完全一致。display_flgが"1"なら削除済みを除き、"0"なら削除済みだけ、Noneなら全て
+        search_title1~5はshipmentのsearch_key_title1~5で検索する。UNSUPPORTEDの条件を指定した場合は例外にする
+
+        Returns:
+            dict: {'feed':{'entry':[...]}} 出荷予定日、送り状番号の順
+        """
+        conditions = locals().copy()
+        del conditions['self']
+        where = []
+        args = []
+        display_flg = conditions.pop('display_flg')
+        if display_flg is not None:
+            where.append('deleted = ?')
+            args.append(0 if str(display_flg) == '1' else 1)
+
+        name = conditions.pop('consignee_name')
+        if name:
+            grams = ngrams(name)
+            if grams:
+                where.append('tracking_number IN (SELECT tracking_number FROM history_ngram WHERE gram IN '
+                             f'({", ".join("?" for _ in grams)}) GROUP BY tracking_number HAVING COUNT(DISTINCT gram) = ?)')
+                args.extend(grams)
+                args.append(len(grams))
+            where.append("instr(replace(replace(consignee_name, ' ', ''), '　', ''), ?) > 0")
+            args.append(''.join(name.split()))
+
+        for key, value in conditions.items():
+            if value is None:
+                continue
+            if key in UNSUPPORTED:
+                raise Exception(f'取り込んだ履歴では検索できない条件です.{key}')
+            if key in RANGES:
+                column, op = RANGES[key]
+                where.append(f'{column} {op} ?')
+                args.append(value if key.startswith('tracking_number') else value.strftime('%Y%m%d'))
+            elif key == 'tracking_number' or key in COLUMNS:
+                where.append(f'{key} = ?')
+                args.append(value)
+            else:
+                where.append(f"json_extract(entry, '$.shipment.{FIELDS.get(key, key)}') = ?")
+                args.append(value)
+
+        sql = 'SELECT entry FROM history'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY shipment_date, tracking_number'
+        with self._lock:
+            rows = self._conn.execute(sql, args).fetchall()
+        return {'feed': {'entry': [json.loads(row[0]) for row in rows]}}
+
+    def close(self):
+        self._conn.close()
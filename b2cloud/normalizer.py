@@ -0,0 +1,127 @@
+import re
+import unicodedata
+
+# 全角英数記号 -> 半角、全角スペース -> 半角スペース
+_WIDTH = {code: code - 0xFEE0 for code in range(0xFF01, 0xFF5F)}
+_WIDTH[0x3000] = ' '
+# ハイフンの異体字 -> '-'('ー'は長音のため含めない)
+_HYPHEN = {ord(c): '-' for c in '‐‑‒–—―−﹣－'}
+
+
+def _kana_table()->dict:
+    # 全角カタカナ・ひらがな -> 半角カタカナ(濁点・半濁点は2文字)
+    table = {}
+    for code in range(0xFF61, 0xFFA0):
+        half = chr(code)
+        table[ord(unicodedata.normalize('NFKC', half))] = half
+    for code in range(0x30A1, 0x30FB):
+        full = chr(code)
+        if ord(full) in table:
+            continue
+        base, *marks = unicodedata.normalize('NFD', full)
+        # 濁点(U+3099)、半濁点(U+309A)
+        if ord(base) in table and marks in (['\u3099'], ['\u309a']):
+            table[ord(full)] = table[ord(base)] + ('ﾞ' if marks[0] == '\u3099' else 'ﾟ')
+    for code in range(0x3041, 0x3097):
+        katakana = code + 0x60
+        if katakana in table:
+            table[code] = table[katakana]
+    table[ord('ー')] = 'ｰ'
+    return table
+
+
+TABLES = {
+    'text': str.maketrans({0x3000: ' '}),
+    'address': str.maketrans({**_WIDTH, **_HYPHEN}),
+    'telephone': str.maketrans({**_WIDTH, **_HYPHEN, ord('ー'): '-', ord('ｰ'): '-'}),
+    'zip': str.maketrans(_WIDTH),
+    'kana': str.maketrans({**_WIDTH, **_HYPHEN, **_kana_table()}),
+}
+
+# 変換後に1回で適用するパターン。連続する空白は1つにし、番号に不要な文字は除く
+_PATTERNS = {
+    'text': (re.compile(r'\s+'), ' '),
+    'address': (re.compile(r'\s+|(?<=\d)ー(?=\d)'), lambda m: '-' if m.group() == 'ー' else ' '),
+    'telephone': (re.compile(r'[^0-9-]+'), ''),
+    'zip': (re.compile(r'[^0-9]+'), ''),
+    'kana': (re.compile(r'\s+'), ' '),
+}
+
+# shipmentの項目 -> 変換ルール
+FIELD_RULES = {
+    'consignee_name': 'text',
+    'consignee_department1': 'text',
+    'consignee_department2': 'text',
+    'shipper_name': 'text',
+    'item_name1': 'text',
+    'item_name2': 'text',
+    'consignee_name_kana': 'kana',
+    'shipper_name_kana': 'kana',
+    'consignee_telephone': 'telephone',
+    'consignee_telephone_display': 'telephone',
+    'shipper_telephone': 'telephone',
+    'shipper_telephone_display': 'telephone',
+    'consignee_zip_code': 'zip',
+    'shipper_zip_code': 'zip',
+    'consignee_address': 'address',
+    'consignee_address1': 'address',
+    'consignee_address2': 'address',
+    'consignee_address3': 'address',
+    'consignee_address4': 'address',
+    'shipper_address': 'address',
+    'shipper_address1': 'address',
+    'shipper_address2': 'address',
+    'shipper_address3': 'address',
+    'shipper_address4': 'address',
+}
+
+
+def normalize_column(values, rule:str)->list:
+    """
+    文字列のリストを同じルールで変換する。同じ値は1回だけ変換する
+
+    Args:
+        values: 文字列のiterable。None等の文字列以外はそのまま返す
+        rule(str): 'text':空白の正規化, 'address':英数字・ハイフンを半角に, 'telephone':数字とハイフンのみ,
+            'zip':数字のみ, 'kana':半角カタカナ(consignee_name_kana用)
+
+    Returns:
+        list: 変換後の文字列のリスト
+    """
+    table = TABLES[rule]
+    pattern, repl = _PATTERNS[rule]
+    sub = pattern.sub
+    memo = {}
+    ret = []
+    append = ret.append
+    for value in values:
+        normalized = memo.get(value)
+        if normalized is None:
+            if isinstance(value, str):
+                normalized = sub(repl, value.translate(table)).strip()
+            else:
+                normalized = value
+            memo[value] = normalized
+        append(normalized)
+    return ret
+
+
+def normalize_shipments(shipments:list, fields:dict=None)->list:
+    """
+    shipmentのリストを項目毎にまとめて変換する(shipmentを書き換える)
+
+    Args:
+        shipments(list): {'shipment':{...}}またはshipmentのdictのリスト
+        fields(dict): 項目 -> 変換ルール。省略時はFIELD_RULES
+
+    Returns:
+        list: shipments
+    """
+    fields = FIELD_RULES if fields is None else fields
+    rows = [s['shipment'] if 'shipment' in s else s for s in shipments]
+    for field, rule in fields.items():
+        column = [row.get(field) for row in rows]
+        for row, value in zip(rows, normalize_column(column, rule)):
+            if value is not None:
+                row[field] = value
+    return shipments
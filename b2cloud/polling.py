@@ -0,0 +1,132 @@
+import collections
+import heapq
+import math
+import random
+import time
+from dataclasses import dataclass
+
+import requests
+
+from b2cloud.decoder import decode_response
+
+# 完了した発行ジョブの記録(直近1000件)。ポーリング間隔の調整に使う
+HISTORY = collections.deque(maxlen=1000)
+
+
+@dataclass
+class PollingPolicy:
+    """
+    発行ジョブのポーリング間隔
+
+    Attributes:
+        initial: 最初のポーリングまでの待ち時間(秒)
+        multiplier: ポーリング毎に待ち時間を何倍にするか
+        cap: 待ち時間の上限(秒)
+        deadline: 発行開始から失敗とするまでの時間(秒)
+        jitter: 待ち時間をランダムにずらす割合(0.1なら±10%)
+    """
+    initial: float = 0.1
+    multiplier: float = 1.5
+    cap: float = 2.0
+    deadline: float = 120.0
+    jitter: float = 0.1
+
+    def delay(self, polls:int)->float:
+        """
+        polls回目のポーリング後の待ち時間
+        """
+        if self.multiplier > 1:
+            # capに達した後は同じ待ち時間なので、multiplier ** pollsが桁あふれしないよう回数を抑える
+            if 0 < self.initial < self.cap:
+                polls = min(polls, math.ceil(math.log(self.cap / self.initial, self.multiplier)))
+            else:
+                polls = 0
+        delay = min(self.initial * self.multiplier ** polls, self.cap)
+        if self.jitter:
+            delay *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        return delay
+
+
+DEFAULT_POLICY = PollingPolicy()
+
+
+def poll_issue(session:requests.Session, issue_no:str)->bool:
+    """
+    発行ジョブが完了したか問い合わせる
+
+    Args:
+        session(requests.Session): ログイン済みのセッション
+        issue_no(str): 発行番号
+
+    Returns:
+        bool: 完了していればTrue
+    """
+    res = session.get(f'https://newb2web.kuronekoyamato.co.jp/b2/p/polling?issue_no={issue_no}&service_no=interman')
+    return decode_response(res)['feed']['title'] == "Success"
+
+
+def iter_wait_issues(session:requests.Session, issue_nos:list, policy:PollingPolicy=None):
+    """
+    複数の発行ジョブを1スレッドでポーリングし、完了したものから返す
+
+    Args:
+        session(requests.Session): ログイン済みのセッション
+        issue_nos(list[str]): 発行番号のリスト
+        policy(PollingPolicy): ポーリング間隔
+
+    Yields:
+        dict: {'issue_no': 発行番号, 'success': 完了したか, 'elapsed': 完了までの秒数, 'polls': ポーリング回数}
+            deadlineまでに完了しなかった場合は'success'がFalse
+    """
+    policy = policy or DEFAULT_POLICY
+    started = time.monotonic()
+    # (次にポーリングする時刻, 順番, 発行番号, ポーリング回数)
+    queue = [(started + policy.delay(0), i, issue_no, 0) for i, issue_no in enumerate(issue_nos)]
+    heapq.heapify(queue)
+    while queue:
+        due, i, issue_no, polls = heapq.heappop(queue)
+        wait = due - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        polls += 1
+        success = poll_issue(session, issue_no)
+        elapsed = time.monotonic() - started
+        if success or elapsed >= policy.deadline:
+            result = {'issue_no': issue_no, 'success': success, 'elapsed': elapsed, 'polls': polls}
+            HISTORY.append(result)
+            yield result
+        else:
+            heapq.heappush(queue, (time.monotonic() + policy.delay(polls), i, issue_no, polls))
+
+
+def wait_issues(session:requests.Session, issue_nos:list, policy:PollingPolicy=None)->dict:
+    """
+    複数の発行ジョブの完了を待つ
+
+    Args:
+        session(requests.Session): ログイン済みのセッション
+        issue_nos(list[str]): 発行番号のリスト
+        policy(PollingPolicy): ポーリング間隔
+
+    Returns:
+        dict: 発行番号 -> iter_wait_issuesの結果
+    """
+    return {res['issue_no']: res for res in iter_wait_issues(session, issue_nos, policy)}
+
+
+def wait_issue(session:requests.Session, issue_no:str, policy:PollingPolicy=None)->dict:
+    """
+    発行ジョブの完了を待つ。deadlineまでに完了しない場合は例外
+
+    Args:
+        session(requests.Session): ログイン済みのセッション
+        issue_no(str): 発行番号
+        policy(PollingPolicy): ポーリング間隔
+
+    Returns:
+        dict: iter_wait_issuesの結果
+    """
+    res = next(iter_wait_issues(session, [issue_no], policy))
+    if not res['success']:
+        raise Exception(f"PDFデータ生成に失敗 issue_no:{issue_no} {res['elapsed']:.1f}秒")
+    return res
@@ -0,0 +1,266 @@
+import contextlib
+import queue
+import threading
+import types
+
+import requests
+
+import b2cloud
+from b2cloud.decoder import loads
+
+B2_URL = 'https://newb2web.kuronekoyamato.co.jp'
+
+# 認証エラーのjsonのfeed.titleに含まれる文字列(小文字で比較する)
+AUTH_ERROR_TITLES = ('ログイン', 'login', 'log in', 'authentication', 'unauthorized', 'forbidden')
+
+# 認証エラーのjsonか調べるbodyの大きさの上限。伝票情報を含むレスポンスはデコードしない
+AUTH_ERROR_MAX_BYTES = 4096
+
+
+def is_auth_error_feed(content:bytes)->bool:
+    """
+    APIのjsonが、entryのない認証エラーのfeedか判定する
+
+    Args:
+        content(bytes): レスポンスのbody
+
+    Returns:
+        bool: feed.titleがAUTH_ERROR_TITLESのいずれかを含む場合はTrue
+    """
+    if not content or len(content) > AUTH_ERROR_MAX_BYTES:
+        return False
+    try:
+        feed = loads(content).get('feed')
+    except ValueError:
+        return False
+    if not isinstance(feed, dict) or feed.get('entry'):
+        return False
+    title = str(feed.get('title', '')).lower()
+    return any(word in title for word in AUTH_ERROR_TITLES)
+
+
+def is_session_expired(response:requests.Response, read_body:bool=True)->bool:
+    """
+    B2クラウドのセッションが切れているか判定する。
+    ステータス、URL、Content-Typeで判定し、read_bodyがTrueの場合はAPIが返した認証エラーのjsonも判定する
+
+    Args:
+        response(requests.Response): B2クラウドへのリクエストのレスポンス
+        read_body(bool): bodyを読んで判定するか。stream=Trueのレスポンスでは読まない
+
+    Returns:
+        bool: ログインし直す必要がある場合はTrue
+    """
+    if response.status_code in (401, 403):
+        return True
+    # ログイン画面にリダイレクトされた
+    if not response.url.startswith(B2_URL):
+        return True
+    if '/b2/p/' in response.url:
+        content_type = response.headers.get('Content-Type', '')
+        # APIがjsonの代わりにログイン画面のhtmlを返した
+        if 'text/html' in content_type:
+            return True
+        # APIが認証エラーのjsonを返した
+        if read_body and 'json' in content_type and is_auth_error_feed(response.content):
+            return True
+    return False
+
+
+class B2Session(requests.Session):
+    """
+    セッション切れを検知すると、ログインし直してリクエストを再送するセッション
+
+    b2cloudの各関数にrequests.Sessionの代わりに渡せる。複数のスレッドから同時に使える
+    """
+
+    def __init__(self, customer_code:str, customer_password:str, customer_cls_cocde='', login_user_id='',
+                 pool_maxsize:int=10, max_retries:int=0):
+        """
+        Args:
+            customer_code:お客様コード
+            customer_password:パスワード
+            customer_cls_cocde:お客様コード枝番
+            login_user_id:ログインユーザーID
+            pool_maxsize:ホスト毎に保持するkeep-alive接続の数
+            max_retries:接続エラー時のリトライ回数
+        """
+        super().__init__()
+        self.credentials = (customer_code, customer_password, customer_cls_cocde, login_user_id)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=pool_maxsize, max_retries=max_retries)
+        self.mount('https://', adapter)
+        self.logins = 0
+        self.relogins = 0
+        self._generation = 0
+        self._login_lock = threading.RLock()
+        self._local = threading.local()
+
+    def login(self):
+        """
+        ログインする
+        """
+        with self._login_lock:
+            self._local.logging_in = True
+            try:
+                b2cloud.login(*self.credentials, session=self)
+            finally:
+                self._local.logging_in = False
+            self.logins += 1
+            self._generation += 1
+
+    def request(self, method, url, *args, **kwargs):
+        generation = self._generation
+        response = super().request(method, url, *args, **kwargs)
+        if getattr(self._local, 'logging_in', False) or not url.startswith(B2_URL):
+            return response
+        if not is_session_expired(response, read_body=not kwargs.get('stream', False)):
+            return response
+
+        # generatorのbodyは送信済みのため再送できない
+        data = kwargs.get('data', args[1] if len(args) > 1 else None)
+        if isinstance(data, types.GeneratorType):
+            raise Exception('B2クラウドのセッションが切れました。ストリーミング送信は再送できません。')
+
+        with self._login_lock:
+            # 他のスレッドがログインし直していなければログインする
+            if generation == self._generation:
+                self.cookies.clear()
+                self.login()
+                self.relogins += 1
+        response.close()
+        return super().request(method, url, *args, **kwargs)
+
+
+class B2SessionPool:
+    """
+    ログイン済みのB2Sessionのプール
+
+    e.g.
+        pool = B2SessionPool(customer_code, customer_password, size=4)
+        with pool.session() as session:
+            b2cloud.get_new(session)
+    """
+
+    def __init__(self, customer_code:str, customer_password:str, customer_cls_cocde='', login_user_id='',
+                 size:int=4, pool_maxsize:int=10, max_retries:int=0, session_class=B2Session):
+        """
+        Args:
+            customer_code:お客様コード
+            customer_password:パスワード
+            customer_cls_cocde:お客様コード枝番
+            login_user_id:ログインユーザーID
+            size:プールするセッション数
+            pool_maxsize:セッション毎に保持するkeep-alive接続の数
+            max_retries:接続エラー時のリトライ回数
+            session_class:作成するセッションのクラス(B2Sessionのサブクラス)
+        """
+        self.credentials = (customer_code, customer_password, customer_cls_cocde, login_user_id)
+        self.session_class = session_class
+        self.size = size
+        self.pool_maxsize = pool_maxsize
+        self.max_retries = max_retries
+        self._sessions = []
+        self._creating = 0
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._borrowed = 0
+        self._waits = 0
+
+    def _create(self)->B2Session:
+        session = self.session_class(*self.credentials, pool_maxsize=self.pool_maxsize, max_retries=self.max_retries)
+        session.login()
+        return session
+
+    def warm(self, n:int=None):
+        """
+        n個(省略時はsize個)までセッションを作成してログインしておく
+        """
+        n = self.size if n is None else min(n, self.size)
+        while self._reserve(n):
+            self._idle.put(self._add())
+
+    def _reserve(self, n:int)->bool:
+        # 作成中を含めてn個未満なら1個分の枠を確保する
+        with self._lock:
+            if len(self._sessions) + self._creating >= n:
+                return False
+            self._creating += 1
+            return True
+
+    def _add(self)->B2Session:
+        try:
+            session = self._create()
+            with self._lock:
+                self._sessions.append(session)
+            return session
+        finally:
+            with self._lock:
+                self._creating -= 1
+
+    @contextlib.contextmanager
+    def session(self, timeout:float=None):
+        """
+        セッションを借りる。空きがない場合は、size個まで作成し、それ以上は返却を待つ
+
+        Args:
+            timeout:返却を待つ秒数。Noneの場合は無期限
+
+        Yields:
+            B2Session
+        """
+        session = self._acquire(timeout)
+        try:
+            yield session
+        finally:
+            self._idle.put(session)
+
+    def _acquire(self, timeout):
+        with self._lock:
+            self._borrowed += 1
+            if not self._idle.empty():
+                create = False
+            elif len(self._sessions) + self._creating < self.size:
+                create = True
+                self._creating += 1
+            else:
+                create = False
+                self._waits += 1
+        if create:
+            return self._add()
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise Exception('セッションの空きがありません。') from None
+
+    def stats(self)->dict:
+        """
+        プールの状態を返す
+
+        Returns:
+            dict: {
+                'size': 最大セッション数, 'created': 作成済みのセッション数, 'idle': 空いているセッション数,
+                'borrowed': 貸し出した回数, 'waits': 返却を待った回数,
+                'logins': ログイン回数(再ログインを含む), 'relogins': セッション切れによる再ログイン回数
+            }
+        """
+        with self._lock:
+            sessions = list(self._sessions)
+            return {
+                'size': self.size,
+                'created': len(sessions),
+                'idle': self._idle.qsize(),
+                'borrowed': self._borrowed,
+                'waits': self._waits,
+                'logins': sum(s.logins for s in sessions),
+                'relogins': sum(s.relogins for s in sessions),
+            }
+
+    def close(self):
+        """
+        全てのセッションを閉じる
+        """
+        with self._lock:
+            for session in self._sessions:
+                session.close()
+            self._sessions.clear()
+        self._idle = queue.LifoQueue()
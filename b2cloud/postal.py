@@ -0,0 +1,224 @@
+import collections
+import csv
+import io
+import json
+import re
+import sqlite3
+import threading
+import time
+import zipfile
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+
+# KEN_ALLの町域名のうち、住所に含めないもの
+_NO_TOWN = re.compile(r'^以下に掲載がない場合$|の次に番地がくる場合$')
+_TOWN_NOTE = re.compile(r'（.*?）|（.*$')
+
+
+class PostalCache:
+    """
+    get_postalの結果のキャッシュ(メモリのLRU + 任意でSQLiteのファイル)
+
+    同じ郵便番号を複数のスレッドが同時に問い合わせた場合は、1回だけ取得して結果を共有する。
+    """
+
+    def __init__(self, maxsize:int=4096, ttl:float=86400 * 7, path:str=None):
+        """
+        Args:
+            maxsize(int): メモリに保持する郵便番号の数
+            ttl(float): 有効期間(秒)。Noneの場合は期限なし
+            path(str): SQLiteのファイル。Noneの場合はメモリのみ
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._conn = None
+        if path is not None:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute('CREATE TABLE IF NOT EXISTS postal (code TEXT PRIMARY KEY, fetched_at REAL NOT NULL, feed TEXT NOT NULL)')
+
+    def get(self, session:requests.Session, code:str)->dict:
+        """
+        郵便番号情報を取得する。キャッシュがない、または期限切れの場合はB2クラウドから取得する
+
+        Args:
+            session(requests.Session): ログイン済みのセッション
+            code(str): 郵便番号7桁
+
+        Returns:
+            dict: get_postalの戻り値
+        """
+        with self._lock:
+            feed = self._load(code)
+            if feed is not None:
+                self.hits += 1
+                return feed
+            self.misses += 1
+            future = self._inflight.get(code)
+            leader = future is None
+            if leader:
+                future = self._inflight[code] = Future()
+        if not leader:
+            # 他のスレッドが取得中の場合は、その結果を待つ
+            return future.result()
+
+        try:
+            feed = self._fetch(session, code)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(code, None)
+        self.store(code, feed)
+        future.set_result(feed)
+        return feed
+
+    def _fetch(self, session, code):
+        # b2cloud.utilitiesがこのモジュールをimportするため、呼び出し時にimportする
+        import b2cloud.utilities
+        return b2cloud.utilities.get_postal(session, code)
+
+    def __contains__(self, code:str)->bool:
+        with self._lock:
+            return self._load(code) is not None
+
+    def _load(self, code:str):
+        # self._lockを取得して呼ぶ
+        now = time.time()
+        entry = self._entries.get(code)
+        if entry is None and self._conn is not None:
+            row = self._conn.execute('SELECT fetched_at, feed FROM postal WHERE code = ?', (code,)).fetchone()
+            if row is not None:
+                entry = (row[0], json.loads(row[1]))
+                self._remember(code, entry)
+        if entry is None:
+            return None
+        if self.ttl is not None and now - entry[0] >= self.ttl:
+            return None
+        self._entries.move_to_end(code)
+        return entry[1]
+
+    def _remember(self, code:str, entry:tuple):
+        self._entries[code] = entry
+        self._entries.move_to_end(code)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def store(self, code:str, feed:dict):
+        """
+        郵便番号情報を保存する
+        """
+        self.store_many([(code, feed)])
+
+    def store_many(self, items):
+        """
+        郵便番号情報をまとめて保存する
+
+        Args:
+            items: (郵便番号, 郵便番号情報)のiterable
+        """
+        now = time.time()
+        items = list(items)
+        with self._lock:
+            for code, feed in items:
+                self._remember(code, (now, feed))
+            if self._conn is not None:
+                with self._conn:
+                    self._conn.executemany('INSERT OR REPLACE INTO postal (code, fetched_at, feed) VALUES (?, ?, ?)',
+                                           ((code, now, json.dumps(feed, ensure_ascii=False)) for code, feed in items))
+
+    def prefetch(self, session:requests.Session, codes, max_workers:int=8)->int:
+        """
+        キャッシュにない郵便番号を並列に取得する
+
+        Args:
+            session(requests.Session): ログイン済みのセッション
+            codes: 郵便番号のiterable(重複可)
+            max_workers(int): 同時に取得する数
+
+        Returns:
+            int: 取得した郵便番号の数
+        """
+        unknown = [code for code in dict.fromkeys(codes) if code not in self]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(lambda code: self.get(session, code), unknown))
+        return len(unknown)
+
+    def load_ken_all(self, path)->int:
+        """
+        日本郵便の郵便番号データ(KEN_ALL.CSV、またはそれを含むzip)をキャッシュに読み込む
+
+        Args:
+            path: ファイルのパスまたはファイルオブジェクト
+
+        Returns:
+            int: 読み込んだ郵便番号の数
+        """
+        feeds = {}
+        for address in iter_ken_all(path):
+            entries = feeds.setdefault(address['zip_code'], {'feed': {'entry': []}})['feed']['entry']
+            # 括弧書きを除くと同じ町域になる行はまとめる
+            if {'address': address} not in entries:
+                entries.append({'address': address})
+        self.store_many(feeds.items())
+        return len(feeds)
+
+    def clear(self):
+        """
+        キャッシュを削除する
+        """
+        with self._lock:
+            self._entries.clear()
+            if self._conn is not None:
+                with self._conn:
+                    self._conn.execute('DELETE FROM postal')
+
+
+def _open_ken_all(path):
+    if hasattr(path, 'read'):
+        data = path.read()
+    else:
+        with open(path, 'rb') as f:
+            data = f.read()
+    if data[:2] == b'PK':
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            name = next(n for n in zf.namelist() if n.upper().endswith('.CSV'))
+            data = zf.read(name)
+    return io.StringIO(data.decode('cp932'))
+
+
+def iter_ken_all(path):
+    """
+    KEN_ALL.CSVを読み込み、郵便番号情報のaddressを返す
+    複数行に分かれた町域名は1つにまとめ、括弧書きは除く
+
+    Args:
+        path: KEN_ALL.CSV(またはzip)のパスまたはファイルオブジェクト
+
+    Yields:
+        dict: {'zip_code': 郵便番号, 'address1': 都道府県, 'address2': 市区町村, 'address3': 町域}
+    """
+    pending = None
+    for row in csv.reader(_open_ken_all(path)):
+        zip_code, prefecture, city, town = row[2], row[6], row[7], row[8]
+        if pending is not None:
+            # 前の行の括弧が閉じていない場合は続き
+            pending['address3'] += town
+            if '）' not in town:
+                continue
+            town, address = pending['address3'], pending
+            pending = None
+        else:
+            address = {'zip_code': zip_code, 'address1': prefecture, 'address2': city, 'address3': town}
+            if '（' in town and '）' not in town:
+                pending = address
+                continue
+        address['address3'] = '' if _NO_TOWN.search(town) else _TOWN_NOTE.sub('', town)
+        yield address
@@ -0,0 +1,239 @@
+import json
+import sys
+
+from b2cloud.encoder import flatten_value
+from b2cloud.utilities import create_empty_shipment
+
+# shipmentの項目(create_empty_shipmentの順)
+FIELDS = tuple(sys.intern(field) for field in create_empty_shipment()['shipment'])
+_FIELD_SET = frozenset(FIELDS)
+
+_encode_str = json.encoder.encode_basestring
+
+
+class Shipment:
+    """
+    伝票情報(shipment)
+
+    項目はcreate_empty_shipmentと同じ。設定していない項目は''として扱い、to_dict等の出力には含めない。
+    FIELDS以外の項目(B2クラウドが付加する項目等)はextraに保持する。
+
+    e.g.
+        shipment = Shipment(service_type='3', shipment_date='2023/01/01', consignee_name='テスト')
+        b2cloud.check_shipment(session, shipment.to_dict())
+    """
+    __slots__ = FIELDS + ('extra',)
+
+    def __init__(self, **fields):
+        for field, value in fields.items():
+            self[field] = value
+
+    def __getattr__(self, name):
+        # 設定していない項目
+        if name in _FIELD_SET:
+            return ''
+        if name == 'extra':
+            return None
+        raise AttributeError(name)
+
+    def __getitem__(self, field:str):
+        if field in _FIELD_SET:
+            return getattr(self, field)
+        extra = self.extra
+        return '' if extra is None else extra.get(field, '')
+
+    def __setitem__(self, field:str, value):
+        if field in _FIELD_SET:
+            setattr(self, field, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[sys.intern(field)] = value
+
+    def items(self):
+        """
+        空でない項目の(項目, 値)を返す
+        """
+        for field in FIELDS:
+            value = getattr(self, field)
+            if value != '':
+                yield field, value
+        if self.extra is not None:
+            yield from ((k, v) for k, v in self.extra.items() if v != '')
+
+    def to_dict(self)->dict:
+        """
+        Returns:
+            dict: {'shipment':{空でない項目}}
+        """
+        return {'shipment': dict(self.items())}
+
+    @classmethod
+    def from_dict(cls, entry:dict):
+        """
+        Args:
+            entry(dict): {'shipment':{...}}またはshipmentのdict
+        """
+        return cls(**entry.get('shipment', entry))
+
+    def __eq__(self, other):
+        if not isinstance(other, Shipment):
+            return NotImplemented
+        return dict(self.items()) == dict(other.items())
+
+    def __repr__(self):
+        return f"Shipment({', '.join(f'{k}={v!r}' for k, v in self.items())})"
+
+
+class ShipmentBatch:
+    """
+    複数の伝票情報を項目毎のリストで保持する
+
+    伝票毎のdictを作らずに、post_new_checkonlyに送るjsonや、put_tracking/delete_newで送るfield_listにする。
+
+    e.g.
+        batch = ShipmentBatch()
+        for order in orders:
+            batch.append(service_type='3', consignee_name=order['name'], ...)
+        b2cloud.post_new_checkonly(session, batch)
+    """
+
+    def __init__(self, shipments=None):
+        """
+        Args:
+            shipments: Shipmentまたはdictのiterable
+        """
+        # 項目 -> 伝票毎の値(設定していない伝票は'')
+        self.columns = {}
+        # entryのshipment以外の項目('id', 'link'等) -> 伝票毎の値(ない伝票はNone)
+        self.entry_columns = {}
+        self._length = 0
+        for shipment in shipments or ():
+            self.append(shipment)
+
+    def __len__(self):
+        return self._length
+
+    def append(self, shipment=None, entry:dict=None, **fields):
+        """
+        伝票を追加する
+
+        Args:
+            shipment: Shipment、{'shipment':{...}}またはshipmentのdict
+            entry(dict): entryのshipment以外の項目。{'id':..., 'link':[...]}等
+            fields: shipmentの項目。shipmentと両方指定した場合はfieldsを優先する
+        """
+        if isinstance(shipment, Shipment):
+            values = dict(shipment.items())
+        elif shipment is not None:
+            if 'shipment' in shipment:
+                entry = {**{k: v for k, v in shipment.items() if k != 'shipment'}, **(entry or {})}
+                shipment = shipment['shipment']
+            values = dict(shipment)
+        else:
+            values = {}
+        values.update(fields)
+
+        n = self._length
+        for field, value in values.items():
+            if value == '':
+                continue
+            column = self.columns.get(field)
+            if column is None:
+                column = self.columns[sys.intern(field)] = [''] * n
+            column.append(value)
+        for column in self.columns.values():
+            if len(column) == n:
+                column.append('')
+
+        for key, value in (entry or {}).items():
+            column = self.entry_columns.get(key)
+            if column is None:
+                column = self.entry_columns[key] = [None] * n
+            column.append(value)
+        for column in self.entry_columns.values():
+            if len(column) == n:
+                column.append(None)
+        self._length = n + 1
+
+    def __getitem__(self, i:int)->Shipment:
+        shipment = Shipment()
+        for field, column in self.columns.items():
+            if column[i] != '':
+                shipment[field] = column[i]
+        return shipment
+
+    def __iter__(self):
+        return (self[i] for i in range(self._length))
+
+    def _rows(self):
+        # 伝票毎の空でない(項目, 値)のリスト
+        columns = list(self.columns.items())
+        return ([(field, column[i]) for field, column in columns if column[i] != ''] for i in range(self._length))
+
+    def to_feed(self)->dict:
+        """
+        Returns:
+            dict: {'feed':{'entry':[{'shipment':{...}}]}}
+        """
+        entries = []
+        for i, row in enumerate(self._rows()):
+            entry = {key: column[i] for key, column in self.entry_columns.items() if column[i] is not None}
+            entry['shipment'] = dict(row)
+            entries.append(entry)
+        return {'feed': {'entry': entries}}
+
+    def to_json(self)->bytes:
+        """
+        post_new_checkonlyで送るjson({'feed':{'entry':[...]}})を直接組み立てる
+
+        Returns:
+            bytes: utf-8のjson
+        """
+        entries = []
+        entry_columns = list(self.entry_columns.items())
+        for i, row in enumerate(self._rows()):
+            parts = [f'{_encode_str(key)}:{json.dumps(column[i], ensure_ascii=False)}'
+                     for key, column in entry_columns if column[i] is not None]
+            fields = ','.join([f'{_encode_str(field)}:{_encode_str(value) if type(value) is str else json.dumps(value, ensure_ascii=False)}'
+                               for field, value in row])
+            parts.append(f'"shipment":{{{fields}}}')
+            entries.append('{' + ','.join(parts) + '}')
+        return ('{"feed":{"entry":[' + ','.join(entries) + ']}}').encode('utf-8')
+
+    def to_field_list(self, plan)->list:
+        """
+        create_field_list(plan, self.to_feed())と同じfield_listを直接作る
+
+        Args:
+            plan: compile_templateの戻り値
+
+        Returns:
+            list: b2_encodeに渡すfield_list
+        """
+        _, index, subplans = plan
+        shipment_i = index.get('shipment')
+        entry_columns = [(index[key], subplans[index[key]], column)
+                         for key, column in self.entry_columns.items() if key in index]
+        if shipment_i is not None:
+            shipment_index = subplans[shipment_i][1]
+            columns = [(shipment_index[field], column) for field, column in self.columns.items() if field in shipment_index]
+
+        entries = []
+        for i in range(self._length):
+            entry = [None] * len(index)
+            for j, subplan, column in entry_columns:
+                value = column[i]
+                if value is not None:
+                    entry[j] = flatten_value(subplan, value)
+            if shipment_i is not None:
+                shipment = [None] * len(shipment_index)
+                for j, column in columns:
+                    value = column[i]
+                    if value != '':
+                        shipment[j] = value
+                entry[shipment_i] = shipment
+            entries.append(entry)
+        ret = [None] * 15
+        ret[14] = entries
+        return ret
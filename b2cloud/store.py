@@ -0,0 +1,143 @@
+import json
+import os
+import tempfile
+import time
+
+import requests
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:
+    Fernet = None
+
+from b2cloud.pool import B2_URL, is_session_expired
+
+# 保存するcookieの属性
+COOKIE_ATTRS = ('version', 'name', 'value', 'port', 'domain', 'path', 'secure', 'expires',
+                'discard', 'comment', 'comment_url', 'rfc2109')
+
+
+def generate_key()->bytes:
+    """
+    SessionStoreの暗号化キーを生成する
+    """
+    if Fernet is None:
+        raise Exception('SessionStoreを使うにはcryptographyをインストールしてください。')
+    return Fernet.generate_key()
+
+
+def probe_session(session:requests.Session)->bool:
+    """
+    セッションがB2クラウドにログイン済みか確認する(配送状況更新用のtemplateを取得する)
+
+    Args:
+        session(requests.Session): 確認するセッション
+
+    Returns:
+        bool: ログイン済みならTrue
+    """
+    try:
+        response = session.get(f'{B2_URL}/b2/d/_settings/template')
+    except requests.RequestException:
+        return False
+    if response.status_code != 200 or is_session_expired(response):
+        return False
+    return 'text/html' not in response.headers.get('Content-Type', '')
+
+
+class SessionStore:
+    """
+    ログイン済みセッションのcookieを暗号化してファイルに保存する
+
+    login(..., store=store)に渡すと、保存したcookieが有効な間はログインを省略する。
+    暗号化にはcryptographyのFernetを使う。
+    """
+
+    def __init__(self, path:str, key:bytes, max_age:float=None):
+        """
+        Args:
+            path(str): 保存先のファイル
+            key(bytes): generate_key()で生成した暗号化キー
+            max_age(float): 保存してから有効とする秒数。Noneの場合は確認用のリクエストだけで判定する
+        """
+        if Fernet is None:
+            raise Exception('SessionStoreを使うにはcryptographyをインストールしてください。')
+        self.path = path
+        self.max_age = max_age
+        self._fernet = Fernet(key)
+
+    def save(self, session:requests.Session, account:str=''):
+        """
+        セッションのcookieを保存する
+
+        Args:
+            session(requests.Session): ログイン済みのセッション
+            account(str): 保存したアカウント。loadの際に一致しなければ使わない
+        """
+        cookies = [{attr: getattr(cookie, attr) for attr in COOKIE_ATTRS} | {'rest': cookie._rest}
+                   for cookie in session.cookies]
+        data = json.dumps({'account': account, 'cookies': cookies}).encode('utf-8')
+        token = self._fernet.encrypt(data)
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        # 書き込み途中のファイルを読まないように、一時ファイルに書いてから置き換える
+        fd, tmp = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(token)
+            os.chmod(tmp, 0o600)
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def load(self, session:requests.Session, account:str='')->bool:
+        """
+        保存したcookieをセッションに読み込む
+
+        Args:
+            session(requests.Session): 読み込み先のセッション
+            account(str): 保存したアカウント
+
+        Returns:
+            bool: 読み込めた場合はTrue。ファイルがない、復号できない、期限切れの場合はFalse
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                token = f.read()
+            data = json.loads(self._fernet.decrypt(token, ttl=self.max_age))
+        except (OSError, InvalidToken, ValueError):
+            return False
+        if data['account'] != account:
+            return False
+
+        now = time.time()
+        for attrs in data['cookies']:
+            if attrs['expires'] is not None and attrs['expires'] < now:
+                continue
+            session.cookies.set_cookie(requests.cookies.create_cookie(**attrs))
+        return True
+
+    def restore(self, session:requests.Session, account:str='')->bool:
+        """
+        保存したcookieを読み込み、ログイン済みか確認する。無効な場合はcookieを消す
+
+        Returns:
+            bool: 保存したcookieでB2クラウドを使える場合はTrue
+        """
+        if not self.load(session, account):
+            return False
+        if probe_session(session):
+            return True
+        session.cookies.clear()
+        return False
+
+    def clear(self):
+        """
+        保存したcookieを削除する
+        """
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,192 @@
+import hashlib
+import marshal
+import os
+import re
+import tempfile
+import threading
+import time
+
+import requests
+
+from b2cloud.encoder import compile_template
+
+# templateの先頭に付加されるatomの共通項目
+ATOM_FIELDS = ["author{}", " name", " uri", " email", "category{}", " ___term",
+        " ___scheme", " ___label", "content", " ___src", " ___type", " ______text",
+        "contributor{}", " name", " uri", " email", "id", "link{}", " ___href",
+        " ___rel", " ___type", " ___title", " ___length", "published", "rights",
+        "rights____type", "summary", "summary____type", "title", "title____type",
+        "subtitle", "subtitle____type", "updated"
+    ]
+
+
+def fetch_template(session:requests.Session)->str:
+    """
+    B2クラウドから配送状況更新用のtemplateを取得する
+
+    Args:
+        session(requests.Session): ログイン済みのセッション
+
+    Returns:
+        str: templateの定義(1行1項目)
+    """
+    response = session.get('https://newb2web.kuronekoyamato.co.jp/b2/d/_settings/template')
+    return response.text
+
+
+def parse_template(text:str)->dict:
+    """
+    templateの定義をdictにする(javascriptの解析して実装)
+
+    Args:
+        text(str): fetch_templateで取得したtemplateの定義
+
+    Returns:
+        dict: template
+    """
+    def list2dict(fields):
+        for x in fields:
+            if x[0] == " ":
+                break
+        else:
+            return fields
+
+        ret = {}
+        fname = None
+        for _field in fields:
+            field = re.match(r'\s*[0-9a-zA-Z_]+', _field).group()
+            if field[0] != " ":
+                if fname is not None:
+                    ret[fname] = list2dict(_fields)
+                _fields = {}
+                fname =field
+            else:
+                _fields[field[1:].replace('{}','')] = ""
+        ret[fname] = list2dict(_fields)
+        return ret
+
+    fields = ATOM_FIELDS.copy()
+    fields.extend(text.split('\n'))
+    return list2dict(fields)
+
+
+class TemplateCache:
+    """
+    templateをコンパイルしたplanのキャッシュ(メモリ)
+
+    ttl秒経過するとB2クラウドから再取得し、内容のハッシュが変わっていればコンパイルし直す。
+    同じkeyの取得は1スレッドだけが行い、他のスレッドはその結果を待つ。
+    """
+
+    def __init__(self, ttl:float=None):
+        """
+        Args:
+            ttl(float): 有効期間(秒)。Noneの場合は期限なし
+        """
+        self.ttl = ttl
+        self._entries = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, session:requests.Session, key:str='')->tuple:
+        """
+        planを取得する。キャッシュがない、または期限切れの場合はB2クラウドから取得する
+
+        Args:
+            session(requests.Session): ログイン済みのセッション
+            key(str): キャッシュのkey。アカウント毎にtemplateを分ける場合に指定する
+
+        Returns:
+            tuple: compile_templateの戻り値
+        """
+        entry = self.load(key)
+        if self._is_fresh(entry):
+            return entry['plan']
+
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            # 待っている間に他のスレッドが取得済みの場合
+            entry = self.load(key)
+            if self._is_fresh(entry):
+                return entry['plan']
+
+            text = fetch_template(session)
+            digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+            if entry is not None and entry['digest'] == digest:
+                # 内容に変更がなければコンパイル済みのplanを使う
+                plan = entry['plan']
+            else:
+                plan = compile_template(parse_template(text))
+            self.store(key, {'fetched_at': time.time(), 'digest': digest, 'plan': plan})
+            return plan
+
+    def clear(self):
+        """
+        キャッシュを削除する
+        """
+        self._entries.clear()
+
+    def load(self, key:str):
+        return self._entries.get(key)
+
+    def store(self, key:str, entry:dict):
+        self._entries[key] = entry
+
+    def _is_fresh(self, entry):
+        if entry is None:
+            return False
+        return self.ttl is None or time.time() - entry['fetched_at'] < self.ttl
+
+
+class FileTemplateCache(TemplateCache):
+    """
+    templateをコンパイルしたplanのキャッシュ(ディスク)
+
+    planはmarshal形式で保存するため、プロセスの起動直後でもB2クラウドへの問い合わせなしで読み込める。
+    ファイルが読めない場合(Pythonのバージョン違い等)は、B2クラウドから取得し直す。
+    """
+
+    def __init__(self, directory:str, ttl:float=86400):
+        """
+        Args:
+            directory(str): 保存先のディレクトリ
+            ttl(float): 有効期間(秒)。Noneの場合は期限なし
+        """
+        super().__init__(ttl=ttl)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key:str)->str:
+        name = hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.directory, f'b2_template_{name}.marshal')
+
+    def load(self, key:str):
+        entry = self._entries.get(key)
+        if entry is not None:
+            return entry
+        try:
+            with open(self.path(key), 'rb') as f:
+                entry = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        self._entries[key] = entry
+        return entry
+
+    def store(self, key:str, entry:dict):
+        self._entries[key] = entry
+        # 書き込み途中のファイルを読まないように、一時ファイルに書いてから置き換える
+        fd, tmp = tempfile.mkstemp(dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                marshal.dump(entry, f)
+            os.replace(tmp, self.path(key))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def clear(self):
+        super().clear()
+        for name in os.listdir(self.directory):
+            if name.startswith('b2_template_'):
+                os.unlink(os.path.join(self.directory, name))
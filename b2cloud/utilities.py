@@ -1,11 +1,29 @@
+import collections
 import math
-from difflib import SequenceMatcher
-import json
+import os
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
 import fitz
 import re
 
+from b2cloud.decoder import decode_response
+from b2cloud.matcher import get_matcher
+from b2cloud.postal import PostalCache
+
+# get_address_infoが使う郵便番号情報のキャッシュ
+POSTAL_CACHE = PostalCache()
+
+ADDRESSIAN_URL = 'https://s32y6jl1f8.execute-api.ap-northeast-1.amazonaws.com/api/address_normalizer'
+
+# addressianの正規化結果のキャッシュ(住所 -> 正規化結果、直近ADDRESSIAN_CACHE_SIZE件)
+ADDRESSIAN_CACHE = collections.OrderedDict()
+ADDRESSIAN_CACHE_SIZE = 10000
+_ADDRESSIAN_LOCK = threading.Lock()
+
 def normalize_and_trim_whitespace_in_text(text: str):
     """
     文字列を正規化し、全角スペースを半角スペースに変換し、連続したスペースを1つにし、
@@ -38,7 +56,22 @@ def get_postal(session:requests.Session, code:str):
     url = 'https://newb2web.kuronekoyamato.co.jp/b2/p/_postal'
     params = {'code':code}
     response = session.get(url, params=params)
-    return json.loads(response.text)
+    return decode_response(response)
+
+
+def prefetch_postals(session:requests.Session, codes, max_workers:int=8)->int:
+    """
+    郵便番号情報をPOSTAL_CACHEに並列に取得しておく。get_address_infoを大量に呼ぶ前に使う
+
+    Args:
+        session(requests.Session): ログイン済みのセッション
+        codes: 郵便番号7桁のiterable(重複可)
+        max_workers(int): 同時に取得する数
+
+    Returns:
+        int: 新たに取得した郵便番号の数
+    """
+    return POSTAL_CACHE.prefetch(session, codes, max_workers)
 
 
 def create_dm_shipment(
@@ -198,39 +231,213 @@ def create_empty_shipment():
     }
 
 
-def split_pdf_dm(pdf_data:bytes, length:int):
+def sheet_rects(cols:int, rows:int, left:float, top:float, pitch_x:float, pitch_y:float, width:float, height:float):
     """
-    DMの伝票pdfデータを伝票毎に分割する
+    1シートの伝票の位置を左上から右、下の順に返す
 
     Args:
-        pdf_data:DMのPDFデータ
-        length:分割数
+        cols, rows: 列数、行数
+        left, top: 左上の伝票の位置
+        pitch_x, pitch_y: 伝票の間隔
+        width, height: 伝票の大きさ
 
     Returns:
-        list[bytes]: 分割されたPDFデータ
+        list[fitz.Rect]: 伝票の位置
     """
     ret = []
+    for row_num in range(rows):
+        for col_num in range(cols):
+            x = left + pitch_x * col_num
+            y = top + pitch_y * row_num
+            ret.append(fitz.Rect(x, y, x + width, y + height))
+    return ret
+
+
+# print_type毎の1シートの伝票の配置(sheet_rectsの引数)
+LAYOUTS = {
+    # DM(1シート8枚) 250x200
+    '3': {'cols': 2, 'rows': 4, 'left': 50, 'top': 30, 'pitch_x': 250, 'pitch_y': 204, 'width': 250, 'height': 200},
+    # ネコポス(1シート6枚) 265x255
+    '7': {'cols': 2, 'rows': 3, 'left': 20, 'top': 35, 'pitch_x': 272, 'pitch_y': 263, 'width': 265, 'height': 255},
+    # A4マルチ(1シート2枚) A4の上下
+    'm': {'cols': 1, 'rows': 2, 'left': 0, 'top': 0, 'pitch_x': 595, 'pitch_y': 421, 'width': 595, 'height': 421},
+    # A5マルチ(1シート1枚) A5全体
+    'm5': {'cols': 1, 'rows': 1, 'left': 0, 'top': 0, 'pitch_x': 420, 'pitch_y': 595, 'width': 420, 'height': 595},
+}
+
+
+def register_layout(print_type:str, cols:int, rows:int, left:float, top:float, pitch_x:float, pitch_y:float, width:float, height:float):
+    """
+    print_typeの伝票の配置を登録する。登録済みの場合は上書きする
+
+    Args:
+        print_type: print_issueのprint_type
+        その他: sheet_rectsの引数
+    """
+    LAYOUTS[print_type] = {
+        'cols': cols, 'rows': rows, 'left': left, 'top': top,
+        'pitch_x': pitch_x, 'pitch_y': pitch_y, 'width': width, 'height': height
+    }
+
+
+def layout_rects(print_type:str):
+    """
+    print_typeの1シートの伝票の位置を返す
+
+    Args:
+        print_type: print_issueのprint_type
+
+    Returns:
+        list[fitz.Rect]: 伝票の位置
+    """
+    if print_type not in LAYOUTS:
+        raise Exception(f'print_type:{print_type}の伝票の配置が登録されていません。')
+    return sheet_rects(**LAYOUTS[print_type])
+
+
+# DM(1シート8枚)の伝票の位置
+DM_RECTS = layout_rects('3')
+# ネコポス(1シート6枚)の伝票の位置
+NEKOPOS_RECTS = layout_rects('7')
+
+def _count_labels(doc, rects:list)->int:
+    # 最後のシートは空き(文字のない位置)を除く
+    if len(doc) == 0:
+        return 0
+    page = doc[-1]
+    used = [i for i, rect in enumerate(rects) if page.get_text('text', clip=rect).strip()]
+    return (len(doc) - 1) * len(rects) + (used[-1] + 1 if used else 0)
+
+
+def count_labels(pdf_data:bytes, print_type:str)->int:
+    """
+    伝票pdfデータに含まれる伝票数を数える。最後のシートの空きは数えない
+
+    Args:
+        pdf_data:伝票のPDFデータ
+        print_type: print_issueのprint_type
+
+    Returns:
+        int: 伝票数
+    """
+    with fitz.open(stream=pdf_data, filetype="pdf") as doc:
+        return _count_labels(doc, layout_rects(print_type))
+
+
+def iter_split_pdf(pdf_data:bytes, rects:list, length:int=None):
+    """
+    伝票pdfデータを伝票毎に分割する。
+    シート毎に1度だけページを取り出し、伝票毎にCropBoxを設定して書き出す。
+    各PDFデータはシートのフォントや画像を含むため、まとめて扱う場合はsplit_pdf_to_pagesの方が小さく速い
+
+    Args:
+        pdf_data:伝票のPDFデータ
+        rects:1シートの伝票の位置(sheet_rects、layout_rectsの戻り値)
+        length:分割数。Noneの場合はPDFデータから数える(最後のシートの空きは除く)
+
+    Yields:
+        bytes: 分割されたPDFデータ
+    """
     doc = fitz.open(stream=pdf_data, filetype="pdf")
-    for i in range(length):
-        # 対応する伝票のページ、列、行を算出
-        page_num = math.floor(i / 8)
-        row_num = math.floor((i % 8) / 2)
-        col_num = i % 2
-        page = doc[page_num]
-
-        # 250x200のboxで切り抜く
-        rect = fitz.Rect(
-            50 + 250 * col_num,
-            30 + 204 * row_num,
-            50 + 250 * col_num + 250,
-            30 + 204 * row_num + 200)
-        page.set_cropbox(rect)
+    if length is None:
+        length = _count_labels(doc, rects)
+    for page_num in range(math.ceil(length / len(rects))):
         _doc = fitz.open()
         _doc.insert_pdf(doc, from_page=page_num, to_page=page_num)
-        ret.append(_doc.tobytes())
+        page = _doc[0]
+        for rect in rects[:length - page_num * len(rects)]:
+            page.set_cropbox(rect)
+            yield _doc.tobytes()
+        _doc.close()
+    doc.close()
+
+
+def split_pdf_to_pages(pdf_data:bytes, rects:list, length:int=None)->bytes:
+    """
+    伝票pdfデータを1ページ1伝票のPDFデータにする。
+    フォントや画像は全ページで共有されるため、伝票毎に分割するよりも小さく速い
+
+    Args:
+        pdf_data:伝票のPDFデータ
+        rects:1シートの伝票の位置(sheet_rects、layout_rectsの戻り値)
+        length:伝票数。Noneの場合はPDFデータから数える(最後のシートの空きは除く)
+
+    Returns:
+        bytes: PDFデータ
+    """
+    doc = fitz.open(stream=pdf_data, filetype="pdf")
+    if length is None:
+        length = _count_labels(doc, rects)
+    ret = fitz.open()
+    for i in range(length):
+        rect = rects[i % len(rects)]
+        page = ret.new_page(width=rect.width, height=rect.height)
+        page.show_pdf_page(page.rect, doc, i // len(rects), clip=rect)
+    return ret.tobytes(garbage=1, deflate=True)
+
+
+def write_labels(labels, directory:str=None, zip_file=None, filename:str='label_{:05d}.pdf'):
+    """
+    分割した伝票のPDFデータをディレクトリまたはzipに書き出す
+
+    Args:
+        labels(Iterable[bytes]): iter_split_pdfの戻り値
+        directory: 書き出すディレクトリ
+        zip_file: 書き出すzipファイルのパスまたはファイルオブジェクト
+        filename: ファイル名の書式。伝票の番号(0から)で書式化する
+
+    Returns:
+        list[str]: 書き出したファイル名
+    """
+    if (directory is None) == (zip_file is None):
+        raise ValueError('directoryかzip_fileのどちらかを指定してください。')
+    ret = []
+    if directory is not None:
+        os.makedirs(directory, exist_ok=True)
+        for i, label in enumerate(labels):
+            path = os.path.join(directory, filename.format(i))
+            with open(path, 'wb') as f:
+                f.write(label)
+            ret.append(path)
+        return ret
+    # PDFは圧縮済みなので無圧縮で格納する
+    with zipfile.ZipFile(zip_file, 'w', compression=zipfile.ZIP_STORED) as zf:
+        for i, label in enumerate(labels):
+            name = filename.format(i)
+            zf.writestr(name, label)
+            ret.append(name)
     return ret
 
 
+def split_pdf(pdf_data:bytes, print_type:str, length:int=None):
+    """
+    伝票pdfデータをprint_typeの伝票の配置に従って伝票毎に分割する
+
+    Args:
+        pdf_data:伝票のPDFデータ
+        print_type: print_issueのprint_type
+        length:分割数。print_issueに渡したentry数。Noneの場合はPDFデータから数える
+
+    Returns:
+        list[bytes]: 分割されたPDFデータ
+    """
+    return list(iter_split_pdf(pdf_data, layout_rects(print_type), length))
+
+
+def split_pdf_dm(pdf_data:bytes, length:int):
+    """
+    DMの伝票pdfデータを伝票毎に分割する
+
+    Args:
+        pdf_data:DMのPDFデータ
+        length:分割数
+
+    Returns:
+        list[bytes]: 分割されたPDFデータ
+    """
+    return split_pdf(pdf_data, '3', length)
+
+
 def split_pdf_nekopos(pdf_data:bytes, length:int):
     """
     ネコポスの伝票pdfデータを伝票毎に分割する
@@ -242,26 +449,7 @@ def split_pdf_nekopos(pdf_data:bytes, length:int):
     Returns:
         list[bytes]: 分割されたPDFデータ
     """
-    ret = []
-    doc = fitz.open(stream=pdf_data, filetype="pdf")
-    for i in range(length):
-        # 対応する伝票のページ、列、行を算出
-        page_num = math.floor(i / 6)
-        row_num = math.floor((i % 6) / 2)
-        col_num = i % 2
-        page = doc[page_num]
-
-        # 250x200のboxで切り抜く
-        rect = fitz.Rect(
-            20 + 272 * col_num,
-            35 + 263 * row_num,
-            20 + 272 * col_num + 265,
-            35 + 263 * row_num + 255)
-        page.set_cropbox(rect)
-        _doc = fitz.open()
-        _doc.insert_pdf(doc, from_page=page_num, to_page=page_num)
-        ret.append(_doc.tobytes())
-    return ret
+    return split_pdf(pdf_data, '7', length)
 
 
 def choice_postal(postal_feed:dict, address:str):
@@ -272,57 +460,92 @@ def choice_postal(postal_feed:dict, address:str):
         postal_feed(dict): get_postalで取得した郵便番号情報
         address: マッチングさせる住所
     """
-    ret = None
-    max_ratio = 0
-    for postal in postal_feed['feed']['entry']:
-        _address = postal['address']['address1'] + postal['address']['address2'] + postal['address']['address3']
-        ratio = SequenceMatcher(None, address, _address).ratio()
-        if ratio > max_ratio:
-            max_ratio = ratio
-            ret = postal
-    return ret
+    return get_matcher(postal_feed).choose(address)
 
 
-def get_address_info(session:requests.Session, addressian_api_key:str, address:str, zip_code=None, prefix='consignee'):
+def choice_postals(postal_feed:dict, addresses:list)->list:
     """
-    住所情報を取得する
+    同じ郵便番号の複数の住所について、それぞれ最適な情報を取得する
+
+    Args:
+        postal_feed(dict): get_postalで取得した郵便番号情報
+        addresses: マッチングさせる住所のリスト
+    """
+    return get_matcher(postal_feed).choose_many(addresses)
+
+
+class RateLimiter:
+    """
+    1秒あたりrate回までに呼び出しを制限する(複数スレッドで共有できる)
+    """
+
+    def __init__(self, rate:float):
+        """
+        Args:
+            rate(float): 1秒あたりの回数。0の場合は制限しない
+        """
+        self.interval = 1 / rate if rate else 0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """
+        前回の呼び出しからinterval秒経つまで待つ
+        """
+        with self._lock:
+            now = time.monotonic()
+            at = max(now, self._next)
+            self._next = at + self.interval
+        if at > now:
+            time.sleep(at - now)
+
+
+def normalize_address(addressian_api_key:str, address:str, http=requests)->dict:
+    """
+    addressianで住所を正規化する。結果はADDRESSIAN_CACHEにキャッシュする
 
     Args:
-        session:
         addressian_api_key: addressianのapi_key
-        address: 変換対象の住所
-        zip_code:郵便番号7桁 zip_codeを強制します。
-        prefix: 戻り値につける接頭文字 consignee, shipper等
+        address: 正規化する住所
+        http: requestsまたはrequests.Session
 
     Returns:
-        dict: 住所情報
-        {
-            '{prefix}_zip_code': 郵便番号,
-            '{prefix}_address1': 都道府県,
-            '{prefix}_address2': 市区,
-            '{prefix}_address3': 町村+番地,
-            '{prefix}_address4': ビル・マンション等
-        }
+        dict: addressianの正規化結果
     """
+    with _ADDRESSIAN_LOCK:
+        normalized = ADDRESSIAN_CACHE.get(address)
+        if normalized is not None:
+            ADDRESSIAN_CACHE.move_to_end(address)
+            return normalized
     params = {
         'key':addressian_api_key,
         'address':address,
         'format':'json'
     }
-    res_json = requests.get(f'https://s32y6jl1f8.execute-api.ap-northeast-1.amazonaws.com/api/address_normalizer', params=params).json()
+    res_json = http.get(ADDRESSIAN_URL, params=params).json()
     if res_json.get('message') is not None:
         raise Exception(f'addressianエラー:{res_json}')
     normalized = res_json['items'][0]
     # 住所が不明な場合は例外で終了
     if normalized['success'] == False:
         raise Exception(f'addressianエラー:不明な住所です.{address}')
+    with _ADDRESSIAN_LOCK:
+        ADDRESSIAN_CACHE[address] = normalized
+        while len(ADDRESSIAN_CACHE) > ADDRESSIAN_CACHE_SIZE:
+            ADDRESSIAN_CACHE.popitem(last=False)
+    return normalized
+
+
+def _address_info(session:requests.Session, normalized:dict, address:str, zip_code, prefix:str)->dict:
     # 郵便番号が指定されている場合は、優先する（事業所専用の郵便番号等）
     if zip_code is None:
         zip_code = normalized['zip_code']
-    # b2クラウドの郵便番号情報を取得する
-    postal_feed = get_postal(session, zip_code)
+    # b2クラウドの郵便番号情報を取得する(キャッシュがあれば使う)
+    postal_feed = POSTAL_CACHE.get(session, zip_code)
     # 住所と最も一致度の高い郵便情報を選択する
     postal = choice_postal(postal_feed, address)
+    if postal is None:
+        raise Exception(f'郵便番号情報がありません.{zip_code}')
     # 住所情報を組み立てて、戻す
     return {
         f'{prefix}_zip_code': postal['address']['zip_code'],
@@ -330,4 +553,117 @@ def get_address_info(session:requests.Session, addressian_api_key:str, address:s
         f'{prefix}_address2': postal['address']['address2'],
         f'{prefix}_address3': normalized['town_type2'] + normalized['custom_type2'],
         f'{prefix}_address4': normalized['building']
-    }
\ No newline at end of file
+    }
+
+
+def get_address_info(session:requests.Session, addressian_api_key:str, address:str, zip_code=None, prefix='consignee'):
+    """
+    住所情報を取得する
+
+    Args:
+        session:
+        addressian_api_key: addressianのapi_key
+        address: 変換対象の住所
+        zip_code:郵便番号7桁 zip_codeを強制します。
+        prefix: 戻り値につける接頭文字 consignee, shipper等
+
+    Returns:
+        dict: 住所情報
+        {
+            '{prefix}_zip_code': 郵便番号,
+            '{prefix}_address1': 都道府県,
+            '{prefix}_address2': 市区,
+            '{prefix}_address3': 町村+番地,
+            '{prefix}_address4': ビル・マンション等
+        }
+    """
+    normalized = normalize_address(addressian_api_key, address)
+    return _address_info(session, normalized, address, zip_code, prefix)
+
+
+def get_address_infos(session:requests.Session, addressian_api_key:str, addresses:list, zip_codes:list=None,
+                      prefix='consignee', max_workers:int=8, rate:float=10.0, http:requests.Session=None)->list:
+    """
+    複数の住所情報をまとめて取得する
+
+    空白を整えた住所が同じものは1回だけ変換する。addressianと郵便番号情報の取得は、
+    接続を使い回しながら並列に行い、addressianへのリクエストは1秒あたりrate回までにする。
+    1件の失敗で中断せず、住所毎に結果を返す。
+
+    Args:
+        session(requests.Session): ログイン済みのセッション
+        addressian_api_key: addressianのapi_key
+        addresses: 変換対象の住所のリスト
+        zip_codes: 住所毎に強制する郵便番号のリスト(Noneの要素は強制しない)
+        prefix: 戻り値につける接頭文字 consignee, shipper等
+        max_workers(int): 同時に問い合わせる数
+        rate(float): addressianへの1秒あたりのリクエスト数の上限。0の場合は制限しない
+        http(requests.Session): addressianへの接続に使うセッション。Noneの場合はmax_workers本の接続を持つセッションを作る
+
+    Returns:
+        list[dict]: addressesの順の結果
+            {
+                'index': addressesでの位置,
+                'status': 'ok' | 'error',
+                'errors': エラーメッセージのリスト,
+                'address_info': get_address_infoの戻り値
+            }
+    """
+    if zip_codes is None:
+        zip_codes = [None] * len(addresses)
+    keys = [(normalize_and_trim_whitespace_in_text(address), zip_code) for address, zip_code in zip(addresses, zip_codes)]
+    unique = list(dict.fromkeys(keys))
+    limiter = RateLimiter(rate)
+
+    def normalize(address):
+        with _ADDRESSIAN_LOCK:
+            cached = address in ADDRESSIAN_CACHE
+        if not cached:
+            limiter.wait()
+        return normalize_address(addressian_api_key, address, http)
+
+    def resolve(future):
+        # 例外は結果として返す
+        try:
+            return future.result()
+        except Exception as e:
+            return e
+
+    # 作成したセッションは終了時に閉じる
+    own_http = http is None
+    if own_http:
+        http = requests.Session()
+        http.mount('https://', requests.adapters.HTTPAdapter(pool_maxsize=max_workers))
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # addressianで正規化する
+            futures = {address: executor.submit(normalize, address) for address in dict.fromkeys(a for a, _ in unique)}
+            normalized = {address: resolve(future) for address, future in futures.items()}
+            # 郵便番号情報をまとめて取得しておく
+            # 郵便番号のない住所は取得せず、住所毎の結果でエラーにする
+            codes = {zip_code or normalized[address].get('zip_code') for address, zip_code in unique
+                     if not isinstance(normalized[address], Exception)}
+            codes.discard(None)
+            codes.discard('')
+            futures = {code: executor.submit(POSTAL_CACHE.get, session, code) for code in codes}
+            postals = {code: resolve(future) for code, future in futures.items()}
+    finally:
+        if own_http:
+            http.close()
+
+    results = {}
+    for address, zip_code in unique:
+        try:
+            if isinstance(normalized[address], Exception):
+                raise normalized[address]
+            code = zip_code or normalized[address].get('zip_code')
+            if not code:
+                raise Exception(f'郵便番号がありません.{address}')
+            postal = postals[code]
+            if isinstance(postal, Exception):
+                raise postal
+            info = _address_info(session, normalized[address], address, zip_code, prefix)
+            results[address, zip_code] = {'status': 'ok', 'errors': [], 'address_info': info}
+        except Exception as e:
+            results[address, zip_code] = {'status': 'error', 'errors': [str(e)], 'address_info': None}
+    return [{'index': i, **results[key]} for i, key in enumerate(keys)]
@@ -0,0 +1,198 @@
+import datetime
+import re
+
+import requests
+
+import b2cloud
+from b2cloud.shipment import ShipmentBatch
+
+# 伝票種別 0:発払い,3:ＤＭ便,4:タイム,5:着払い,7:ネコポス,8:宅急便コンパクト
+SERVICE_TYPES = ('0', '3', '4', '5', '7', '8')
+# お届け予定日・配達時間帯を指定できない伝票種別(ＤＭ便、ネコポス)
+NO_DELIVERY_DATE = ('3', '7')
+# クールを指定できない伝票種別(ＤＭ便、ネコポス、宅急便コンパクト)
+NO_COOL = ('3', '7', '8')
+
+# 項目毎のルール
+# 必須はcreate_empty_shipmentの「# 必須」に合わせる
+#   required: 必須。Trueまたは必須となる伝票種別のtuple
+#   max_length: 最大の長さ(半角換算。全角は2)
+#   pattern: 値が一致すべき正規表現
+#   choices: 指定できる値
+#   date: 日付(yyyy/mm/dd)
+RULES = {
+    'service_type': {'required': True, 'choices': SERVICE_TYPES},
+    'shipment_date': {'required': True, 'date': True},
+    'delivery_date': {'date': True},
+    'is_cool': {'choices': ('0', '1', '2')},
+    'shipment_number': {'max_length': 50},
+    'invoice_code': {'required': ('0',), 'pattern': r'[0-9]{10,12}'},
+    'invoice_freight_no': {'required': ('0',), 'pattern': r'[0-9]{2}'},
+    'consignee_telephone_display': {'required': True, 'max_length': 15, 'pattern': r'[0-9-]+'},
+    'consignee_name': {'required': True, 'max_length': 32},
+    'consignee_zip_code': {'required': True, 'pattern': r'[0-9]{3}-?[0-9]{4}'},
+    'consignee_address1': {'required': True, 'max_length': 10},
+    'consignee_address2': {'required': True, 'max_length': 24},
+    'consignee_address3': {'max_length': 32},
+    'consignee_address4': {'max_length': 32},
+    'consignee_department1': {'max_length': 50},
+    'consignee_department2': {'max_length': 50},
+    'consignee_name_kana': {'max_length': 50, 'pattern': r'[｡-ﾟ 0-9A-Za-z().-]*'},
+    'item_name1': {'required': ('0', '4', '5', '7', '8'), 'max_length': 50},
+    'item_name2': {'max_length': 50},
+    'shipper_telephone_display': {'max_length': 15, 'pattern': r'[0-9-]+'},
+    'shipper_zip_code': {'pattern': r'[0-9]{3}-?[0-9]{4}'},
+    'shipper_name': {'max_length': 32},
+}
+
+
+def _error(field:str, code:str, description:str)->dict:
+    # post_new_checkonlyのerrorと同じ形
+    return {'error_property_name': field, 'error_code': code, 'error_description': description}
+
+
+def _width(value:str)->int:
+    # 半角換算の長さ(cp932のバイト数)
+    return len(value.encode('cp932', errors='replace'))
+
+
+def _is_date(value:str)->bool:
+    try:
+        datetime.datetime.strptime(value, '%Y/%m/%d')
+    except ValueError:
+        return False
+    return True
+
+
+def compile_rules(rules:dict)->list:
+    """
+    RULESの形式のルールを、列毎のチェック関数にする
+
+    Returns:
+        list[tuple]: (項目, check(value, service_type) -> エラーのリスト)
+    """
+    checks = []
+    for field, rule in rules.items():
+        required = rule.get('required')
+        max_length = rule.get('max_length')
+        pattern = re.compile(rule['pattern']).fullmatch if 'pattern' in rule else None
+        choices = frozenset(rule['choices']) if 'choices' in rule else None
+        date = rule.get('date', False)
+
+        def check(value, service_type, field=field, required=required, max_length=max_length,
+                  pattern=pattern, choices=choices, date=date):
+            if value is None or value == '':
+                if required is True or (required and service_type in required):
+                    return [_error(field, 'REQUIRED', f'{field}は必須です。')]
+                return ()
+            if not isinstance(value, str):
+                return [_error(field, 'TYPE', f'{field}は文字列で指定してください。')]
+            errors = []
+            if choices is not None and value not in choices:
+                errors.append(_error(field, 'CHOICE', f'{field}に指定できない値です。{value}'))
+            if max_length is not None and _width(value) > max_length:
+                errors.append(_error(field, 'MAX_LENGTH', f'{field}は半角{max_length}文字以内で指定してください。'))
+            if pattern is not None and not pattern(value):
+                errors.append(_error(field, 'FORMAT', f'{field}の形式が正しくありません。{value}'))
+            if date and not _is_date(value):
+                errors.append(_error(field, 'DATE', f'{field}はyyyy/mm/ddの日付で指定してください。{value}'))
+            return errors
+
+        checks.append((field, check))
+    return checks
+
+
+def _check_combination(shipment:dict)->list:
+    # 複数の項目にまたがるチェック
+    errors = []
+    service_type = shipment.get('service_type')
+    if service_type in NO_DELIVERY_DATE:
+        for field in ('delivery_date', 'delivery_time_zone'):
+            if shipment.get(field):
+                errors.append(_error(field, 'SERVICE_TYPE', f'この伝票種別では{field}を指定できません。'))
+    if service_type in NO_COOL and shipment.get('is_cool') not in (None, '', '0'):
+        errors.append(_error('is_cool', 'SERVICE_TYPE', 'この伝票種別ではクールを指定できません。'))
+    delivery_date = shipment.get('delivery_date')
+    shipment_date = shipment.get('shipment_date')
+    if delivery_date and shipment_date and _is_date(delivery_date) and _is_date(shipment_date) \
+            and delivery_date < shipment_date:
+        errors.append(_error('delivery_date', 'DATE', 'お届け予定日が出荷予定日より前です。'))
+    return errors
+
+
+CHECKS = compile_rules(RULES)
+
+
+def _rows(shipments)->list:
+    # {'shipment':{...}}、shipmentのdict、Shipment、ShipmentBatchを項目 -> 値のdictのリストにする
+    if hasattr(shipments, 'to_feed'):
+        shipments = shipments.to_feed()['feed']['entry']
+    rows = []
+    for shipment in shipments:
+        if hasattr(shipment, 'items') and not isinstance(shipment, dict):
+            rows.append(dict(shipment.items()))
+        else:
+            rows.append(shipment.get('shipment', shipment))
+    return rows
+
+
+def validate_shipments(shipments, checks:list=None)->list:
+    """
+    伝票情報をB2クラウドに送らずにチェックする(必須項目、長さ、形式、伝票種別との組み合わせ)
+
+    Args:
+        shipments: 伝票情報のリスト、またはShipmentBatch
+        checks: compile_rulesの戻り値。省略時はRULES
+
+    Returns:
+        list[dict]: check_shipmentsと同じ形の結果 {'success': bool, 'errors': [エラー]}
+    """
+    rows = _rows(shipments)
+    checks = CHECKS if checks is None else checks
+    service_types = [row.get('service_type') for row in rows]
+    errors = [[] for _ in rows]
+    # 項目毎にまとめてチェックする
+    for field, check in checks:
+        for row_errors, value, service_type in zip(errors, (row.get(field) for row in rows), service_types):
+            found = check(value, service_type)
+            if found:
+                row_errors.extend(found)
+    for row_errors, row in zip(errors, rows):
+        row_errors.extend(_check_combination(row))
+    return [{'success': not row_errors, 'errors': row_errors} for row_errors in errors]
+
+
+def validate_shipment(shipment, checks:list=None)->dict:
+    """
+    伝票情報をB2クラウドに送らずにチェックする
+
+    Returns:
+        dict: check_shipmentと同じ形の結果 {'success': bool, 'errors': [エラー]}
+    """
+    return validate_shipments([shipment], checks)[0]
+
+
+def check_shipments(session:requests.Session, shipments:list, checks:list=None)->list:
+    """
+    伝票情報をローカルでチェックし、問題のないものだけをb2cloud.check_shipmentsでチェックする
+
+    Args:
+        session(requests.Session): ログイン済みのセッション
+        shipments(list[dict] | ShipmentBatch):伝票情報のリスト
+        checks: compile_rulesの戻り値。省略時はRULES
+
+    Returns:
+        list[dict]: shipmentsの順の結果 {'success': bool, 'errors': [エラー]}
+    """
+    results = validate_shipments(shipments, checks)
+    passed = [i for i, result in enumerate(results) if result['success']]
+    if passed:
+        if isinstance(shipments, ShipmentBatch):
+            entries = shipments.to_feed()['feed']['entry']
+            sending = ShipmentBatch([entries[i] for i in passed])
+        else:
+            sending = [shipments[i] for i in passed]
+        checked = b2cloud.check_shipments(session, sending)
+        for i, result in zip(passed, checked):
+            results[i] = result
+    return results
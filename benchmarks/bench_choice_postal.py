@@ -0,0 +1,64 @@
+"""
+choice_postalのベンチマーク
+
+    python -m benchmarks.bench_choice_postal [住所数]
+
+旧実装(候補毎にSequenceMatcherを作る方式)と比較して住所あたりの処理時間と、選んだ候補の一致率を表示する
+"""
+import random
+import sys
+import time
+from difflib import SequenceMatcher
+
+from b2cloud.matcher import PostalMatcher
+
+TOWNS = ['大通西', '大通東', '北一条西', '北一条東', '南一条西', '南一条東', '北二条西', '北二条東', '南二条西',
+         '南二条東', '宮の森一条', '宮の森二条', '旭ケ丘', '円山西町', '伏見', '盤渓', '双子山', '界川', '北円山']
+
+
+def legacy_choice_postal(postal_feed, address):
+    """
+    旧実装
+    """
+    ret = None
+    max_ratio = 0
+    for postal in postal_feed['feed']['entry']:
+        _address = postal['address']['address1'] + postal['address']['address2'] + postal['address']['address3']
+        ratio = SequenceMatcher(None, address, _address).ratio()
+        if ratio > max_ratio:
+            max_ratio = ratio
+            ret = postal
+    return ret
+
+
+def create_addresses(n, rng):
+    addresses = []
+    for _ in range(n):
+        town = rng.choice(TOWNS)
+        prefix = rng.choice(['北海道札幌市中央区', '札幌市中央区', '北海道 札幌市中央区 '])
+        addresses.append(f'{prefix}{town}{rng.randint(1, 30)}丁目{rng.randint(1, 20)}-{rng.randint(1, 30)} サンプルマンション{rng.randint(101, 999)}')
+    return addresses
+
+
+def bench(func, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        res = func()
+        best = min(best, time.perf_counter() - start)
+    return best, res
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    rng = random.Random(0)
+    feed = {'feed': {'entry': [{'address': {'zip_code': '0600000', 'address1': '北海道', 'address2': '札幌市中央区', 'address3': town}}
+                               for town in [''] + TOWNS]}}
+    addresses = create_addresses(n, rng)
+    legacy_time, legacy = bench(lambda: [legacy_choice_postal(feed, a) for a in addresses])
+    new_time, new = bench(lambda: PostalMatcher(feed).choose_many(addresses))
+    agree = sum(a is b for a, b in zip(legacy, new))
+    print(f'addresses: {n}, candidates: {len(feed["feed"]["entry"])}')
+    print(f'legacy : {legacy_time * 1000:8.1f} ms {legacy_time / n * 1e6:7.1f} us/address')
+    print(f'new    : {new_time * 1000:8.1f} ms {new_time / n * 1e6:7.1f} us/address')
+    print(f'agree  : {agree / n:.1%}')
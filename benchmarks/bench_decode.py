@@ -0,0 +1,101 @@
+"""
+decode_responseのベンチマーク
+
+    python -m benchmarks.bench_decode [件数]
+
+json.loads(response.text)と、バックエンド毎のdecode_response、LazyFeedで先頭10件・全件を使う場合の処理時間と、
+iter_entriesで受信しながら処理する場合のピークメモリを表示する
+"""
+import io
+import json
+import sys
+import time
+import tracemalloc
+
+import requests
+
+import b2cloud.decoder
+from b2cloud.decoder import BACKENDS, decode_response, iter_entries, set_backend
+from b2cloud.utilities import create_empty_shipment
+
+
+def create_content(n):
+    entries = []
+    for i in range(n):
+        shipment = create_empty_shipment()['shipment']
+        shipment.update({
+            'tracking_number': f'{i:012d}',
+            'consignee_name': f'テスト{i}',
+            'consignee_address1': '東京都',
+            'consignee_address2': '千代田区',
+            'consignee_address3': f'丸の内{i % 9}－1－1',
+        })
+        entries.append({'id': f'/0123456789/history/{i},1', 'link': [{'___href': f'/history/{i}', '___rel': 'self'}], 'shipment': shipment})
+    return json.dumps({'feed': {'entry': entries}}, ensure_ascii=False).encode('utf-8')
+
+
+def create_response(content):
+    # 実際のレスポンスと同じく、.textは毎回contentから文字列に変換する
+    response = requests.Response()
+    response._content = content
+    response.status_code = 200
+    response.headers['Content-Type'] = 'application/json;charset=UTF-8'
+    response.encoding = 'utf-8'
+    return response
+
+
+def first_entries(response, n=10):
+    entries = decode_response(response, lazy=True)['feed']['entry']
+    return [entries[i] for i in range(n)]
+
+
+def stream_response(content):
+    # stream=Trueのレスポンス
+    response = requests.Response()
+    response.raw = io.BytesIO(content)
+    response.status_code = 200
+    return response
+
+
+def peak_memory(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench(func, response, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        res = func(response)
+        best = min(best, time.perf_counter() - start)
+    return best, res
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    response = create_response(create_content(n))
+    print(f'entries: {n} ({len(response.content) / 1e6:.1f} MB)')
+    legacy_time, expected = bench(lambda r: json.loads(r.text), response)
+    print(f'json.loads(response.text): {legacy_time * 1000:8.1f} ms')
+    default = b2cloud.decoder.BACKEND
+    for name in sorted(BACKENDS):
+        set_backend(name)
+        elapsed, result = bench(decode_response, response)
+        assert result == expected
+        print(f'decode_response[{name:6}]: {elapsed * 1000:8.1f} ms')
+        elapsed, _ = bench(first_entries, response)
+        print(f'LazyFeed[{name:6}](10)   : {elapsed * 1000:8.1f} ms')
+        elapsed, _ = bench(lambda r: sum(1 for _ in decode_response(r, lazy=True)['feed']['entry']), response)
+        print(f'LazyFeed[{name:6}](all)  : {elapsed * 1000:8.1f} ms')
+    set_backend(default)
+
+    # レスポンスの読み込みから全entryを処理するまでのピークメモリ
+    content = response.content
+    full = peak_memory(lambda: sum(1 for _ in decode_response(stream_response(content))['feed']['entry']))
+    streamed = peak_memory(lambda: sum(1 for _ in iter_entries(stream_response(content))))
+    print(f'peak memory decode_response: {full / 1e6:8.1f} MB')
+    print(f'peak memory iter_entries   : {streamed / 1e6:8.1f} MB')
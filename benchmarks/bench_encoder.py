@@ -0,0 +1,77 @@
+"""
+b2_encodeのベンチマーク
+
+    python -m benchmarks.bench_encoder [entry数]
+
+旧実装(int配列にappendして再帰する方式)と比較してMB/sを表示する
+"""
+import sys
+import time
+
+from b2cloud.encoder import b2_encode
+
+
+def legacy_b2_encode(field_list):
+    """
+    旧実装(255byte未満の文字列のみ正しく動作する)
+    """
+    if field_list is None:
+        return [192]
+    if type(field_list) is list:
+        ret = []
+        t = len(field_list)
+        n = 144 + t if t < 16 else 220
+        ret.append(n)
+        if n == 220:
+            for x in t.to_bytes(2, 'big'):
+                ret.append(x)
+        for _item in field_list:
+            ret.extend(legacy_b2_encode(_item))
+        return ret
+    if type(field_list) is str:
+        bitem = field_list.encode('utf-8')
+        t = len(bitem)
+        ret = [160 + t] if t < 32 else [217, t]
+        for c in bitem:
+            ret.append(c)
+        return ret
+    raise Exception("未実装2")
+
+
+def create_field_list(n):
+    """
+    put_trackingで送るfield_listに近いデータを生成する
+    """
+    entries = []
+    for i in range(n):
+        shipment = [None] * 60
+        shipment[0] = f'{400000000000 + i}'
+        shipment[5] = 'テスト太郎'
+        shipment[6] = '鹿児島県鹿児島市中央町10 キャンセビル6階'
+        shipment[7] = '8900053'
+        shipment[9] = '2022/12/24'
+        entries.append([None, None, None, None, [[f'/0123456789-/history/{i}', None, None, None, None]], shipment])
+    ret = [None] * 15
+    ret[14] = entries
+    return ret
+
+
+def bench(func, field_list, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        encoded = bytes(func(field_list))
+        best = min(best, time.perf_counter() - start)
+    return best, encoded
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    field_list = create_field_list(n)
+    legacy_time, legacy = bench(legacy_b2_encode, field_list)
+    new_time, new = bench(b2_encode, field_list)
+    assert legacy == new
+    size = len(new) / 1024 / 1024
+    print(f'entries: {n}, encoded: {size:.2f} MB')
+    print(f'legacy : {legacy_time * 1000:8.1f} ms {size / legacy_time:8.1f} MB/s')
+    print(f'new    : {new_time * 1000:8.1f} ms {size / new_time:8.1f} MB/s')
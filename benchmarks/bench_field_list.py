@@ -0,0 +1,101 @@
+"""
+create_field_listのベンチマーク
+
+    python -m benchmarks.bench_field_list [entry数]
+
+旧実装(entry毎にtemplateを走査する方式)と比較してentryあたりの処理時間を表示する
+"""
+import sys
+import time
+
+import b2cloud.utilities
+from b2cloud.encoder import compile_template, create_field_list
+
+
+def legacy_create_fieled_list(template, feed):
+    """
+    旧実装
+    """
+    def extend(_temp, item):
+        if type(item) is str:
+            return item
+        if type(item) is dict:
+            ret = []
+            for temp in _temp:
+                if temp in item:
+                    ret.append(extend(_temp[temp], item[temp]))
+                else:
+                    ret.append(None)
+            return ret
+        if type(item) is list:
+            return [extend(_temp, _item) for _item in item]
+        raise
+    ret = [None]*15
+    ret[14] = extend(template, feed['feed']['entry'])
+    return ret
+
+
+def create_template():
+    """
+    B2クラウドのtemplateに近いtemplateを生成する
+    """
+    template = {
+        'author': {'name': '', 'uri': '', 'email': ''},
+        'category': {'___term': '', '___scheme': '', '___label': ''},
+        'content': {'___src': '', '___type': '', '______text': ''},
+        'contributor': {'name': '', 'uri': '', 'email': ''},
+        'id': {},
+        'link': {'___href': '', '___rel': '', '___type': '', '___title': '', '___length': ''},
+    }
+    for key in ['published', 'rights', 'rights____type', 'summary', 'summary____type',
+                'title', 'title____type', 'subtitle', 'subtitle____type', 'updated']:
+        template[key] = {}
+    template['shipment'] = {key: '' for key in b2cloud.utilities.create_empty_shipment()['shipment']}
+    template['error'] = {'error_property_name': '', 'error_code': '', 'error_description': ''}
+    return template
+
+
+def create_feed(n):
+    """
+    put_trackingで送るfeedに近いデータを生成する
+    """
+    entries = []
+    for i in range(n):
+        entries.append({
+            'id': f'/0123456789-/history/{i},1',
+            'link': [{'___href': f'/0123456789-/history/{i}', '___rel': 'self'}],
+            'shipment': {
+                'tracking_number': f'{400000000000 + i}',
+                'service_type': '3',
+                'shipment_date': '2022/12/24',
+                'consignee_name': 'テスト太郎',
+                'consignee_zip_code': '8900053',
+                'consignee_address1': '鹿児島県',
+                'consignee_address2': '鹿児島市',
+                'consignee_address3': '中央町10',
+            },
+        })
+    return {'feed': {'entry': entries}}
+
+
+def bench(func, *args, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        res = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, res
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    template = create_template()
+    feed = create_feed(n)
+    legacy_time, legacy = bench(legacy_create_fieled_list, template, feed)
+    compile_time, plan = bench(compile_template, template)
+    new_time, new = bench(create_field_list, plan, feed)
+    assert legacy == new
+    print(f'entries: {n}')
+    print(f'legacy : {legacy_time * 1000:8.1f} ms {legacy_time / n * 1e6:6.2f} us/entry')
+    print(f'compile: {compile_time * 1000:8.3f} ms')
+    print(f'new    : {new_time * 1000:8.1f} ms {new_time / n * 1e6:6.2f} us/entry')
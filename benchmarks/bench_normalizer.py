@@ -0,0 +1,102 @@
+"""
+normalize_shipmentsのベンチマーク
+
+    python -m benchmarks.bench_normalizer [件数]
+
+旧来の方式(shipment毎・項目毎に正規表現とunicodedataで変換する)と比較して処理時間を表示する
+"""
+import copy
+import random
+import re
+import sys
+import time
+import unicodedata
+
+from b2cloud.normalizer import FIELD_RULES, normalize_shipments
+from b2cloud.utilities import normalize_and_trim_whitespace_in_text
+
+NAMES = ['山田　太郎', '佐藤 花子', '鈴木　一郎 ', '高橋商店', '株式会社テスト　御中']
+KANAS = ['やまだ　たろう', 'サトウ ハナコ', 'スズキ　イチロウ', 'タカハシショウテン', 'カブシキガイシャテスト']
+ADDRESSES = ['中央町１０ー１２', '丸の内１－１－１', '北一条西２丁目３番地', '大通西５－１１', '南２条東１－２－３']
+BUILDINGS = ['キャンセビル６Ｆ', '', 'サンプルマンション１０１号', 'テストビル　２階', '']
+
+
+def create_shipments(n, rng):
+    shipments = []
+    for _ in range(n):
+        shipments.append({'shipment': {
+            'consignee_name': rng.choice(NAMES),
+            'consignee_name_kana': rng.choice(KANAS),
+            'consignee_telephone_display': f'０{rng.randint(10, 99)}－{rng.randint(100, 9999)}ー{rng.randint(1000, 9999)}',
+            'consignee_zip_code': f'{rng.randint(100, 999)}－{rng.randint(1000, 9999)}',
+            'consignee_address1': '東京都',
+            'consignee_address2': '千代田区',
+            'consignee_address3': rng.choice(ADDRESSES),
+            'consignee_address4': rng.choice(BUILDINGS),
+        }})
+    return shipments
+
+
+# 全角カタカナ -> 半角カタカナ(1文字ずつ変換する旧来の方式で使う)
+HALF_KANA = {unicodedata.normalize('NFKC', chr(code)): chr(code) for code in range(0xFF66, 0xFF9E)}
+
+
+def legacy_kana(text):
+    text = unicodedata.normalize('NFKC', text)
+    ret = []
+    for c in text:
+        if 'ぁ' <= c <= 'ゖ':
+            c = chr(ord(c) + 0x60)
+        base, *marks = unicodedata.normalize('NFD', c)
+        ret.append(HALF_KANA.get(base, base))
+        if marks == ['\u3099']:
+            ret.append('ﾞ')
+        elif marks == ['\u309a']:
+            ret.append('ﾟ')
+    return normalize_and_trim_whitespace_in_text(''.join(ret))
+
+
+def legacy(shipments):
+    """
+    shipment毎・項目毎に変換する方式
+    """
+    for s in shipments:
+        shipment = s['shipment']
+        for field, rule in FIELD_RULES.items():
+            value = shipment.get(field)
+            if value is None:
+                continue
+            if rule == 'text':
+                value = normalize_and_trim_whitespace_in_text(value)
+            elif rule == 'kana':
+                value = legacy_kana(value)
+            elif rule == 'telephone':
+                value = re.sub(r'[^0-9-]', '', re.sub(r'[‐‑‒–—―−﹣ーｰ]', '-', unicodedata.normalize('NFKC', value)))
+            elif rule == 'zip':
+                value = re.sub(r'[^0-9]', '', unicodedata.normalize('NFKC', value))
+            elif rule == 'address':
+                value = re.sub(r'(?<=\d)ー(?=\d)', '-', unicodedata.normalize('NFKC', value))
+                value = normalize_and_trim_whitespace_in_text(value)
+            shipment[field] = value
+    return shipments
+
+
+def bench(func, data, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        _data = copy.deepcopy(data)
+        start = time.perf_counter()
+        res = func(_data)
+        best = min(best, time.perf_counter() - start)
+    return best, res
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    shipments = create_shipments(n, random.Random(0))
+    legacy_time, legacy_result = bench(legacy, shipments)
+    new_time, new_result = bench(normalize_shipments, shipments)
+    assert legacy_result == new_result
+    print(f'records: {n}')
+    print(f'legacy : {legacy_time * 1000:8.1f} ms {legacy_time / n * 1e6:6.2f} us/record')
+    print(f'new    : {new_time * 1000:8.1f} ms {new_time / n * 1e6:6.2f} us/record')
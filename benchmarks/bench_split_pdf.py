@@ -0,0 +1,80 @@
+"""
+split_pdf_dmのベンチマーク
+
+    python -m benchmarks.bench_split_pdf [ページ数]
+
+旧実装(伝票毎にページ全体をコピーする方式)と比較する
+"""
+import math
+import sys
+import time
+
+import fitz
+
+import b2cloud.utilities
+
+
+def legacy_split_pdf_dm(pdf_data, length):
+    """
+    旧実装
+    """
+    ret = []
+    doc = fitz.open(stream=pdf_data, filetype="pdf")
+    for i in range(length):
+        page_num = math.floor(i / 8)
+        row_num = math.floor((i % 8) / 2)
+        col_num = i % 2
+        page = doc[page_num]
+        rect = fitz.Rect(
+            50 + 250 * col_num,
+            30 + 204 * row_num,
+            50 + 250 * col_num + 250,
+            30 + 204 * row_num + 200)
+        page.set_cropbox(rect)
+        _doc = fitz.open()
+        _doc.insert_pdf(doc, from_page=page_num, to_page=page_num)
+        ret.append(_doc.tobytes())
+    return ret
+
+
+def create_dm_pdf(pages):
+    """
+    DM伝票(1シート8枚)に近いPDFデータを生成する。フォント(サブセット)と画像は全ページで共有する
+    """
+    font = fitz.Font('cjk')
+    pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 300, 300), 0)
+    pix.clear_with(180)
+    png = pix.tobytes('png')
+    doc = fitz.open()
+    for p in range(pages):
+        page = doc.new_page(width=595, height=842)
+        writer = fitz.TextWriter(page.rect)
+        for rect_num, rect in enumerate(b2cloud.utilities.DM_RECTS):
+            page.draw_rect(rect)
+            for line in range(6):
+                writer.append((rect.x0 + 10, rect.y0 + 20 + line * 14),
+                              f'{p * 8 + rect_num:05d} 鹿児島県鹿児島市中央町{line} キャンセビル テスト太郎様',
+                              font=font, fontsize=9)
+            page.insert_image(fitz.Rect(rect.x0 + 160, rect.y0 + 110, rect.x0 + 240, rect.y0 + 190), stream=png)
+        writer.write_text(page)
+    doc.subset_fonts()
+    return doc.tobytes(garbage=3, deflate=True)
+
+
+def bench(func, *args):
+    start = time.perf_counter()
+    res = func(*args)
+    return time.perf_counter() - start, res
+
+
+if __name__ == '__main__':
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    pdf = create_dm_pdf(pages)
+    length = pages * 8
+    legacy_time, legacy = bench(legacy_split_pdf_dm, pdf, length)
+    new_time, new = bench(b2cloud.utilities.split_pdf_dm, pdf, length)
+    pages_time, pages_pdf = bench(b2cloud.utilities.split_pdf_to_pages, pdf, b2cloud.utilities.DM_RECTS, length)
+    print(f'pages: {pages}, labels: {length}, source: {len(pdf) / 1024:.0f} KB')
+    print(f'legacy       : {legacy_time * 1000:8.1f} ms {sum(map(len, legacy)) / 1024:8.0f} KB')
+    print(f'split_pdf_dm : {new_time * 1000:8.1f} ms {sum(map(len, new)) / 1024:8.0f} KB')
+    print(f'to_pages     : {pages_time * 1000:8.1f} ms {len(pages_pdf) / 1024:8.0f} KB')
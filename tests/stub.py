@@ -0,0 +1,157 @@
+import http.client
+import io
+import json
+import threading
+import time
+import types
+from urllib.parse import parse_qsl, urlsplit
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+B2_URL = 'https://newb2web.kuronekoyamato.co.jp'
+
+
+class B2Stub(BaseAdapter):
+    """
+    B2クラウドの代わりにレスポンスを返すテスト用のアダプタ
+
+    session.mount(B2_URL, stub)でセッションに組み込む。
+    routeに登録したhandler(request)が(status, body)または(status, body, headers)を返す。bodyがbytes以外ならjsonにする。
+    """
+
+    def __init__(self, delay:float=0):
+        super().__init__()
+        self.delay = delay
+        self.routes = []
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def route(self, method:str, path:str, handler):
+        self.routes.insert(0, (method, path, handler))
+        return self
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        with self._lock:
+            self.calls.append(request)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            if self.delay:
+                time.sleep(self.delay)
+            path = urlsplit(request.url).path
+            for method, _path, handler in self.routes:
+                if method == request.method and _path == path:
+                    status, body, *headers = handler(request)
+                    break
+            else:
+                status, body, headers = 404, b'', []
+        finally:
+            with self._lock:
+                self.active -= 1
+        if not isinstance(body, bytes) and not hasattr(body, 'read'):
+            body = json.dumps(body).encode('utf-8')
+        return self.build_response(request, status, body, *headers)
+
+    def build_response(self, request, status, body, headers=None):
+        response = requests.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict({'Content-Type': 'application/json; charset=utf-8'})
+        response.headers.update(headers or {})
+        if hasattr(body, 'read'):
+            # stream=Trueで読み込むレスポンス
+            response.raw = body
+        else:
+            response._content = body
+            response._content_consumed = True
+            if 'Set-Cookie' in response.headers:
+                # セッションがcookieを取り込めるように、元のレスポンスのヘッダーを付ける
+                msg = http.client.parse_headers(io.BytesIO(f"Set-Cookie: {response.headers['Set-Cookie']}\r\n\r\n".encode('latin-1')))
+                response.raw = types.SimpleNamespace(_original_response=types.SimpleNamespace(msg=msg))
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self):
+        pass
+
+
+class DroppingStream(io.BytesIO):
+    """
+    limitバイト読み込んだところで通信が切れるレスポンス
+    """
+
+    def __init__(self, data:bytes, limit:int):
+        super().__init__(data)
+        self.limit = limit
+
+    def read(self, size=-1):
+        if self.tell() >= self.limit:
+            raise requests.ConnectionError('connection dropped')
+        return super().read(min(size, self.limit - self.tell()))
+
+
+def stub_session(stub:B2Stub)->requests.Session:
+    """
+    stubを組み込んだセッションを返す
+    """
+    session = requests.Session()
+    session.mount(B2_URL, stub)
+    return session
+
+
+def history_stub(entries:list, deleted:list=()):
+    """
+    /b2/p/historyの代わりに、entriesを検索条件で絞り込んで返すstub
+    display_flg=0の場合はdeletedを返す。{項目}-ge-{値}、{項目}-le-{値}と完全一致の条件、countに対応する
+
+    Returns:
+        tuple: (stub, 受け取ったクエリパラメータのリスト)
+    """
+    queries = []
+
+    def match(shipment, params):
+        for key, value in params.items():
+            if '-ge-' in key:
+                field, bound = key.split('-ge-')
+                # 日付は'yyyy/mm/dd'で返るが、条件は'yyyymmdd'で指定する
+                if shipment.get(field, '').replace('/', '') < bound:
+                    return False
+            elif '-le-' in key:
+                field, bound = key.split('-le-')
+                if shipment.get(field, '').replace('/', '') > bound:
+                    return False
+            elif key not in ('all', 'count', 'display_flg') and shipment.get(key) != value:
+                return False
+        return True
+
+    def history(request):
+        params = dict(parse_qsl(urlsplit(request.url).query, keep_blank_values=True))
+        queries.append(params)
+        source = deleted if params.get('display_flg') == '0' else entries
+        result = [entry for entry in source if match(entry['shipment'], params)]
+        if 'count' in params:
+            return 200, {'feed': {'title': str(len(result))}}
+        return 200, {'feed': {'entry': result}} if result else {'feed': {}}
+
+    return B2Stub().route('GET', '/b2/p/history', history), queries
+
+
+def request_json(request):
+    return json.loads(request.body)
+
+
+# /b2/d/_settings/templateの応答
+TEMPLATE = '\n'.join([
+    'shipment{}',
+    ' tracking_number',
+    ' shipment_number',
+    ' consignee_name',
+    ' consignee_zip_code',
+    ' search_key1',
+])
@@ -0,0 +1,134 @@
+import time
+from urllib.parse import parse_qsl, urlsplit
+
+import pytest
+import requests
+
+import b2cloud.utilities
+from b2cloud.postal import PostalCache
+from tests.stub import B2Stub, stub_session
+
+ADDRESSES = {
+    '鹿児島市中央町10キャンセビル6F': {'zip_code': '8900053', 'town_type2': '中央町', 'custom_type2': '10', 'building': 'キャンセビル6F'},
+    '鹿児島市中央町11': {'zip_code': '8900053', 'town_type2': '中央町', 'custom_type2': '11', 'building': ''},
+    '東京都千代田区丸の内1-1': {'zip_code': '1000005', 'town_type2': '丸の内', 'custom_type2': '1-1', 'building': ''},
+}
+
+
+@pytest.fixture(autouse=True)
+def caches(monkeypatch):
+    monkeypatch.setattr(b2cloud.utilities, 'POSTAL_CACHE', PostalCache())
+    b2cloud.utilities.ADDRESSIAN_CACHE.clear()
+    yield
+    b2cloud.utilities.ADDRESSIAN_CACHE.clear()
+
+
+def addressian_session(calls:list):
+    def normalizer(request):
+        address = dict(parse_qsl(urlsplit(request.url).query))['address']
+        calls.append(address)
+        if address not in ADDRESSES:
+            return 200, {'items': [{'success': False}]}
+        return 200, {'items': [{'success': True, **ADDRESSES[address]}]}
+
+    session = requests.Session()
+    session.mount(b2cloud.utilities.ADDRESSIAN_URL.rsplit('/api/', 1)[0],
+                  B2Stub().route('GET', '/api/address_normalizer', normalizer))
+    return session
+
+
+def postal_session(calls:list):
+    def postal(request):
+        code = dict(parse_qsl(urlsplit(request.url).query))['code']
+        calls.append(code)
+        if code == '8900053':
+            return 200, {'feed': {'entry': [{'address': {'zip_code': code, 'address1': '鹿児島県', 'address2': '鹿児島市', 'address3': '中央町'}}]}}
+        if code == '1000005':
+            return 200, {'feed': {'entry': [{'address': {'zip_code': code, 'address1': '東京都', 'address2': '千代田区', 'address3': '丸の内'}}]}}
+        return 200, {'feed': {}}
+
+    return stub_session(B2Stub().route('GET', '/b2/p/_postal', postal))
+
+
+def test_get_address_infos():
+    """
+    同じ住所は1回だけ変換し、失敗した住所があっても入力順に全件返す
+    """
+    addressian_calls, postal_calls = [], []
+    results = b2cloud.utilities.get_address_infos(
+        postal_session(postal_calls), 'key',
+        ['鹿児島市中央町10キャンセビル6F', '鹿児島市中央町11', '不明な住所', ' 鹿児島市中央町11 ', '東京都千代田区丸の内1-1', '東京都千代田区丸の内1-1'],
+        zip_codes=[None, None, None, None, None, '9999999'],
+        http=addressian_session(addressian_calls), rate=0,
+    )
+    assert [r['index'] for r in results] == list(range(6))
+    assert [r['status'] for r in results] == ['ok', 'ok', 'error', 'ok', 'ok', 'error']
+    assert results[0]['address_info'] == {
+        'consignee_zip_code': '8900053',
+        'consignee_address1': '鹿児島県',
+        'consignee_address2': '鹿児島市',
+        'consignee_address3': '中央町10',
+        'consignee_address4': 'キャンセビル6F',
+    }
+    assert results[3]['address_info'] == results[1]['address_info']
+    assert '不明な住所' in results[2]['errors'][0]
+    assert '9999999' in results[5]['errors'][0]
+    assert sorted(addressian_calls) == sorted(['鹿児島市中央町10キャンセビル6F', '鹿児島市中央町11', '不明な住所', '東京都千代田区丸の内1-1'])
+    assert sorted(postal_calls) == ['1000005', '8900053', '9999999']
+
+    # 2回目は正規化結果のキャッシュを使う
+    b2cloud.utilities.get_address_infos(postal_session(postal_calls), 'key', ['鹿児島市中央町11'],
+                                        http=addressian_session(addressian_calls))
+    assert len(addressian_calls) == 4
+
+
+def test_get_address_infos_without_zip_code(monkeypatch):
+    """
+    郵便番号のない正規化結果は、その住所だけエラーにする
+    """
+    monkeypatch.setitem(ADDRESSES, '鹿児島県', {'town_type2': '', 'custom_type2': '', 'building': ''})
+    postal_calls = []
+    results = b2cloud.utilities.get_address_infos(
+        postal_session(postal_calls), 'key', ['鹿児島県', '鹿児島市中央町11', '鹿児島県'], zip_codes=[None, None, '8900053'],
+        http=addressian_session([]), rate=0,
+    )
+    assert [r['status'] for r in results] == ['error', 'ok', 'ok']
+    assert '鹿児島県' in results[0]['errors'][0]
+    assert postal_calls == ['8900053']
+
+
+def test_get_address_infos_closes_session(monkeypatch):
+    """
+    httpを指定しない場合に作成したセッションは終了時に閉じる
+    """
+    sessions = []
+    stub = addressian_session([]).adapters[b2cloud.utilities.ADDRESSIAN_URL.rsplit('/api/', 1)[0]]
+
+    class Session(requests.Session):
+        def __init__(self):
+            super().__init__()
+            self.closed = False
+            sessions.append(self)
+
+        def mount(self, prefix, adapter):
+            super().mount(prefix, adapter)
+            super().mount(b2cloud.utilities.ADDRESSIAN_URL.rsplit('/api/', 1)[0], stub)
+
+        def close(self):
+            self.closed = True
+            super().close()
+
+    postal = postal_session([])
+    monkeypatch.setattr(b2cloud.utilities.requests, 'Session', Session)
+    results = b2cloud.utilities.get_address_infos(postal, 'key', ['鹿児島市中央町11'], rate=0)
+    assert results[0]['status'] == 'ok'
+    assert len(sessions) == 1 and sessions[0].closed
+
+
+def test_rate_limit():
+    calls = []
+    started = time.monotonic()
+    b2cloud.utilities.get_address_infos(postal_session([]), 'key', list(ADDRESSES),
+                                        http=addressian_session(calls), rate=20)
+    assert len(calls) == 3
+    assert time.monotonic() - started >= 0.1
@@ -0,0 +1,94 @@
+import asyncio
+
+import requests
+
+import b2cloud.aio
+from tests.stub import B2Stub, stub_session, request_json
+
+
+def checkonly(request):
+    entries = request_json(request)['feed']['entry']
+    return 200, {'feed': {'entry': entries}}
+
+
+def test_check_shipments_concurrently():
+    """
+    複数のリクエストを同時に処理する
+    """
+    stub = B2Stub(delay=0.05).route('POST', '/b2/p/new', checkonly)
+
+    async def main():
+        async with b2cloud.aio.AsyncB2Client(stub_session(stub), max_concurrency=16) as client:
+            shipments = [{'shipment': {'consignee_name': f'テスト{i}'}} for i in range(16)]
+            return await asyncio.gather(*[client.check_shipment(s) for s in shipments])
+
+    res = asyncio.run(main())
+    assert res == [{'success': True, 'errors': []}] * 16
+    assert stub.max_active > 1
+
+
+def test_get_postal():
+    """
+    郵便情報
+    """
+    feed = {'feed': {'entry': [{'address': {'zip_code': '8900053', 'address1': '鹿児島県'}}]}}
+    stub = B2Stub().route('GET', '/b2/p/_postal', lambda request: (200, feed))
+
+    async def main():
+        async with b2cloud.aio.AsyncB2Client(stub_session(stub)) as client:
+            return await client.get_postal('8900053')
+
+    assert asyncio.run(main()) == feed
+    assert stub.calls[0].url.endswith('code=8900053')
+
+
+def test_resize_pool():
+    """
+    HTTPAdapterだけ差し替え、resize_pool=Falseなら差し替えない
+    """
+    session = requests.Session()
+    default = session.adapters['https://']
+    b2cloud.aio.AsyncB2Client(session, max_concurrency=16)
+    assert session.adapters['https://'] is not default
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(max_retries=3)
+    session.mount('https://', adapter)
+    b2cloud.aio.AsyncB2Client(session, max_concurrency=16, resize_pool=False)
+    assert session.adapters['https://'] is adapter
+
+    class CustomAdapter(requests.adapters.HTTPAdapter):
+        pass
+
+    session = requests.Session()
+    adapter = CustomAdapter()
+    session.mount('https://', adapter)
+    b2cloud.aio.AsyncB2Client(session, max_concurrency=16)
+    assert session.adapters['https://'] is adapter
+
+
+def test_close_does_not_block_loop():
+    """
+    closeで実行中のリクエストを待つ間も、他のタスクが動く
+    """
+    stub = B2Stub(delay=0.2).route('POST', '/b2/p/new', checkonly)
+
+    async def main():
+        client = b2cloud.aio.AsyncB2Client(stub_session(stub))
+        task = asyncio.ensure_future(client.check_shipment({'shipment': {}}))
+        await asyncio.sleep(0.05)
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        ticker = asyncio.ensure_future(tick())
+        await client.close()
+        ticker.cancel()
+        await task
+        return ticks
+
+    assert asyncio.run(main()) > 5
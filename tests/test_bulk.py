@@ -0,0 +1,116 @@
+import pytest
+import requests
+
+import b2cloud.bulk
+from tests.stub import B2Stub, stub_session, request_json
+
+
+def test_bulk_register():
+    """
+    チャンク毎にチェック→登録し、通信エラーのチャンクだけ再実行する
+    """
+    failures = {'count': 0}
+
+    def new(request):
+        entries = request_json(request)['feed']['entry']
+        names = [e['shipment']['consignee_name'] for e in entries]
+        if request.url.endswith('checkonly'):
+            # 最初の1回だけ通信エラー
+            if 'テスト4' in names and failures['count'] == 0:
+                failures['count'] += 1
+                raise requests.ConnectionError('connection reset')
+            for e in entries:
+                if e['shipment']['consignee_name'] == 'テスト7':
+                    e['error'] = [{'error_property_name': 'consignee_zip_code'}]
+            return 200, {'feed': {'entry': entries}}
+        for e in entries:
+            e['id'] = e['shipment']['consignee_name']
+        return 200, {'feed': {'entry': entries}}
+
+    stub = B2Stub().route('POST', '/b2/p/new', new)
+    shipments = [{'shipment': {'consignee_name': f'テスト{i}'}} for i in range(10)]
+    res = sorted(b2cloud.bulk.bulk_register(stub_session(stub), shipments, chunk_size=3, max_workers=2),
+                 key=lambda r: r['index'])
+
+    assert [r['index'] for r in res] == list(range(10))
+    assert [r['status'] for r in res] == ['ok'] * 7 + ['error'] + ['ok'] * 2
+    assert res[4]['entry']['id'] == 'テスト4'
+    assert res[7]['errors'] == [{'error_property_name': 'consignee_zip_code'}]
+    assert failures['count'] == 1
+
+
+def test_bulk_register_failed():
+    """
+    再実行しても通信エラーの場合は'failed'を返す
+    """
+    def new(request):
+        raise requests.ConnectionError('connection reset')
+
+    stub = B2Stub().route('POST', '/b2/p/new', new)
+    shipments = [{'shipment': {'consignee_name': f'テスト{i}'}} for i in range(4)]
+    res = list(b2cloud.bulk.bulk_register(stub_session(stub), shipments, chunk_size=2, retries=1))
+
+    assert sorted(r['index'] for r in res) == [0, 1, 2, 3]
+    assert all(r['status'] == 'failed' for r in res)
+    assert len(stub.calls) == 4
+
+
+def test_bulk_register_post_new_failed():
+    """
+    post_newが失敗したチャンクは二重登録を避けるため再送しない
+    """
+    posted = []
+
+    def new(request):
+        entries = request_json(request)['feed']['entry']
+        if request.url.endswith('checkonly'):
+            entries[0]['error'] = [{'error_property_name': 'consignee_zip_code'}]
+            return 200, {'feed': {'entry': entries}}
+        posted.append(len(entries))
+        raise requests.ConnectionError('connection reset')
+
+    stub = B2Stub().route('POST', '/b2/p/new', new)
+    shipments = [{'shipment': {'consignee_name': f'テスト{i}'}} for i in range(3)]
+    res = sorted(b2cloud.bulk.bulk_register(stub_session(stub), shipments, chunk_size=3, retries=2),
+                 key=lambda r: r['index'])
+
+    assert [r['status'] for r in res] == ['error', 'failed', 'failed']
+    assert posted == [2]
+
+
+@pytest.mark.parametrize('registered, statuses', [
+    ({'feed': {'title': 'Error'}}, ['failed', 'failed', 'failed']),
+    ({'feed': {'entry': [{'id': '1'}, {'id': '2'}]}}, ['ok', 'ok', 'failed']),
+])
+def test_bulk_register_post_new_missing_entry(registered, statuses):
+    """
+    post_newの結果にentryがない、または足りない伝票は'failed'を返し、他のチャンクの結果も返す
+    """
+    def new(request):
+        entries = request_json(request)['feed']['entry']
+        if request.url.endswith('checkonly'):
+            return 200, {'feed': {'entry': entries}}
+        if entries[0]['shipment']['consignee_name'] == 'テスト0':
+            return 200, registered
+        return 200, {'feed': {'entry': entries}}
+
+    stub = B2Stub().route('POST', '/b2/p/new', new)
+    shipments = [{'shipment': {'consignee_name': f'テスト{i}'}} for i in range(6)]
+    res = sorted(b2cloud.bulk.bulk_register(stub_session(stub), shipments, chunk_size=3),
+                 key=lambda r: r['index'])
+
+    assert [r['status'] for r in res] == statuses + ['ok'] * 3
+    assert res[2]['entry'] is None
+    assert res[2]['errors']
+    assert res[5]['entry']['shipment']['consignee_name'] == 'テスト5'
+
+
+def test_bulk_register_decode_error():
+    """
+    通信エラー以外の例外は再実行しない
+    """
+    stub = B2Stub().route('POST', '/b2/p/new', lambda request: (200, b'<html></html>'))
+    shipments = [{'shipment': {'consignee_name': 'テスト'}}]
+    with pytest.raises(ValueError):
+        list(b2cloud.bulk.bulk_register(stub_session(stub), shipments, retries=2))
+    assert len(stub.calls) == 1
@@ -0,0 +1,80 @@
+import itertools
+from urllib.parse import parse_qs, urlsplit
+
+import fitz
+
+import b2cloud.bulk
+import b2cloud.polling
+from tests.stub import B2Stub, stub_session, request_json
+
+POLICY = b2cloud.polling.PollingPolicy(initial=0.001, cap=0.005, deadline=5)
+
+
+def create_pdf(texts):
+    doc = fitz.open()
+    for text in texts:
+        page = doc.new_page()
+        page.insert_text((50, 50), text)
+    return doc.tobytes()
+
+
+def print_stub():
+    """
+    発行ジョブ毎にshipmentのconsignee_nameを1ページずつ印刷したPDFを返す
+    """
+    jobs = {}
+    numbers = itertools.count()
+
+    def issue(request):
+        issue_no = f'{next(numbers):05d}'
+        jobs[issue_no] = [e['id'] for e in request_json(request)['feed']['entry']]
+        return 200, {'feed': {'title': issue_no}}
+
+    def okurijyo(request):
+        query = parse_qs(urlsplit(request.url).query)
+        if 'fileonly' not in query:
+            return 200, b''
+        return 200, create_pdf(jobs[query['issue_no'][0]])
+
+    stub = B2Stub()
+    stub.route('POST', '/b2/p/new', issue)
+    stub.route('GET', '/b2/p/polling', lambda request: (200, {'feed': {'title': 'Success'}}))
+    stub.route('GET', '/b2/p/B2_OKURIJYO', okurijyo)
+    return stub, jobs
+
+
+def create_feed(n):
+    shipment = {'printer_type': '1', 'service_type': '3', 'is_cool': '0', 'tracking_number': 'OMN0000000001',
+                'package_qty': '1', 'is_agent': '0', 'created_ms': '0', 'upd_revision': '1'}
+    return {'feed': {'entry': [
+        {'link': [{'___href': f'/label{i:02d}'}], 'shipment': shipment} for i in range(n)
+    ]}}
+
+
+def test_iter_print_issue():
+    """
+    発行ジョブに分割して印刷する
+    """
+    stub, jobs = print_stub()
+    res = list(b2cloud.bulk.iter_print_issue(stub_session(stub), 'm5', create_feed(10), chunk_size=4, polling_policy=POLICY))
+    assert sorted((r['index'], r['start'], r['count']) for r in res) == [(0, 0, 4), (1, 4, 4), (2, 8, 2)]
+    assert len(jobs) == 3
+
+
+def test_iter_print_issue_sheet():
+    """
+    複数面の用紙はchunk_sizeを面数の倍数に切り上げる
+    """
+    stub, jobs = print_stub()
+    res = list(b2cloud.bulk.iter_print_issue(stub_session(stub), '3', create_feed(20), chunk_size=5, polling_policy=POLICY))
+    assert sorted((r['start'], r['count']) for r in res) == [(0, 8), (8, 8), (16, 4)]
+
+
+def test_print_issue():
+    """
+    発行ジョブに分割して印刷し、元の順に結合する
+    """
+    stub, jobs = print_stub()
+    pdf = b2cloud.bulk.print_issue(stub_session(stub), '3', create_feed(10), chunk_size=3, polling_policy=POLICY)
+    with fitz.open(stream=pdf, filetype='pdf') as doc:
+        assert [page.get_text().strip() for page in doc] == [f'/label{i:02d},1' for i in range(10)]
@@ -0,0 +1,130 @@
+import io
+import json
+
+import pytest
+
+import b2cloud
+import b2cloud.decoder
+from b2cloud.decoder import BACKENDS, FeedScanner, LazyFeed, set_backend
+from tests.stub import B2Stub, stub_session
+
+FEED = {
+    'feed': {
+        'title': 'OK',
+        'entry': [{'shipment': {'tracking_number': str(i), 'consignee_name': f'テスト"{i}"\\', 'weight': i * 1.5}} for i in range(20)],
+        'updated': -1.25e-3,
+    },
+    'extra': [1, None, True],
+}
+
+
+@pytest.fixture(params=sorted(BACKENDS))
+def backend(request):
+    previous = b2cloud.decoder.BACKEND
+    set_backend(request.param)
+    yield request.param
+    set_backend(previous)
+
+
+def test_backend(backend):
+    stub = B2Stub().route('GET', '/b2/p/history', lambda request: (200, FEED))
+    assert b2cloud.get_history_all(stub_session(stub)) == FEED
+
+
+def test_unknown_backend():
+    with pytest.raises(Exception):
+        set_backend('unknown')
+
+
+def test_lazy_feed():
+    feed = LazyFeed(json.dumps(FEED, ensure_ascii=False).encode('utf-8'))
+    entries = feed['feed']['entry']
+    assert entries[2] == FEED['feed']['entry'][2]
+    # 参照した位置までしかデコードしない
+    assert len(entries._decoded) == 3
+    assert [e['shipment']['tracking_number'] for e in entries][:4] == ['0', '1', '2', '3']
+    assert feed['feed']['title'] == 'OK'
+    assert feed == FEED
+    assert feed.to_dict() == FEED
+
+    feed = LazyFeed(b'{"feed":{"title":"Error"}}')
+    assert feed['feed'].get('entry', []) == []
+    assert feed.to_dict() == {'feed': {'title': 'Error'}}
+
+
+def test_get_new_lazy():
+    stub = B2Stub().route('GET', '/b2/p/new', lambda request: (200, FEED))
+    feed = b2cloud.get_new(stub_session(stub), lazy=True)
+    assert isinstance(feed, LazyFeed)
+    assert feed['feed']['entry'][-1] == FEED['feed']['entry'][-1]
+
+
+@pytest.mark.parametrize('loads', [None, b2cloud.decoder.loads])
+@pytest.mark.parametrize('indent', [None, 2])
+def test_scanner_chunks(indent, loads):
+    """
+    どこで分割して追加してもentryを同じように取り出せる
+    """
+    text = json.dumps(FEED, ensure_ascii=False, indent=indent)
+    for size in (1, 7, 64, len(text)):
+        scanner = FeedScanner(loads=loads)
+        entries = []
+        for i in range(0, len(text), size):
+            scanner.append(text[i:i + size])
+            entries.extend(scanner.entries())
+        scanner.close()
+        entries.extend(scanner.entries())
+        assert scanner.done
+        assert entries == FEED['feed']['entry']
+        assert scanner.feed == {'title': 'OK', 'updated': -1.25e-3}
+        assert scanner.root == {'extra': [1, None, True]}
+
+
+@pytest.mark.parametrize('text', ['{"feed":{"entry":[{"a":1},}}', '{"feed":{"entry":[{"a":1},{"a":]}]}}', '{"feed":{"entry":[{"a":"]'])
+@pytest.mark.parametrize('loads', [None, b2cloud.decoder.loads])
+def test_scanner_invalid(text, loads):
+    scanner = FeedScanner(text, loads=loads)
+    scanner.close()
+    with pytest.raises(Exception):
+        list(scanner.entries())
+
+
+def test_lazy_feed_backend(monkeypatch):
+    """
+    LazyFeedのentryは選択したバックエンドでデコードする
+    """
+    calls = []
+
+    def spy(data):
+        calls.append(data)
+        return json.loads(data)
+
+    monkeypatch.setitem(BACKENDS, 'spy', spy)
+    previous = b2cloud.decoder.BACKEND
+    set_backend('spy')
+    try:
+        entries = LazyFeed(json.dumps(FEED, ensure_ascii=False).encode('utf-8'))['feed']['entry']
+        assert entries[1] == FEED['feed']['entry'][1]
+    finally:
+        set_backend(previous)
+    assert [json.loads(data) for data in calls] == FEED['feed']['entry'][:2]
+
+
+def test_stream_history_all():
+    """
+    feed全体を受信する前に先頭のentryを返す
+    """
+    content = json.dumps(FEED, ensure_ascii=False).encode('utf-8')
+    body = io.BytesIO(content)
+    stub = B2Stub().route('GET', '/b2/p/history', lambda request: (200, body))
+    entries = b2cloud.stream_history_all(stub_session(stub), chunk_size=256)
+    assert next(entries) == FEED['feed']['entry'][0]
+    assert body.tell() < len(content)
+    assert [next(entries)] + list(entries) == FEED['feed']['entry'][1:]
+    assert stub.calls[0].url.endswith('/b2/p/history?all=')
+
+
+def test_stream_new():
+    stub = B2Stub().route('GET', '/b2/p/new', lambda request: (200, FEED))
+    assert list(b2cloud.stream_new(stub_session(stub), params={'service_type': '3'}, chunk_size=100)) == FEED['feed']['entry']
+    assert list(b2cloud.stream_new(stub_session(B2Stub().route('GET', '/b2/p/new', lambda request: (200, {'feed': {'title': 'Error'}}))))) == []
@@ -0,0 +1,101 @@
+import io
+import os
+
+import pytest
+import requests
+
+import b2cloud
+from tests.stub import B2Stub, DroppingStream, stub_session
+
+PDF = os.urandom(100000)
+
+
+def download_stub(support_range=True, drops=1, shift=0):
+    """
+    drops回目まではdropバイト目で通信が切れる
+    shiftを指定した場合は、Rangeの位置からshiftバイトずれた位置から送る
+    """
+    calls = []
+
+    def okurijyo(request):
+        if 'fileonly' not in request.url:
+            return 200, b''
+        calls.append(request.headers.get('Range'))
+        start = 0
+        if support_range and request.headers.get('Range'):
+            start = int(request.headers['Range'][6:-1]) + shift
+        status = 206 if start else 200
+        headers = {'Content-Range': f'bytes {start}-{len(PDF) - 1}/{len(PDF)}'} if start else {}
+        data = PDF[start:]
+        if len(calls) <= drops:
+            return status, DroppingStream(data, 30000), headers
+        return status, io.BytesIO(data), headers
+
+    return B2Stub().route('GET', '/b2/p/B2_OKURIJYO', okurijyo), calls
+
+
+@pytest.mark.parametrize('support_range', [True, False])
+def test_resume(support_range):
+    """
+    通信が切れた位置から再開する
+    """
+    stub, calls = download_stub(support_range, drops=2)
+    stats = {}
+    chunks = list(b2cloud.iter_download_issue(stub_session(stub), '00001', chunk_size=8192, stats=stats))
+    assert b''.join(chunks) == PDF
+    assert len(calls) == 3
+    assert calls[0] is None
+    assert stats['bytes'] == len(PDF)
+    assert stats['resumed'] == 2
+    assert stats['bytes_per_sec'] > 0
+
+
+def test_shifted_range():
+    """
+    Rangeと異なる位置から送られてきた場合は、先頭から受信し直す
+    """
+    stub, calls = download_stub(drops=1, shift=100)
+    chunks = list(b2cloud.iter_download_issue(stub_session(stub), '00001', chunk_size=8192))
+    assert b''.join(chunks) == PDF
+    assert calls == [None, 'bytes=30000-', None]
+
+
+def test_error_status():
+    """
+    エラーのレスポンスをPDFデータとして受信しない
+    """
+    stub = B2Stub().route('GET', '/b2/p/B2_OKURIJYO',
+                          lambda request: (200, b'') if 'fileonly' not in request.url else (500, io.BytesIO(b'error')))
+    with pytest.raises(requests.HTTPError):
+        list(b2cloud.iter_download_issue(stub_session(stub), '00001'))
+
+    html = {'Content-Type': 'text/html; charset=utf-8'}
+    stub = B2Stub().route('GET', '/b2/p/B2_OKURIJYO',
+                          lambda request: (200, b'') if 'fileonly' not in request.url else (200, io.BytesIO(b'<html>'), html))
+    with pytest.raises(Exception, match='HTML'):
+        list(b2cloud.iter_download_issue(stub_session(stub), '00001'))
+
+
+def test_retries():
+    """
+    再開の回数を超えた場合は例外
+    """
+    stub, calls = download_stub(drops=10)
+    with pytest.raises(requests.ConnectionError):
+        b2cloud.download_issue(stub_session(stub), '00001', retries=2)
+    assert len(calls) == 3
+
+
+def test_download_to_file(tmp_path):
+    """
+    ファイルに書き込む
+    """
+    stub, calls = download_stub(drops=1)
+    path = tmp_path / 'dm.pdf'
+    stats = b2cloud.download_issue(stub_session(stub), '00001', dest=str(path))
+    assert path.read_bytes() == PDF
+    assert stats['bytes'] == len(PDF)
+
+    buf = io.BytesIO()
+    b2cloud.download_issue(stub_session(stub), '00001', dest=buf)
+    assert buf.getvalue() == PDF
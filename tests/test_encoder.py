@@ -0,0 +1,164 @@
+import zlib
+
+import pytest
+
+import b2cloud
+from b2cloud.encoder import b2_encode, compile_template, create_field_list, flatten_value, iter_b2_encode, iter_deflate
+from tests.stub import B2Stub, TEMPLATE, stub_session
+
+
+@pytest.mark.parametrize('length, header', [
+    (0, b'\xa0'),
+    (1, b'\xa1'),
+    (31, b'\xbf'),
+    (32, b'\xd9\x20'),
+    (254, b'\xd9\xfe'),
+    (255, b'\xd9\xff'),
+    (256, b'\xda\x01\x00'),
+    (65535, b'\xda\xff\xff'),
+    (65536, b'\xdb\x00\x01\x00\x00'),
+])
+def test_str_header(length, header):
+    """
+    文字列の長さ毎のヘッダー
+    """
+    assert b2_encode('a' * length) == header + b'a' * length
+
+
+def test_str_utf8_length():
+    """
+    文字列の長さはutf-8のバイト数
+    """
+    # 11文字 x 3byte = 33byte
+    assert b2_encode('テスト太郎テスト太郎テ') == b'\xd9\x21' + 'テスト太郎テスト太郎テ'.encode('utf-8')
+
+
+@pytest.mark.parametrize('length, header', [
+    (0, b'\x90'),
+    (15, b'\x9f'),
+    (16, b'\xdc\x00\x10'),
+    (65535, b'\xdc\xff\xff'),
+    (65536, b'\xdd\x00\x01\x00\x00'),
+])
+def test_list_header(length, header):
+    """
+    配列の件数毎のヘッダー
+    """
+    assert b2_encode([None] * length) == header + b'\xc0' * length
+
+
+def test_nested():
+    """
+    ネストした配列
+    """
+    field_list = [None, ['1', [None, 'ab'], []], [['x' * 40]], '']
+    assert b2_encode(field_list) == (
+        b'\x94\xc0'
+        + b'\x93\xa11' + b'\x92\xc0\xa2ab' + b'\x90'
+        + b'\x91\x91' + b'\xd9\x28' + b'x' * 40
+        + b'\xa0'
+    )
+
+
+def test_deep_nesting():
+    """
+    再帰の上限を超える深さでもエンコードできる
+    """
+    field_list = None
+    for _ in range(5000):
+        field_list = [field_list]
+    assert b2_encode(field_list) == b'\x91' * 5000 + b'\xc0'
+
+
+def test_unsupported():
+    """
+    未対応の型
+    """
+    with pytest.raises(Exception):
+        b2_encode({'a': 'b'})
+    with pytest.raises(Exception):
+        b2_encode([1])
+
+
+def test_iter_b2_encode():
+    """
+    チャンクに分割してエンコードする
+    """
+    field_list = [[f'{i:012d}', 'テスト' * i, None] for i in range(200)]
+    chunks = list(iter_b2_encode(field_list, chunk_size=256))
+    assert len(chunks) > 1
+    assert b''.join(chunks) == b2_encode(field_list)
+
+
+def test_iter_deflate():
+    """
+    raw deflateはzlib.compressからヘッダーとチェックサムを除いたものと同じ
+    """
+    data = b2_encode([[f'{i:012d}', 'テスト' * (i % 50)] for i in range(5000)])
+    chunks = [data[i:i + 1000] for i in range(0, len(data), 1000)]
+    assert b''.join(iter_deflate(chunks)) == zlib.compress(data)[2:-4]
+
+
+def test_put_tracking_stream():
+    """
+    put_trackingをchunked転送で送信する
+    """
+    bodies = []
+
+    def tracking(request):
+        body = request.body if isinstance(request.body, bytes) else b''.join(request.body)
+        bodies.append(zlib.decompress(body, -15))
+        return 200, {'feed': {'entry': []}}
+
+    stub = B2Stub()
+    stub.route('GET', '/b2/d/_settings/template', lambda request: (200, TEMPLATE.encode('utf-8')))
+    stub.route('PUT', '/b2/p/history', tracking)
+    session = stub_session(stub)
+    feed = {'feed': {'entry': [
+        {'id': f'/0123456789-/history/{i},1', 'shipment': {'tracking_number': f'{400000000000 + i}'}}
+        for i in range(3000)
+    ]}}
+    b2cloud.TEMPLATE_CACHE.clear()
+    b2cloud.put_tracking(session, feed)
+    b2cloud.put_tracking(session, feed, stream=True)
+    b2cloud.TEMPLATE_CACHE.clear()
+
+    assert stub.calls[-1].headers['Transfer-Encoding'] == 'chunked'
+    assert bodies[0] == bodies[1]
+    assert bodies[0].startswith(b'\x9f' + b'\xc0' * 14 + b'\xdc\x0b\xb8')
+
+
+def test_create_field_list():
+    """
+    feedをtemplateのkey順のlistに変換する
+    """
+    template = {
+        'id': {},
+        'link': {'___href': '', '___rel': ''},
+        'shipment': {'tracking_number': '', 'consignee_name': ''},
+    }
+    feed = {'feed': {'entry': [
+        {
+            'shipment': {'consignee_name': 'テスト', 'unknown': 'x', 'tracking_number': '1'},
+            'link': [{'___rel': 'self', '___href': '/a'}],
+            'id': '/a,1',
+        },
+        {'shipment': {}},
+    ]}}
+    res = create_field_list(compile_template(template), feed)
+    assert res == [None] * 14 + [[
+        ['/a,1', [['/a', 'self']], ['1', 'テスト']],
+        [None, None, [None, None]],
+    ]]
+
+
+def test_flatten_value():
+    """
+    entryの値を単独で変換できる
+    """
+    plan = compile_template({'link': {'___href': '', '___rel': ''}})
+    subplan = plan[2][0]
+    assert flatten_value(subplan, [{'___rel': 'self', '___href': '/a'}]) == [['/a', 'self']]
+    assert flatten_value(subplan, 'x') == 'x'
+    with pytest.raises(Exception):
+        flatten_value(subplan, 1)
@@ -0,0 +1,127 @@
+import datetime
+
+import b2cloud
+import b2cloud.bulk
+from tests.stub import history_stub, stub_session
+
+TODAY = datetime.date.today()
+
+
+def make_entries(days:range):
+    entries = []
+    for i in days:
+        date = (TODAY + datetime.timedelta(days=i)).strftime('%Y/%m/%d')
+        for service_type in ('0', '3'):
+            entries.append({'shipment': {'shipment_date': date, 'service_type': service_type, 'tracking_number': f'{i}-{service_type}'}})
+    return entries
+
+
+def test_iter_history():
+    """
+    過去90日を分割して検索し、範囲外の伝票も漏れなく返す
+    """
+    entries = make_entries(range(-120, 10, 3))
+    stub, queries = history_stub(entries)
+    result = list(b2cloud.iter_history(stub_session(stub), window_days=7, service_type='3'))
+
+    assert [e['shipment']['tracking_number'] for e in result] == \
+        [e['shipment']['tracking_number'] for e in entries if e['shipment']['service_type'] == '3']
+    assert len(queries) == 13
+    assert all(q['service_type'] == '3' and q['display_flg'] == '1' for q in queries)
+    assert not any(k.startswith('shipment_date-ge-') for k in queries[0])
+    assert not any(k.startswith('shipment_date-le-') for k in queries[-1])
+
+
+def test_iter_history_range():
+    """
+    出荷予定日の指定があれば、その範囲だけを分割する
+    """
+    entries = make_entries(range(-10, 0))
+    stub, queries = history_stub(entries)
+    result = list(b2cloud.iter_history(
+        stub_session(stub),
+        shipment_plan_from=TODAY - datetime.timedelta(days=5),
+        shipment_plan_to=TODAY - datetime.timedelta(days=2),
+    ))
+    assert [e['shipment']['tracking_number'] for e in result] == \
+        [f'{i}-{t}' for i in range(-5, -1) for t in ('0', '3')]
+    assert len(queries) == 4
+
+
+def test_iter_history_datetime():
+    """
+    出荷予定日はdatetimeでも指定できる
+    """
+    entries = make_entries(range(-10, 0))
+    stub, queries = history_stub(entries)
+    start = datetime.datetime.combine(TODAY - datetime.timedelta(days=5), datetime.time(9, 30))
+    result = list(b2cloud.iter_history(stub_session(stub), window_days=2, shipment_plan_from=start))
+    assert [e['shipment']['tracking_number'] for e in result] == \
+        [f'{i}-{t}' for i in range(-5, 0) for t in ('0', '3')]
+    assert len(queries) == 3
+    assert not any(k.startswith('shipment_date-le-') for k in queries[-1])
+
+
+def test_history_windows():
+    day = datetime.timedelta(days=1)
+    start = datetime.date(2023, 1, 1)
+    assert b2cloud.history_windows(start, start + day * 4, 2) == \
+        [(start, start + day), (start + day * 2, start + day * 3), (start + day * 4, start + day * 4)]
+    windows = b2cloud.history_windows(None, None, 7)
+    assert windows[0] == (None, TODAY - day * 84) and windows[-1][1] is None and len(windows) == 13
+    windows = b2cloud.history_windows(None, None, 7, separate_open_ends=True)
+    assert windows[0] == (None, TODAY - day * 91) and windows[-1] == (TODAY + day, None) and len(windows) == 15
+    # 範囲が逆の場合はそのまま1期間にする
+    assert b2cloud.history_windows(start, start - day) == [(start, start - day)]
+
+
+def test_search_history_params():
+    stub, queries = history_stub([])
+    b2cloud.search_history(stub_session(stub), service_type='3', shipment_plan_from=datetime.date(2023, 1, 2), tracking_number_to='123')
+    assert queries == [{'all': '', 'service_type': '3', 'shipment_date-ge-20230102': '', 'display_flg': '1', 'tracking_number-le-123': ''}]
+
+
+def test_parallel_search_history():
+    """
+    件数の多い期間は分割し直し、出荷予定日の順に重複なく結合する
+    """
+    entries = make_entries(range(-120, 10))
+    # 直近の10日間に集中させる
+    for i in range(-10, 0):
+        date = (TODAY + datetime.timedelta(days=i)).strftime('%Y/%m/%d')
+        entries += [{'shipment': {'shipment_date': date, 'service_type': '0', 'tracking_number': f'{i}-0-{n}'}} for n in range(20)]
+    entries.sort(key=lambda e: e['shipment']['shipment_date'])
+    # 同じ送り状番号が2回返っても1件にする
+    entries.insert(1, entries[0])
+    stub, queries = history_stub(entries)
+
+    feed = b2cloud.bulk.search_history(stub_session(stub), window_days=30, max_count=30, max_workers=4)
+    expected = [e['shipment']['tracking_number'] for e in entries[1:]]
+    assert [e['shipment']['tracking_number'] for e in feed['feed']['entry']] == expected
+
+    fetches = [q for q in queries if 'count' not in q]
+    counts = [q for q in queries if 'count' in q]
+    assert len(counts) > 6
+    assert all(len(stub_filter(entries, q)) <= 30 for q in fetches if len(date_keys(q)) == 2 and len(set(date_keys(q).values())) > 1)
+
+
+def test_parallel_search_history_datetime():
+    """
+    出荷予定日はdatetimeでも指定できる
+    """
+    entries = make_entries(range(-10, 0))
+    stub, _ = history_stub(entries)
+    start = datetime.datetime.combine(TODAY - datetime.timedelta(days=5), datetime.time(9, 30))
+    feed = b2cloud.bulk.search_history(stub_session(stub), window_days=2, max_count=2, shipment_plan_from=start)
+    assert [e['shipment']['tracking_number'] for e in feed['feed']['entry']] == \
+        [f'{i}-{t}' for i in range(-5, 0) for t in ('0', '3')]
+
+
+def date_keys(params:dict)->dict:
+    return {k[:17]: k[17:] for k in params if k.startswith('shipment_date-')}
+
+
+def stub_filter(entries:list, params:dict)->list:
+    keys = date_keys(params)
+    return [e for e in entries
+            if keys.get('shipment_date-ge-', '') <= e['shipment']['shipment_date'] <= keys.get('shipment_date-le-', '99999999')]
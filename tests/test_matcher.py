@@ -0,0 +1,83 @@
+import random
+from difflib import SequenceMatcher
+
+import b2cloud.utilities
+from b2cloud.matcher import PostalMatcher, char_masks, lcs_length
+
+
+def postal_feed(zip_code:str, towns:list):
+    """
+    towns: [(都道府県, 市区, 町域)]
+    """
+    return {'feed': {'entry': [
+        {'address': {'zip_code': zip_code, 'address1': a1, 'address2': a2, 'address3': a3}} for a1, a2, a3 in towns
+    ]}}
+
+
+SAPPORO = postal_feed('0600000', [('北海道', '札幌市中央区', town) for town in
+                                  ['', '旭ケ丘', '大通西', '大通東', '北一条西', '北一条東', '南一条西', '南一条東']])
+KYOTO = postal_feed('6048151', [('京都府', '京都市中京区', town) for town in ['板倉町', '場之町', '元竹田町', '占出山町']])
+BORDER = postal_feed('4980000', [('愛知県', '弥富市', ''), ('三重県', '桑名郡木曽岬町', '')])
+
+# (郵便番号情報, 住所, 正解の(市区, 町域))
+CASES = [
+    (SAPPORO, '北海道札幌市中央区大通西5丁目', ('札幌市中央区', '大通西')),
+    (SAPPORO, '札幌市中央区北一条東3-1', ('札幌市中央区', '北一条東')),
+    (SAPPORO, '北海道札幌市中央区南１条西２丁目', ('札幌市中央区', '南一条西')),
+    (SAPPORO, '北海道　札幌市中央区　旭ケ丘２丁目', ('札幌市中央区', '旭ケ丘')),
+    (SAPPORO, '北海道札幌市中央区宮の森1条', ('札幌市中央区', '')),
+    (KYOTO, '京都府京都市中京区場之町600', ('京都市中京区', '場之町')),
+    (KYOTO, '京都市中京区元竹田町641', ('京都市中京区', '元竹田町')),
+    (KYOTO, '京都府京都市中京区烏丸通錦小路上る占出山町308', ('京都市中京区', '占出山町')),
+    (BORDER, '三重県桑名郡木曽岬町大字和富', ('桑名郡木曽岬町', '')),
+    (BORDER, '愛知県弥富市鯏浦町', ('弥富市', '')),
+]
+
+
+def legacy_choice_postal(postal_feed:dict, address:str):
+    ret = None
+    max_ratio = 0
+    for postal in postal_feed['feed']['entry']:
+        _address = postal['address']['address1'] + postal['address']['address2'] + postal['address']['address3']
+        ratio = SequenceMatcher(None, address, _address).ratio()
+        if ratio > max_ratio:
+            max_ratio = ratio
+            ret = postal
+    return ret
+
+
+def lcs_reference(a:str, b:str)->int:
+    dp = [[0] * (len(b) + 1) for _ in range(len(a) + 1)]
+    for i, x in enumerate(a):
+        for j, y in enumerate(b):
+            dp[i + 1][j + 1] = dp[i][j] + 1 if x == y else max(dp[i][j + 1], dp[i + 1][j])
+    return dp[-1][-1]
+
+
+def test_lcs_length():
+    rng = random.Random(0)
+    for _ in range(500):
+        a = ''.join(rng.choice('abcde') for _ in range(rng.randint(0, 30)))
+        b = ''.join(rng.choice('abcde') for _ in range(rng.randint(0, 80)))
+        assert lcs_length(char_masks(b), len(b), a) == lcs_reference(a, b)
+
+
+def test_accuracy():
+    """
+    全ての住所で正解を選び、SequenceMatcherと同じ候補を選ぶ
+    """
+    for feed, address, expected in CASES:
+        chosen = b2cloud.utilities.choice_postal(feed, address)
+        assert (chosen['address']['address2'], chosen['address']['address3']) == expected, address
+        assert chosen is legacy_choice_postal(feed, address), address
+
+
+def test_batch():
+    addresses = [address for feed, address, _ in CASES if feed is SAPPORO]
+    assert b2cloud.utilities.choice_postals(SAPPORO, addresses) == \
+        [b2cloud.utilities.choice_postal(SAPPORO, address) for address in addresses]
+
+
+def test_no_match():
+    assert PostalMatcher(KYOTO).choose('xyz') is None
+    assert PostalMatcher({'feed': {}}).choose('京都') is None
@@ -0,0 +1,116 @@
+import datetime
+
+import pytest
+
+from b2cloud.mirror import HistoryMirror
+from tests.stub import history_stub, stub_session
+
+TODAY = datetime.date.today()
+
+
+def shipment(tracking_number:str, days:int, result_days=None, name='テスト'):
+    date = (TODAY + datetime.timedelta(days=days)).strftime('%Y/%m/%d')
+    result = {'tracking_number': tracking_number, 'shipment_date': date, 'service_type': '0', 'consignee_name': name}
+    if result_days is not None:
+        result['shipment_result_date'] = (TODAY + datetime.timedelta(days=result_days)).strftime('%Y/%m/%d')
+    return {'shipment': result}
+
+
+def test_sync(tmp_path):
+    """
+    初回は全件、2回目以降は差分だけを取り込む
+    """
+    entries = [shipment(f'1000{i}', -i, -i) for i in range(10)]
+    deleted = []
+    stub, queries = history_stub(entries, deleted)
+    session = stub_session(stub)
+    path = str(tmp_path / 'history.sqlite3')
+
+    mirror = HistoryMirror(path)
+    stats = mirror.sync(session)
+    assert stats['full'] and stats['upserted'] == 10
+    assert mirror.count() == 10
+    mirror.close()
+
+    # 出荷済みになった伝票、新しく発行した伝票、削除した伝票
+    entries[0] = shipment('10000', 0, 0, name='変更')
+    entries.append(shipment('20000', 1))
+    deleted.append(entries.pop(5))
+    queries.clear()
+
+    mirror = HistoryMirror(path)
+    stats = mirror.sync(session)
+    assert not stats['full']
+    assert stats['upserted'] == 4  # 前日以降の出荷2件、最大の送り状番号以降の2件
+    assert stats['deleted'] == 1
+    assert len(queries) == 3
+    assert 'shipment_result_date-ge-' + (TODAY - datetime.timedelta(days=1)).strftime('%Y%m%d') in queries[0]
+    assert 'tracking_number-ge-10009' in queries[1]
+
+    assert mirror.get('10000')['shipment']['consignee_name'] == '変更'
+    assert mirror.get('20000') is not None
+    assert mirror.get('10005') is None
+    assert mirror.get('10005', include_deleted=True) is not None
+    assert mirror.count() == 10
+    assert mirror.count(include_deleted=True) == 11
+
+
+def test_search_history():
+    """
+    search_historyと同じ条件でローカルを検索する
+    """
+    entries = [
+        shipment('10001', -3, name='山田 太郎'),
+        shipment('10002', -2, name='山田商店'),
+        shipment('10003', -1, name='田中花子'),
+        shipment('10004', 0, name='山'),
+    ]
+    entries[1]['shipment']['search_key1'] = 'ORDER-2'
+    entries[1]['shipment']['search_key_title1'] = '注文番号'
+    entries[2]['shipment']['consignee_telephone'] = '03-1234-5678'
+    entries[3]['shipment']['closure_key'] = 'A'
+    deleted = [shipment('10005', 0, name='山田次郎')]
+    stub, _ = history_stub(entries, deleted)
+    mirror = HistoryMirror()
+    mirror.sync(stub_session(stub))
+
+    def tracking_numbers(**conditions):
+        return [e['shipment']['tracking_number'] for e in mirror.search_history(**conditions)['feed']['entry']]
+
+    assert tracking_numbers(consignee_name='山田') == ['10001', '10002']
+    assert tracking_numbers(consignee_name='田太') == ['10001']
+    assert tracking_numbers(consignee_name='山') == ['10001', '10002', '10004']
+    assert tracking_numbers(consignee_name='山田', display_flg='0') == ['10005']
+    assert tracking_numbers(consignee_name='山田', display_flg=None) == ['10001', '10002', '10005']
+    assert tracking_numbers(search_key1='ORDER-2') == ['10002']
+    assert tracking_numbers(search_title1='注文番号', search_key1='ORDER-2') == ['10002']
+    assert tracking_numbers(search_title1='備考', search_key1='ORDER-2') == []
+    assert tracking_numbers(consignee_telephone='03-1234-5678') == ['10003']
+    assert tracking_numbers(closure_key='A') == ['10004']
+    assert tracking_numbers(shipment_plan_from=TODAY - datetime.timedelta(days=2),
+                            shipment_plan_to=TODAY - datetime.timedelta(days=1)) == ['10002', '10003']
+    assert tracking_numbers(tracking_number_from='10003') == ['10003', '10004']
+    assert tracking_numbers(tracking_number='10001') == ['10001']
+    with pytest.raises(Exception):
+        mirror.search_history(issuer_loginid='user')
+
+
+def test_search_history_date_range():
+    """
+    B2クラウドが返す'yyyy/mm/dd'の日付を範囲で検索できる
+    """
+    entries = [{'shipment': {'tracking_number': '10001', 'shipment_date': '2026/10/15', 'shipment_result_date': '2026/10/16'}}]
+    stub, _ = history_stub(entries)
+    mirror = HistoryMirror()
+    mirror.sync(stub_session(stub))
+
+    def count(**conditions):
+        return len(mirror.search_history(**conditions)['feed']['entry'])
+
+    assert count(shipment_plan_from=datetime.date(2026, 10, 1)) == 1
+    assert count(shipment_plan_from=datetime.date(2026, 10, 15), shipment_plan_to=datetime.date(2026, 10, 15)) == 1
+    assert count(shipment_plan_to=datetime.date(2026, 10, 14)) == 0
+    assert count(shipment_plan_from=datetime.date(2026, 10, 16)) == 0
+    assert count(shipment_result_date_from=datetime.date(2026, 10, 16)) == 1
+    assert count(shipment_result_date_to=datetime.date(2026, 10, 15)) == 0
+
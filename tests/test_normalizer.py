@@ -0,0 +1,37 @@
+import pytest
+
+import b2cloud.utilities
+from b2cloud.normalizer import normalize_column, normalize_shipments
+
+
+@pytest.mark.parametrize('rule, value, expected', [
+    ('text', '  山田　 太郎 ', '山田 太郎'),
+    ('kana', 'やまだ　タロウ', 'ﾔﾏﾀﾞ ﾀﾛｳ'),
+    ('kana', 'ガーデン・パピヨン ヴィラ', 'ｶﾞｰﾃﾞﾝ･ﾊﾟﾋﾟﾖﾝ ｳﾞｨﾗ'),
+    ('kana', 'ﾔﾏﾀﾞ ＡＢＣ', 'ﾔﾏﾀﾞ ABC'),
+    ('telephone', '０３－１２３４ー５６７８ ', '03-1234-5678'),
+    ('telephone', '03‐1234‐5678', '03-1234-5678'),
+    ('zip', '〒１２３－４５６７', '1234567'),
+    ('address', '中央町１０ー１２　キャンセビル６Ｆ', '中央町10-12 キャンセビル6F'),
+    ('address', 'サーバー1丁目', 'サーバー1丁目'),
+])
+def test_rules(rule, value, expected):
+    assert normalize_column([value], rule) == [expected]
+
+
+def test_text_matches_legacy():
+    """
+    'text'はnormalize_and_trim_whitespace_in_textと同じ結果
+    """
+    values = [' a　b\t\nc ', '　', '山田  太郎', '']
+    assert normalize_column(values, 'text') == [b2cloud.utilities.normalize_and_trim_whitespace_in_text(v) for v in values]
+
+
+def test_normalize_shipments():
+    shipments = [
+        {'shipment': {'consignee_name': ' 山田　太郎', 'consignee_zip_code': '８９０－００５３', 'consignee_name_kana': 'やまだ'}},
+        {'consignee_telephone_display': '０９９－１２３－４５６７', 'consignee_name': None, 'note': ' x '},
+    ]
+    assert normalize_shipments(shipments) is shipments
+    assert shipments[0]['shipment'] == {'consignee_name': '山田 太郎', 'consignee_zip_code': '8900053', 'consignee_name_kana': 'ﾔﾏﾀﾞ'}
+    assert shipments[1] == {'consignee_telephone_display': '099-123-4567', 'consignee_name': None, 'note': ' x '}
@@ -0,0 +1,81 @@
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+import b2cloud
+import b2cloud.polling
+from tests.stub import B2Stub, stub_session
+
+POLICY = b2cloud.polling.PollingPolicy(initial=0.001, multiplier=2, cap=0.01, deadline=1, jitter=0.1)
+
+
+def polling_stub(ready):
+    """
+    ready[issue_no]回目のポーリングで完了する
+    """
+    polls = {}
+
+    def polling(request):
+        issue_no = parse_qs(urlsplit(request.url).query)['issue_no'][0]
+        polls[issue_no] = polls.get(issue_no, 0) + 1
+        title = 'Success' if polls[issue_no] >= ready[issue_no] else 'Processing'
+        return 200, {'feed': {'title': title}}
+
+    return B2Stub().route('GET', '/b2/p/polling', polling), polls
+
+
+def test_policy_delay():
+    """
+    待ち時間は倍率で増え、上限で止まる
+    """
+    policy = b2cloud.polling.PollingPolicy(initial=0.1, multiplier=2, cap=0.5, jitter=0)
+    assert [policy.delay(i) for i in range(5)] == [0.1, 0.2, 0.4, 0.5, 0.5]
+    policy = b2cloud.polling.PollingPolicy(initial=1, jitter=0.1)
+    assert all(0.9 <= policy.delay(0) <= 1.1 for _ in range(100))
+
+
+def test_policy_delay_many_polls():
+    """
+    ポーリング回数が多くても桁あふれせず上限を返す
+    """
+    policy = b2cloud.polling.PollingPolicy(jitter=0)
+    assert policy.delay(10000) == policy.cap
+    policy = b2cloud.polling.PollingPolicy(initial=5, multiplier=2, cap=2, jitter=0)
+    assert policy.delay(10000) == 2
+
+
+def test_iter_wait_issues():
+    """
+    複数の発行ジョブを完了した順に返す
+    """
+    stub, polls = polling_stub({'A': 5, 'B': 1, 'C': 3})
+    res = list(b2cloud.polling.iter_wait_issues(stub_session(stub), ['A', 'B', 'C'], POLICY))
+    assert [r['issue_no'] for r in res] == ['B', 'C', 'A']
+    assert [r['polls'] for r in res] == [1, 3, 5]
+    assert all(r['success'] for r in res)
+    assert b2cloud.polling.HISTORY[-1] == res[-1]
+
+
+def test_deadline():
+    """
+    deadlineまでに完了しない場合は失敗
+    """
+    stub, polls = polling_stub({'A': 10 ** 6})
+    policy = b2cloud.polling.PollingPolicy(initial=0.001, cap=0.005, deadline=0.05)
+    res = b2cloud.polling.wait_issues(stub_session(stub), ['A'], policy)
+    assert res['A']['success'] is False
+    with pytest.raises(Exception):
+        b2cloud.polling.wait_issue(stub_session(stub), 'A', policy)
+
+
+def test_get_dm_number_print():
+    """
+    DM便番号一覧のPDFを取得する
+    """
+    stub, polls = polling_stub({'12345': 2})
+    stub.route('GET', '/b2/p/history', lambda request: (200, {'feed': {'title': '12345'}}))
+    stub.route('GET', '/b2/p/B2_OKURIJYO',
+               lambda request: (200, b'%PDF-1.4' if 'fileonly' in request.url else b''))
+    res = b2cloud.get_dm_number_print(stub_session(stub), {'service_type': '3'}, polling_policy=POLICY)
+    assert res == b'%PDF-1.4'
+    assert polls == {'12345': 2}
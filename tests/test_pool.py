@@ -0,0 +1,139 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import b2cloud
+from b2cloud.pool import B2Session, B2SessionPool
+from tests.stub import B2Stub
+
+LOGIN_HTML = b'<html><body><span id="ybmHeaderUserName">test</span></body></html>'
+HTML = {'Content-Type': 'text/html; charset=utf-8'}
+
+
+def pool_stub(delay:float=0, expired_response=(200, b'<html></html>', HTML)):
+    """
+    expired['value']がTrueの間は、APIがexpired_response(既定はログイン画面のhtml)を返す
+    """
+    expired = {'value': False}
+    lock = threading.Lock()
+
+    def login(request):
+        return 200, LOGIN_HTML, HTML
+
+    def index(request):
+        with lock:
+            expired['value'] = False
+        return 200, b'', HTML
+
+    def history(request):
+        if expired['value']:
+            return expired_response
+        return 200, {'feed': {'entry': []}}
+
+    stub = B2Stub(delay=delay)
+    stub.route('POST', '/bmypageapi/login', login)
+    stub.route('GET', '/b2/d/_html/index.html', index)
+    stub.route('GET', '/b2/p/history', history)
+    return stub, expired
+
+
+def stub_class(stub:B2Stub):
+    class StubSession(B2Session):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.mount('https://', stub)
+    return StubSession
+
+
+def test_relogin():
+    """
+    セッション切れを検知するとログインし直して再送する
+    """
+    stub, expired = pool_stub()
+    session = stub_class(stub)('code', 'password')
+    session.login()
+    assert b2cloud.get_history(session, {}) == {'feed': {'entry': []}}
+
+    expired['value'] = True
+    assert b2cloud.get_history(session, {}) == {'feed': {'entry': []}}
+    assert session.logins == 2
+    assert session.relogins == 1
+
+
+@pytest.mark.parametrize('expired_response', [
+    (200, {'feed': {'title': 'Authentication error. Please log in.'}}),
+    (200, {'feed': {'title': 'ログインしてください。'}}),
+    (401, {'feed': {'title': 'Unauthorized.'}}),
+])
+def test_relogin_auth_error_json(expired_response):
+    """
+    APIが認証エラーのjsonを返した場合もログインし直して再送する
+    """
+    stub, expired = pool_stub(expired_response=expired_response)
+    session = stub_class(stub)('code', 'password')
+    session.login()
+    expired['value'] = True
+    assert b2cloud.get_history(session, {}) == {'feed': {'entry': []}}
+    assert session.relogins == 1
+
+
+def test_error_json_is_not_expired():
+    """
+    認証エラー以外のエラーのjsonではログインし直さない
+    """
+    stub, expired = pool_stub(expired_response=(200, {'feed': {'title': 'Error'}}))
+    session = stub_class(stub)('code', 'password')
+    session.login()
+    expired['value'] = True
+    assert b2cloud.get_history(session, {}) == {'feed': {'title': 'Error'}}
+    assert session.relogins == 0
+
+
+def test_relogin_once():
+    """
+    複数のスレッドが同時にセッション切れを検知しても、ログインし直すのは1回
+    """
+    stub, expired = pool_stub(delay=0.01)
+    session = stub_class(stub)('code', 'password')
+    session.login()
+    expired['value'] = True
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda _: b2cloud.get_history(session, {}), range(8)))
+    assert results == [{'feed': {'entry': []}}] * 8
+    assert session.relogins == 1
+
+
+def test_pool():
+    """
+    セッションはsize個まで作成し、返却されたものを使い回す
+    """
+    stub, _ = pool_stub(delay=0.01)
+    pool = B2SessionPool('code', 'password', size=2, session_class=stub_class(stub))
+    pool.warm(1)
+    assert pool.stats()['created'] == 1
+
+    def work(_):
+        with pool.session() as session:
+            return b2cloud.get_history(session, {})
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(work, range(8)))
+
+    stats = pool.stats()
+    assert stats['created'] == 2
+    assert stats['idle'] == 2
+    assert stats['borrowed'] == 8
+    assert stats['logins'] == 2
+    assert stats['relogins'] == 0
+    pool.close()
+
+
+def test_pool_timeout():
+    stub, _ = pool_stub()
+    pool = B2SessionPool('code', 'password', size=1, session_class=stub_class(stub))
+    with pool.session():
+        with pytest.raises(Exception):
+            with pool.session(timeout=0.01):
+                pass
+    assert pool.stats()['waits'] == 1
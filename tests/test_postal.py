@@ -0,0 +1,114 @@
+import io
+import threading
+import zipfile
+from urllib.parse import parse_qsl, urlsplit
+
+import pytest
+
+import b2cloud.utilities
+from b2cloud.postal import PostalCache, iter_ken_all
+from tests.stub import B2Stub, stub_session
+
+KEN_ALL = '\r\n'.join([
+    '01101,"060  ","0600000","ﾎｯｶｲﾄﾞｳ","ｻｯﾎﾟﾛｼﾁｭｳｵｳｸ","ｲｶﾆｹｲｻｲｶﾞﾅｲﾊﾞｱｲ","北海道","札幌市中央区","以下に掲載がない場合",0,0,0,0,0,0',
+    '01101,"064  ","0640941","ﾎｯｶｲﾄﾞｳ","ｻｯﾎﾟﾛｼﾁｭｳｵｳｸ","ｱｻﾋｶﾞｵｶ","北海道","札幌市中央区","旭ケ丘",0,0,1,0,0,0',
+    '13101,"100  ","1006090","ﾄｳｷｮｳﾄ","ﾁﾖﾀﾞｸ","ｶｽﾐｶﾞｾｷｶｽﾐｶﾞｾｷﾋﾞﾙ(ﾁｶｲ･ｶｲｿｳﾌﾒｲ)","東京都","千代田区","霞が関霞が関ビル（地階・階層不明）",0,0,0,0,0,0',
+    '26104,"604  ","6048151","ｷｮｳﾄﾌ","ｷｮｳﾄｼﾅｶｷﾞｮｳｸ","ｲﾀｸﾗﾁｮｳ","京都府","京都市中京区","板倉町（烏丸通錦小路上る、錦小路通烏丸西入、",0,0,0,0,0,0',
+    '26104,"604  ","6048151","ｷｮｳﾄﾌ","ｷｮｳﾄｼﾅｶｷﾞｮｳｸ","ｲﾀｸﾗﾁｮｳ","京都府","京都市中京区","室町通錦小路上る）",0,0,0,0,0,0',
+    '26104,"604  ","6048151","ｷｮｳﾄﾌ","ｷｮｳﾄｼﾅｶｷﾞｮｳｸ","ｼﾞｮｳｶｲﾁｮｳ","京都府","京都市中京区","場之町",0,0,0,0,0,0',
+]).encode('cp932')
+
+
+def postal_stub(delay:float=0):
+    calls = []
+
+    def postal(request):
+        code = dict(parse_qsl(urlsplit(request.url).query))['code']
+        calls.append(code)
+        return 200, {'feed': {'entry': [{'address': {'zip_code': code, 'address1': '東京都', 'address2': '千代田区', 'address3': code}}]}}
+
+    return B2Stub(delay=delay).route('GET', '/b2/p/_postal', postal), calls
+
+
+def test_single_flight():
+    """
+    同じ郵便番号の同時の問い合わせは1回にまとめる
+    """
+    stub, calls = postal_stub(delay=0.05)
+    session = stub_session(stub)
+    cache = PostalCache()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get(session, '1000001'))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert calls == ['1000001']
+    assert len(results) == 8 and all(r is results[0] for r in results)
+
+
+def test_lru_and_ttl():
+    stub, calls = postal_stub()
+    session = stub_session(stub)
+    cache = PostalCache(maxsize=2)
+    for code in ['1000001', '1000002', '1000001', '1000003', '1000001', '1000002']:
+        cache.get(session, code)
+    # 1000002は1000003の追加で追い出される
+    assert calls == ['1000001', '1000002', '1000003', '1000002']
+
+    cache = PostalCache(ttl=0)
+    cache.get(session, '1000001')
+    cache.get(session, '1000001')
+    assert calls[-2:] == ['1000001', '1000001']
+
+
+def test_disk(tmp_path):
+    stub, calls = postal_stub()
+    session = stub_session(stub)
+    PostalCache(path=str(tmp_path / 'postal.sqlite3')).get(session, '1000001')
+    feed = PostalCache(path=str(tmp_path / 'postal.sqlite3')).get(session, '1000001')
+    assert calls == ['1000001']
+    assert feed['feed']['entry'][0]['address']['address3'] == '1000001'
+
+
+def test_prefetch():
+    stub, calls = postal_stub(delay=0.01)
+    session = stub_session(stub)
+    cache = PostalCache()
+    cache.get(session, '1000001')
+    assert cache.prefetch(session, ['1000001', '1000002', '1000003', '1000002'], max_workers=4) == 2
+    assert sorted(calls) == ['1000001', '1000002', '1000003']
+    assert stub.max_active == 2
+
+
+def test_error_not_cached():
+    stub = B2Stub().route('GET', '/b2/p/_postal', lambda request: (500, b'error'))
+    cache = PostalCache()
+    with pytest.raises(ValueError):
+        cache.get(stub_session(stub), '1000001')
+    assert '1000001' not in cache
+
+
+@pytest.mark.parametrize('zipped', [False, True])
+def test_ken_all(zipped):
+    data = KEN_ALL
+    if zipped:
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, 'w') as zf:
+            zf.writestr('KEN_ALL.CSV', KEN_ALL)
+        data = buf.getvalue()
+
+    assert list(iter_ken_all(io.BytesIO(data))) == [
+        {'zip_code': '0600000', 'address1': '北海道', 'address2': '札幌市中央区', 'address3': ''},
+        {'zip_code': '0640941', 'address1': '北海道', 'address2': '札幌市中央区', 'address3': '旭ケ丘'},
+        {'zip_code': '1006090', 'address1': '東京都', 'address2': '千代田区', 'address3': '霞が関霞が関ビル'},
+        {'zip_code': '6048151', 'address1': '京都府', 'address2': '京都市中京区', 'address3': '板倉町'},
+        {'zip_code': '6048151', 'address1': '京都府', 'address2': '京都市中京区', 'address3': '場之町'},
+    ]
+
+    cache = PostalCache()
+    assert cache.load_ken_all(io.BytesIO(data)) == 4
+    stub, calls = postal_stub()
+    feed = cache.get(stub_session(stub), '6048151')
+    assert calls == []
+    assert b2cloud.utilities.choice_postal(feed, '京都府京都市中京区場之町1')['address']['address3'] == '場之町'
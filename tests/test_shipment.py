@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+import b2cloud
+from b2cloud.encoder import compile_template, create_field_list
+from b2cloud.shipment import FIELDS, Shipment, ShipmentBatch
+from tests.stub import B2Stub, request_json, stub_session
+
+
+def test_shipment():
+    shipment = Shipment(service_type='3', consignee_name='テスト', created_ms='123')
+    assert shipment.consignee_name == 'テスト'
+    assert shipment.shipment_date == ''
+    assert shipment['created_ms'] == '123'
+    assert shipment.to_dict() == {'shipment': {'service_type': '3', 'consignee_name': 'テスト', 'created_ms': '123'}}
+    assert Shipment.from_dict(shipment.to_dict()) == shipment
+    with pytest.raises(AttributeError):
+        shipment.unknown
+    assert not hasattr(shipment, '__dict__')
+    assert len(FIELDS) == len(b2cloud.utilities.create_empty_shipment()['shipment'])
+
+
+def create_batch():
+    batch = ShipmentBatch()
+    batch.append(Shipment(service_type='3', consignee_name='テスト"1"'))
+    batch.append({'id': '/a,1', 'link': [{'___href': '/a', '___rel': 'self'}], 'shipment': {'tracking_number': '1', 'service_type': ''}})
+    batch.append(consignee_name='テスト3', shipment_date='2023/01/01')
+    return batch
+
+
+def test_batch():
+    batch = create_batch()
+    assert len(batch) == 3
+    assert batch[2] == Shipment(consignee_name='テスト3', shipment_date='2023/01/01')
+    assert batch.to_feed() == {'feed': {'entry': [
+        {'shipment': {'service_type': '3', 'consignee_name': 'テスト"1"'}},
+        {'id': '/a,1', 'link': [{'___href': '/a', '___rel': 'self'}], 'shipment': {'tracking_number': '1'}},
+        {'shipment': {'consignee_name': 'テスト3', 'shipment_date': '2023/01/01'}},
+    ]}}
+    assert json.loads(batch.to_json()) == batch.to_feed()
+
+
+def test_batch_field_list():
+    """
+    create_field_listと同じfield_listになる
+    """
+    template = {
+        'id': {},
+        'link': {'___href': '', '___rel': ''},
+        'shipment': {'tracking_number': '', 'consignee_name': '', 'shipment_date': ''},
+    }
+    plan = compile_template(template)
+    batch = create_batch()
+    assert batch.to_field_list(plan) == create_field_list(plan, batch.to_feed())
+
+
+def test_post_new_checkonly():
+    bodies = []
+
+    def checkonly(request):
+        bodies.append(request_json(request))
+        assert request.headers['Content-Type'] == 'application/json'
+        return 200, {'feed': {'entry': bodies[-1]['feed']['entry']}}
+
+    stub = B2Stub().route('POST', '/b2/p/new', checkonly)
+    batch = create_batch()
+    b2cloud.post_new_checkonly(stub_session(stub), batch)
+    assert bodies == [batch.to_feed()]
@@ -0,0 +1,103 @@
+import io
+import zipfile
+
+import fitz
+import pytest
+
+import b2cloud.utilities
+
+
+def create_pdf(rects, pages):
+    """
+    伝票の位置に伝票の番号を印字したPDFデータ
+    """
+    doc = fitz.open()
+    for page_num in range(pages):
+        page = doc.new_page(width=595, height=842)
+        for i, rect in enumerate(rects):
+            page.insert_text((rect.x0 + 10, rect.y0 + 20), f'label{page_num * len(rects) + i:03d}')
+    return doc.tobytes()
+
+
+def label_text(pdf):
+    with fitz.open(stream=pdf, filetype='pdf') as doc:
+        return doc[0].get_text().strip()
+
+
+@pytest.mark.parametrize('split, rects', [
+    (b2cloud.utilities.split_pdf_dm, b2cloud.utilities.DM_RECTS),
+    (b2cloud.utilities.split_pdf_nekopos, b2cloud.utilities.NEKOPOS_RECTS),
+])
+def test_split_pdf(split, rects):
+    """
+    伝票毎に分割する。最後のシートは途中まで
+    """
+    pdf = create_pdf(rects, 3)
+    length = len(rects) * 2 + 3
+    labels = split(pdf, length)
+    assert [label_text(label) for label in labels] == [f'label{i:03d}' for i in range(length)]
+    with fitz.open(stream=labels[len(rects) + 1], filetype='pdf') as doc:
+        assert doc[0].cropbox == rects[1]
+
+
+def test_split_pdf_to_pages():
+    """
+    1ページ1伝票のPDFデータにする
+    """
+    pdf = create_pdf(b2cloud.utilities.DM_RECTS, 2)
+    res = b2cloud.utilities.split_pdf_to_pages(pdf, b2cloud.utilities.DM_RECTS, 10)
+    with fitz.open(stream=res, filetype='pdf') as doc:
+        assert [page.get_text().strip() for page in doc] == [f'label{i:03d}' for i in range(10)]
+        assert doc[0].rect == fitz.Rect(0, 0, 250, 200)
+
+
+def test_write_labels(tmp_path):
+    """
+    ディレクトリ、zipに書き出す
+    """
+    pdf = create_pdf(b2cloud.utilities.DM_RECTS, 1)
+    labels = list(b2cloud.utilities.iter_split_pdf(pdf, b2cloud.utilities.DM_RECTS, 3))
+
+    paths = b2cloud.utilities.write_labels(labels, directory=str(tmp_path))
+    assert [open(path, 'rb').read() for path in paths] == labels
+
+    buf = io.BytesIO()
+    names = b2cloud.utilities.write_labels(labels, zip_file=buf, filename='dm_{}.pdf')
+    assert names == ['dm_0.pdf', 'dm_1.pdf', 'dm_2.pdf']
+    with zipfile.ZipFile(buf) as zf:
+        assert [zf.read(name) for name in names] == labels
+
+
+@pytest.mark.parametrize('print_type', ['3', '7', 'm', 'm5'])
+def test_split_pdf_print_type(print_type):
+    """
+    print_typeの配置で分割し、伝票数は最後のシートの空きを除いて数える
+    """
+    rects = b2cloud.utilities.layout_rects(print_type)
+    length = len(rects) + 1
+    doc = fitz.open()
+    for page_num in range(2):
+        doc.new_page(width=595, height=842)
+    for i in range(length):
+        rect = rects[i % len(rects)]
+        doc[i // len(rects)].insert_text((rect.x0 + 10, rect.y0 + 20), f'label{i:03d}')
+    pdf = doc.tobytes()
+
+    assert b2cloud.utilities.count_labels(pdf, print_type) == length
+    labels = b2cloud.utilities.split_pdf(pdf, print_type)
+    assert [label_text(label) for label in labels] == [f'label{i:03d}' for i in range(length)]
+
+
+def test_register_layout():
+    """
+    伝票の配置を登録する
+    """
+    b2cloud.utilities.register_layout('test', 3, 1, 0, 0, 100, 0, 90, 50)
+    try:
+        assert b2cloud.utilities.layout_rects('test') == [
+            fitz.Rect(0, 0, 90, 50), fitz.Rect(100, 0, 190, 50), fitz.Rect(200, 0, 290, 50)
+        ]
+    finally:
+        del b2cloud.utilities.LAYOUTS['test']
+    with pytest.raises(Exception):
+        b2cloud.utilities.layout_rects('test')
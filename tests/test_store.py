@@ -0,0 +1,96 @@
+import os
+
+import pytest
+import requests
+
+# SessionStoreはstore extraのcryptographyが必要
+pytest.importorskip('cryptography')
+
+import b2cloud
+from b2cloud.store import SessionStore, generate_key
+from tests.stub import B2Stub, TEMPLATE
+
+LOGIN_HTML = b'<html><body><span id="ybmHeaderUserName">test</span></body></html>'
+HTML = {'Content-Type': 'text/html; charset=utf-8'}
+
+
+def store_stub(valid:set):
+    """
+    ログインするとcookieを発行し、validに含まれるcookieだけを有効とする
+    """
+    logins = []
+
+    def login(request):
+        logins.append(request)
+        token = f'token{len(logins)}'
+        valid.add(token)
+        return 200, LOGIN_HTML, {**HTML, 'Set-Cookie': f'SID={token}; Path=/; Domain=.kuronekoyamato.co.jp'}
+
+    def template(request):
+        if request.headers.get('Cookie', '').replace('SID=', '') in valid:
+            return 200, TEMPLATE.encode('utf-8'), {'Content-Type': 'text/plain'}
+        return 200, b'<html></html>', HTML
+
+    stub = B2Stub()
+    stub.route('POST', '/bmypageapi/login', login)
+    stub.route('GET', '/b2/d/_html/index.html', lambda request: (200, b'', HTML))
+    stub.route('GET', '/b2/d/_settings/template', template)
+    return stub, logins
+
+
+def stub_login(stub, store, customer_code='code'):
+    session = requests.Session()
+    session.mount('https://', stub)
+    return b2cloud.login(customer_code, 'password', session=session, store=store)
+
+
+def test_reuse(tmp_path):
+    """
+    保存したcookieが有効な間はログインしない
+    """
+    valid = set()
+    stub, logins = store_stub(valid)
+    store = SessionStore(str(tmp_path / 'session'), generate_key())
+
+    stub_login(stub, store)
+    assert len(logins) == 1
+    assert b'token1' not in open(tmp_path / 'session', 'rb').read()
+    assert os.stat(tmp_path / 'session').st_mode & 0o777 == 0o600
+
+    session = stub_login(stub, store)
+    assert len(logins) == 1
+    assert session.cookies['SID'] == 'token1'
+    # templateのキャッシュのkeyになるアカウント
+    assert session.b2_account == 'code::'
+
+    # 別のアカウントのcookieは使わない
+    stub_login(stub, store, customer_code='other')
+    assert len(logins) == 2
+
+
+def test_expired(tmp_path):
+    """
+    保存したcookieが無効になっていればログインし直して保存し直す
+    """
+    valid = set()
+    stub, logins = store_stub(valid)
+    store = SessionStore(str(tmp_path / 'session'), generate_key())
+    stub_login(stub, store)
+
+    valid.clear()
+    session = stub_login(stub, store)
+    assert len(logins) == 2
+    assert session.cookies['SID'] == 'token2'
+    assert stub_login(stub, store).cookies['SID'] == 'token2'
+    assert len(logins) == 2
+
+
+def test_wrong_key(tmp_path):
+    """
+    復号できないファイルは無視する
+    """
+    valid = set()
+    stub, logins = store_stub(valid)
+    stub_login(stub, SessionStore(str(tmp_path / 'session'), generate_key()))
+    stub_login(stub, SessionStore(str(tmp_path / 'session'), generate_key()))
+    assert len(logins) == 2
@@ -0,0 +1,99 @@
+import threading
+
+import b2cloud
+import b2cloud.template
+from tests.stub import B2Stub, TEMPLATE, stub_session
+
+
+def template_stub(delay=0):
+    stub = B2Stub(delay=delay)
+    stub.route('GET', '/b2/d/_settings/template', lambda request: (200, TEMPLATE.encode('utf-8')))
+    return stub
+
+
+def test_parse_template():
+    """
+    templateの定義をdictにする
+    """
+    template = b2cloud.template.parse_template(TEMPLATE)
+    assert template['link'] == {'___href': '', '___rel': '', '___type': '', '___title': '', '___length': ''}
+    assert template['id'] == {}
+    assert template['shipment'] == {
+        'tracking_number': '', 'shipment_number': '', 'consignee_name': '', 'consignee_zip_code': '', 'search_key1': ''
+    }
+
+
+def test_single_flight():
+    """
+    同時に取得してもB2クラウドへの問い合わせは1回
+    """
+    stub = template_stub(delay=0.05)
+    session = stub_session(stub)
+    cache = b2cloud.template.TemplateCache()
+    plans = []
+    threads = [threading.Thread(target=lambda: plans.append(cache.get(session))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(stub.calls) == 1
+    assert all(plan is plans[0] for plan in plans)
+
+
+def test_ttl():
+    """
+    期限切れで再取得しても、内容が同じならコンパイル済みのplanを使う
+    """
+    stub = template_stub()
+    session = stub_session(stub)
+    cache = b2cloud.template.TemplateCache(ttl=0)
+    plan = cache.get(session)
+    assert cache.get(session) is plan
+    assert len(stub.calls) == 2
+
+    stub.route('GET', '/b2/d/_settings/template', lambda request: (200, (TEMPLATE + '\n note').encode('utf-8')))
+    assert cache.get(session)[2][-1][0][-1] == 'note'
+
+
+def test_file_cache(tmp_path):
+    """
+    ディスクに保存したplanは別のインスタンスからB2クラウドへの問い合わせなしで読み込める
+    """
+    stub = template_stub()
+    session = stub_session(stub)
+    plan = b2cloud.template.FileTemplateCache(str(tmp_path)).get(session)
+
+    cache = b2cloud.template.FileTemplateCache(str(tmp_path))
+    assert cache.get(session) == plan
+    assert len(stub.calls) == 1
+
+    cache.clear()
+    cache.get(session)
+    assert len(stub.calls) == 2
+
+
+def test_put_tracking_per_account(monkeypatch):
+    """
+    loginしたアカウント毎に別のtemplateを使う
+    """
+    monkeypatch.setattr(b2cloud, 'TEMPLATE_CACHE', b2cloud.template.TemplateCache())
+    sessions = []
+    for account, text in (('A::', TEMPLATE), ('B::', TEMPLATE + '\n note')):
+        stub = B2Stub()
+        stub.route('GET', '/b2/d/_settings/template', lambda request, text=text: (200, text.encode('utf-8')))
+        stub.route('PUT', '/b2/p/history', lambda request: (200, {'feed': {'entry': []}}))
+        session = stub_session(stub)
+        session.b2_account = account
+        sessions.append((session, stub))
+
+    feed = {'feed': {'entry': [{'shipment': {'tracking_number': '400000000000'}}]}}
+    for session, _ in sessions * 2:
+        b2cloud.put_tracking(session, feed)
+
+    # 各アカウントのtemplateを1回ずつ取得する
+    assert [len([c for c in stub.calls if c.method == 'GET']) for _, stub in sessions] == [1, 1]
+    plan_a = b2cloud.TEMPLATE_CACHE.load('A::')['plan']
+    plan_b = b2cloud.TEMPLATE_CACHE.load('B::')['plan']
+    assert plan_a != plan_b
+    assert plan_b[2][-1][0][-1] == 'note'
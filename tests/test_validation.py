@@ -0,0 +1,84 @@
+from b2cloud.shipment import Shipment, ShipmentBatch
+from b2cloud.validation import RULES, check_shipments, compile_rules, validate_shipment, validate_shipments
+from tests.stub import B2Stub, request_json, stub_session
+
+
+def valid_shipment(**fields)->dict:
+    shipment = {
+        'service_type': '0',
+        'shipment_date': '2023/01/10',
+        'invoice_code': '0123456789',
+        'invoice_freight_no': '01',
+        'consignee_telephone_display': '03-1234-5678',
+        'consignee_name': 'テスト太郎',
+        'consignee_zip_code': '1000001',
+        'consignee_address1': '東京都',
+        'consignee_address2': '千代田区',
+        'consignee_address3': '千代田1-1',
+        'item_name1': '書籍',
+    }
+    shipment.update(fields)
+    return {'shipment': shipment}
+
+
+def codes(result)->list:
+    return [(e['error_property_name'], e['error_code']) for e in result['errors']]
+
+
+def test_valid():
+    assert validate_shipment(valid_shipment()) == {'success': True, 'errors': []}
+    # DM便は請求先・品名が不要
+    dm = valid_shipment(service_type='3', invoice_code='', invoice_freight_no='', item_name1='')
+    assert validate_shipment(dm)['success']
+
+
+def test_errors():
+    assert codes(validate_shipment(valid_shipment(consignee_name='', invoice_code=''))) == [
+        ('invoice_code', 'REQUIRED'), ('consignee_name', 'REQUIRED')]
+    assert codes(validate_shipment(valid_shipment(consignee_zip_code='100-00１'))) == [('consignee_zip_code', 'FORMAT')]
+    assert codes(validate_shipment(valid_shipment(consignee_name='テ' * 17))) == [('consignee_name', 'MAX_LENGTH')]
+    assert codes(validate_shipment(valid_shipment(service_type='1'))) == [('service_type', 'CHOICE')]
+    assert codes(validate_shipment(valid_shipment(shipment_date='2023/02/30'))) == [('shipment_date', 'DATE')]
+    assert codes(validate_shipment(valid_shipment(service_type='7', delivery_date='2023/01/11', is_cool='1'))) == [
+        ('delivery_date', 'SERVICE_TYPE'), ('is_cool', 'SERVICE_TYPE')]
+    assert codes(validate_shipment(valid_shipment(delivery_date='2023/01/09'))) == [('delivery_date', 'DATE')]
+
+
+def test_batch():
+    shipments = [valid_shipment(), valid_shipment(consignee_zip_code='')]
+    expected = [r['success'] for r in validate_shipments(shipments)]
+    assert expected == [True, False]
+    batch = ShipmentBatch(shipments)
+    assert [r['success'] for r in validate_shipments(batch)] == expected
+    assert [r['success'] for r in validate_shipments([Shipment.from_dict(s) for s in shipments])] == expected
+
+
+def test_custom_rules():
+    checks = compile_rules({**RULES, 'shipment_number': {'required': True}})
+    assert codes(validate_shipment(valid_shipment(), checks)) == [('shipment_number', 'REQUIRED')]
+
+
+def test_check_shipments():
+    """
+    ローカルのチェックで不備のある伝票は送らず、結果は元の順に並ぶ
+    """
+    sent = []
+
+    def checkonly(request):
+        entries = request_json(request)['feed']['entry']
+        sent.append([e['shipment']['consignee_name'] for e in entries])
+        entries[-1]['error'] = [{'error_property_name': 'consignee_address3', 'error_code': 'X', 'error_description': ''}]
+        return 200, {'feed': {'entry': entries}}
+
+    stub = B2Stub().route('POST', '/b2/p/new', checkonly)
+    shipments = [valid_shipment(consignee_name='A'), valid_shipment(consignee_zip_code='1'), valid_shipment(consignee_name='C')]
+    for value in (shipments, ShipmentBatch(shipments)):
+        results = check_shipments(stub_session(stub), value)
+        assert [r['success'] for r in results] == [True, False, False]
+        assert codes(results[1]) == [('consignee_zip_code', 'FORMAT')]
+        assert codes(results[2]) == [('consignee_address3', 'X')]
+    assert sent == [['A', 'C'], ['A', 'C']]
+
+    # 全て不備がある場合は送らない
+    check_shipments(stub_session(stub), [valid_shipment(consignee_name='')])
+    assert len(sent) == 2